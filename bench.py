@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import argparse
+
+from videoanalysis import bench
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis loop on synthetic videos.")
+    parser.add_argument("--resolutions", nargs="+", default=None,
+            help="frame sizes like 1280x720, defaults to 640x360 1280x720 1920x1080")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--real-pose", action="store_true",
+            help="run the MediaPipe model instead of replaying canned landmarks")
+    parser.add_argument("--display", action="store_true",
+            help="also time showing the frames in a window")
+    parser.add_argument("--output", default="bench.json",
+            help="file to write the results to")
+    parser.add_argument("--compare", metavar="OLD",
+            help="compare the results with an earlier result file")
+    parser.add_argument("--check-allocations", action="store_true",
+            help="only check that drawing a frame allocates next to nothing, fails otherwise")
+    args = parser.parse_args()
+
+    if args.check_allocations:
+        result = bench.check_allocations()
+        print(f"{result['peak_per_frame']} bytes at most per frame, "
+              f"{result['retained_per_frame']:.1f} bytes per frame kept")
+    else:
+        resolutions = bench.default_resolutions
+        if args.resolutions:
+            resolutions = [tuple(int(v) for v in r.split("x")) for r in args.resolutions]
+        bench.run_all(resolutions, frames=args.frames, real_pose=args.real_pose,
+                display=args.display, output=args.output)
+        if args.compare:
+            bench.compare(args.compare, args.output)
@@ -2,11 +2,215 @@
 
 import argparse
 
-from videoanalysis import analyze
+from videoanalysis.backends import backend_names, create_backend
+from videoanalysis.cache import LandmarkCache, default_directory
+from videoanalysis.landmarks import filters
+from videoanalysis.presence import detectors, load_or_scan
+from videoanalysis.writer import backends
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze a video.")
-    parser.add_argument("file")
-    parser.add_argument("--filters")
+    parser.add_argument("file", nargs="?",
+            help="video file, 'live' or 'webcam', or with --batch a directory or glob pattern")
+    parser.add_argument("--filters", nargs="+", default=[],
+            help="names of the filters to apply")
+    parser.add_argument("--pipelined", action="store_true",
+            help="run capture, inference, rendering and encoding on separate threads")
+    parser.add_argument("--buffer-budget", type=int,
+            help="maximum number of bytes the delay buffer may use")
+    parser.add_argument("--cache", action="store_true",
+            help="reuse the landmarks of earlier runs on the same video")
+    parser.add_argument("--cache-dir", default=default_directory)
+    parser.add_argument("--cache-size", type=int, default=2 * 1024**3,
+            help="maximum number of bytes the landmark cache may use")
+    parser.add_argument("--inference-size", type=int,
+            help="downscale the image passed to the pose model to at most this many pixels")
+    parser.add_argument("--roi", action="store_true",
+            help="run the pose model only on a crop around the athlete")
+    parser.add_argument("--infer-every", type=int, default=1,
+            help="run the pose model only on every n-th frame and predict the landmarks in between")
+    parser.add_argument("--target-fps", type=float,
+            help="run the pose model as often as this frame rate allows and predict the landmarks in between")
+    parser.add_argument("--presence", action="store_true",
+            help="pre-scan the video for stretches with a person and run the pose model only there")
+    parser.add_argument("--presence-detector", choices=detectors, default="motion",
+            help="how the pre-scan finds a person, 'motion' is faster than 'pose'")
+    parser.add_argument("--outside", choices=("skip", "copy"), default="skip",
+            help="leave out the frames without a person or copy them unchanged to keep the timing")
+    parser.add_argument("--preview-width", type=int, default=1280,
+            help="downscale the window to at most this width, 0 shows the full resolution; "
+                 "the analyzed video always keeps it")
+    parser.add_argument("--preview-fps", type=float, default=30,
+            help="refresh rate of the window, 0 shows every frame; the analysis never waits for it")
+    parser.add_argument("--writer", choices=backends, default="opencv",
+            help="how to encode the analyzed video, 'none' writes no video")
+    parser.add_argument("--codec",
+            help="fourcc for opencv or encoder name for ffmpeg, defaults to MJPG and libx264")
+    parser.add_argument("--container",
+            help="file extension of the analyzed video, e.g. .mkv")
+    parser.add_argument("--encoder-threads", type=int, default=0,
+            help="number of ffmpeg encoder threads, 0 lets ffmpeg decide")
+    parser.add_argument("--sync-writer", action="store_true",
+            help="encode on the analysis thread instead of a background thread")
+    parser.add_argument("--batch", action="store_true",
+            help="analyze all matching videos headless with a pool of processes")
+    parser.add_argument("--workers", type=int,
+            help="number of worker processes, inference threads with --stream or drawing threads with --render, "
+                 "defaults to the number of cores")
+    parser.add_argument("--output", default="analyzed",
+            help="directory for the analyzed videos in batch, segment, stream and render mode")
+    parser.add_argument("--render", action="store_true",
+            help="draw the filters from recorded landmarks (--model or the cache) headless, without pose inference")
+    parser.add_argument("--keep-empty", action="store_true",
+            help="with --render, also write the frames without a pose")
+    parser.add_argument("--segments", type=int,
+            help="split the video into this many segments and analyze them in parallel")
+    parser.add_argument("--stream", nargs="+", action="append", metavar="SOURCE [FILTER ...]",
+            help="analyze this video, 'live' or camera number together with the others, "
+                 "with its own filters; repeat for every source")
+    parser.add_argument("--no-preview", action="store_true",
+            help="do not show the tiled preview of --stream")
+    parser.add_argument("--warmup", type=int, default=30,
+            help="frames used to settle the pose tracking before each segment")
+    parser.add_argument("--export", metavar="FILE",
+            help="write the angles, distances and midpoints of the filters as CSV or Parquet instead of a video")
+    parser.add_argument("--serve", type=int, metavar="PORT",
+            help="stream the analyzed frames as MJPEG and WebSocket on http://HOST:PORT/")
+    parser.add_argument("--serve-host", default="127.0.0.1",
+            help="address of the stream server, 0.0.0.0 lets other devices in the network connect")
+    parser.add_argument("--serve-width", type=int,
+            help="downscale the streamed frames to at most this width")
+    parser.add_argument("--timeshift", action="store_true",
+            help="store the frames on disk to scrub back (a/d), pause (space), "
+                 "slow down (s), loop (l) and return to live (g) while the analysis goes on")
+    parser.add_argument("--timeshift-dir",
+            help="directory of the time-shift store, by default a temporary one")
+    parser.add_argument("--timeshift-segments", type=int, default=120,
+            help="number of 300 frame segments the time-shift store keeps")
+    parser.add_argument("--rules", metavar="FILE",
+            help="JSON file with rules that count repetitions, time holds and raise alerts")
+    parser.add_argument("--events", metavar="FILE",
+            help="write the events of --rules to this file, one JSON object per line")
+    parser.add_argument("--offline", action="store_true",
+            help="with --rules, evaluate the rules on the landmarks of the whole video "
+                 "(from the cache if possible) without showing or writing a video")
+    parser.add_argument("--metrics", action="store_true",
+            help="time every stage and print a summary at the end")
+    parser.add_argument("--metrics-overlay", action="store_true",
+            help="draw the fps and stage latencies onto the frames")
+    parser.add_argument("--metrics-file", metavar="FILE",
+            help="write the metrics as JSON to this file every few seconds")
+    parser.add_argument("--metrics-interval", type=float, default=5.0,
+            help="seconds between two writes of --metrics-file")
+    parser.add_argument("--metrics-port", type=int,
+            help="serve the metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--backend", choices=backend_names, default="mediapipe",
+            help="how to estimate the pose, 'replay' reads recorded landmarks")
+    parser.add_argument("--model",
+            help="ONNX model for the onnx backend, recorded landmarks for the replay backend")
+    parser.add_argument("--batch-size", type=int, default=8,
+            help="frames per call of the onnx backend in batch and export mode")
+    parser.add_argument("--list-filters", action="store_true",
+            help="print the names of the filters and exit")
     args = parser.parse_args()
-    analyze.analyze(args.file, args.filters)
+    if args.list_filters:
+        print("\n".join(filters))
+        parser.exit()
+    if args.file is None and not args.stream:
+        parser.error("the following arguments are required: file")
+    if args.render and args.model is None and not args.cache:
+        parser.error("--render needs the landmarks from --model or --cache")
+    if (args.offline or args.events) and args.rules is None:
+        parser.error("--offline and --events need --rules")
+    if args.backend != "mediapipe" and args.model is None:
+        parser.error(f"--backend {args.backend} needs --model")
+
+    # Only imported now, so --list-filters returns without loading the
+    # analysis modules.
+    from videoanalysis import analytics, analyze, batch, multistream, render, segments
+    from videoanalysis.instrumentation import Metrics
+    from videoanalysis.rules import RuleEngine, evaluate_video, load_rules, write_events
+    from videoanalysis.streaming import StreamServer
+    from videoanalysis.timeshift import TimeShiftStore
+
+    cache = LandmarkCache(args.cache_dir, args.cache_size) if args.cache else None
+    writer_options = {
+        'backend': args.writer,
+        'codec': args.codec,
+        'container': args.container,
+        'threads': args.encoder_threads,
+        'background': not args.sync_writer,
+    }
+    backend_options = {'name': args.backend}
+    if args.backend == 'replay':
+        backend_options['path'] = args.model
+    elif args.backend == 'onnx':
+        backend_options.update(model=args.model, batch_size=args.batch_size)
+    metrics = None
+    if (args.metrics or args.metrics_overlay or args.metrics_file
+            or args.metrics_port is not None):
+        metrics = Metrics(overlay=args.metrics_overlay, dump_path=args.metrics_file,
+                interval=args.metrics_interval, port=args.metrics_port)
+    engine = None
+    if args.rules and args.offline:
+        engine = evaluate_video(args.file, load_rules(args.rules), cache=cache,
+                backend=create_backend(**backend_options))
+    elif args.stream:
+        multistream.analyze_streams([(s[0], s[1:]) for s in args.stream],
+                workers=args.workers, directory=args.output, cache=cache,
+                writer_options=writer_options, backend_options=backend_options,
+                preview=not args.no_preview)
+    elif args.export:
+        analytics.export_metrics(args.file, args.filters, args.export, cache=cache,
+                backend=create_backend(**backend_options))
+    elif args.render:
+        render.render(args.file, args.filters,
+                render.load_track(args.file, args.model, cache),
+                directory=args.output, workers=args.workers,
+                keep_empty=args.keep_empty, writer_options=writer_options)
+    elif args.batch:
+        batch.analyze_batch(args.file, args.filters, workers=args.workers,
+                directory=args.output, cache=cache, writer_options=writer_options,
+                backend_options=backend_options)
+    elif args.segments:
+        segments.analyze_segments(args.file, args.filters, workers=args.workers,
+                segments=args.segments, warmup=args.warmup, directory=args.output,
+                writer_options=writer_options, backend_options=backend_options)
+    else:
+        presence = None
+        if args.presence:
+            presence = load_or_scan(args.file, detector=args.presence_detector)
+            print(f"{presence.frames()} of {presence.frame_count} frames "
+                  f"in {len(presence)} segments with a person")
+        stream = None
+        if args.serve is not None:
+            stream = StreamServer(args.serve_host, args.serve,
+                    width=args.serve_width).start()
+            print(f"Streaming on {stream.url}")
+        if args.rules:
+            engine = RuleEngine(load_rules(args.rules))
+        timeshift = None
+        if args.timeshift:
+            timeshift = TimeShiftStore(args.timeshift_dir,
+                    max_segments=args.timeshift_segments)
+        analyze.analyze(args.file, args.filters, pipelined=args.pipelined,
+                buffer_budget=args.buffer_budget, cache=cache,
+                inference_size=args.inference_size, roi=args.roi,
+                infer_every=args.infer_every, target_fps=args.target_fps,
+                writer_options=writer_options, metrics=metrics,
+                backend=create_backend(**backend_options), presence=presence,
+                outside=args.outside, stream=stream, timeshift=timeshift,
+                rules=engine, preview_options={'width': args.preview_width,
+                'fps': args.preview_fps})
+        if timeshift is not None:
+            timeshift.close()
+        if stream is not None:
+            stream.close()
+        if metrics is not None:
+            metrics.close()
+            if args.metrics:
+                metrics.print_summary()
+    if engine is not None:
+        engine.print_summary()
+        if args.events:
+            write_events(engine.events, args.events)
@@ -0,0 +1,126 @@
+"""
+Export the values the filters measure (angles, distances, midpoints) as time
+series.
+
+The world landmarks of all frames are stacked into one (frames, 33, 4) array
+and every metric is calculated for the whole video in one vectorized pass.
+With a landmark cache the stacked array is read straight from disk, without
+any pose inference.
+"""
+import csv
+
+import cv2
+import numpy as np
+
+from .analyze import open_cache, estimate_batch
+from .backends import create_backend
+from .frames import NUM_LANDMARKS
+from .plan import compile_plan
+from .landmarks import filters
+
+
+def load_landmarks(path, cache=None, backend=None):
+    """
+    Return the world landmarks of every frame of a video as a
+    (frames, 33, 4) array, a (frames,) bool array that tells whether a pose
+    was found and the frame rate of the video.
+
+    The landmarks are read from the cache if possible. Otherwise the pose
+    `backend` (MediaPipe by default) is run on every frame, and the result
+    is added to the cache.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    own_backend = backend is None
+    backend = backend or create_backend()
+    reader, writer = open_cache(cache, path, backend=backend)
+    if reader is not None:
+        cap.release()
+        return reader.world, np.asarray(reader.status, bool), fps
+
+    world = []
+    try:
+        while True:
+            batch = []
+            while len(batch) < backend.batch_size:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                batch.append(frame)
+            if not batch:
+                break
+            lfs = estimate_batch(backend, batch, len(world), None, writer)
+            world.extend(None if lf is None else lf.world for lf in lfs)
+    finally:
+        cap.release()
+        if own_backend:
+            backend.close()
+    if writer is not None:
+        writer.commit()
+
+    status = np.array([w is not None for w in world], bool)
+    stacked = np.zeros((len(world), NUM_LANDMARKS, 4), np.float32)
+    if status.any():
+        stacked[status] = np.stack([w for w in world if w is not None])
+    return stacked, status, fps
+
+
+def compute_metrics(world, status, selected_filters, fps=0.0, registry=filters):
+    """
+    Calculate the metrics of the selected filters for every frame.
+
+    Returns a dict of (frames,) arrays: 'frame', 'time' and 'pose', and one
+    column per metric named '<filter>.<metric>'. Metrics of frames without a
+    pose are NaN.
+    """
+    plan = compile_plan(selected_filters, registry)
+    world = np.asarray(world, np.float32)
+    frames = len(world)
+
+    columns = {
+        'frame': np.arange(frames),
+        'time': np.arange(frames) / fps if fps > 0 else np.full(frames, np.nan),
+        'pose': status.astype(np.int8),
+    }
+    # Frames without a pose are all zeros, which gives NaN angles.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name in plan.names:
+            for filt in registry[name]:
+                for metric, values in filt.metrics(world).items():
+                    values = np.where(status, values, np.nan)
+                    columns[f'{name}.{metric}'] = values
+    return columns
+
+
+def write_metrics(columns, path):
+    """
+    Write the metrics to a CSV file, or to a Parquet file if `path` ends in
+    '.parquet' (requires pandas with pyarrow).
+    """
+    if str(path).endswith('.parquet'):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("Writing Parquet files requires pandas and pyarrow")
+        pd.DataFrame(columns).to_parquet(path, index=False)
+        return
+
+    names = list(columns)
+    table = np.column_stack([np.asarray(columns[name], np.float64) for name in names])
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerow(names)
+        np.savetxt(f, table, delimiter=',', fmt='%.10g')
+
+
+def export_metrics(url, selected_filters, path, cache=None, backend=None):
+    """
+    Calculate the metrics of the selected filters for every frame of the
+    video at `url` and write them to `path`.
+    """
+    world, status, fps = load_landmarks(url, cache, backend)
+    columns = compute_metrics(world, status, selected_filters, fps)
+    write_metrics(columns, path)
+    return columns
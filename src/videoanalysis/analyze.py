@@ -1,23 +1,27 @@
 import cv2
-import mediapipe as mp
 
 import os
+import threading
+import time
 from pathlib import Path
 
+from .backends import create_backend, pose_settings
+from .buffer import FrameRingBuffer
+from .display import Preview
+from .instrumentation import disabled
 from .landmarks import filters
+from .plan import compile_plan
+from .roi import RoiTracker
+from .smoothing import AdaptiveRate
+from .timeshift import TimeShiftPlayer
+from .writer import BackgroundWriter, open_video_writer
 
-mp_pose = mp.solutions.pose
 
-class Globals:
-    buffer = []
-    def __init__(self, buffer_size=0):
-        self.buffer_size = buffer_size
-
-
-g = Globals(buffer_size=1)
-
-
-def analyze(url: str, selected_filters: list, **kwargs):
+def analyze(url: str, selected_filters: list, pipelined=False,
+            buffer_budget=None, cache=None, inference_size=None, roi=False,
+            infer_every=1, target_fps=None, writer_options={}, metrics=None,
+            backend=None, presence=None, outside='skip', stream=None,
+            timeshift=None, rules=None, preview_options={}, **kwargs):
     """
     Analyze a given video or directly from the webcam.
 
@@ -26,7 +30,432 @@ def analyze(url: str, selected_filters: list, **kwargs):
 
     :selected_filters: This is a list of predifened filter that you want to
     apply to the video. If the filter you are looking for does not exist,
-    simple create a new one.
+    simple create a new one. A single filter can also be given as string.
+
+    :pipelined: Run capture, inference, rendering and encoding on separate
+    threads. See `videoanalysis.pipeline`.
+
+    :buffer_budget: Maximum number of bytes the delay buffer may use.
+
+    :cache: A `videoanalysis.cache.LandmarkCache`. If the landmarks of the
+    video are cached, no pose inference is done. Otherwise they are added to
+    the cache once the whole video was analyzed.
+
+    :inference_size: Downscale the image passed to the pose model to at most
+    this width and height.
+
+    :roi: Only pass a crop around the landmarks of the previous frame to the
+    pose model. See `videoanalysis.roi.RoiTracker`.
+
+    :infer_every: Only run the pose model on every n-th frame and predict the
+    landmarks in between. See `videoanalysis.smoothing.AdaptiveRate`.
+
+    :target_fps: Run the pose model as often as possible while keeping up
+    with this frame rate, and predict the landmarks in between.
+
+    :writer_options: Arguments for `open_writer`, e.g. the codec, or
+    `backend='none'` to write no video.
+
+    :metrics: A `videoanalysis.instrumentation.Metrics` that records the
+    latency of every stage, the dropped frames and the delay buffer.
+
+    :backend: The pose backend, see `videoanalysis.backends`. Defaults to
+    MediaPipe Pose.
+
+    :presence: Only run the pose model on the frames with a person in them.
+    Either a `videoanalysis.presence.PresenceIndex` or True to use the index
+    stored next to the video, which is created first if needed.
+
+    :outside: What happens to the frames without a person: 'skip' leaves
+    them out of the analyzed video, 'copy' writes them unchanged so the
+    analyzed video keeps the timing of the original.
+
+    :stream: A started `videoanalysis.streaming.StreamServer` the analyzed
+    frames are published to.
+
+    :timeshift: A `videoanalysis.timeshift.TimeShiftStore`. Every analyzed
+    frame is stored, and the window can show earlier frames while the
+    analysis goes on, see `videoanalysis.timeshift.TimeShiftPlayer`.
+
+    :rules: A `videoanalysis.rules.RuleEngine` that is evaluated on every
+    frame. Repetition counts, holds and alerts are drawn onto the frames.
+
+    :preview_options: Arguments for `videoanalysis.display.Preview`, the
+    width and refresh rate of the window. The analysis does not wait for
+    the window, and the analyzed video keeps the full resolution.
+    """
+    tracker_options = {'inference_size': inference_size, 'roi': roi,
+                       'infer_every': infer_every, 'target_fps': target_fps}
+    session = AnalysisSession(url, selected_filters, buffer_budget=buffer_budget,
+                              cache=cache, tracker_options=tracker_options,
+                              writer_options=writer_options, metrics=metrics,
+                              backend=backend, presence=presence,
+                              outside=outside, stream=stream,
+                              timeshift=timeshift, rules=rules,
+                              preview_options=preview_options, **kwargs)
+    if pipelined:
+        from .pipeline import analyze_pipelined
+        return analyze_pipelined(session)
+    return session.run()
+
+
+class AnalysisSession():
+    """
+    The state of one analysis: the capture, the pose backend, the delay
+    buffer, the writer and the key handling. Sessions share nothing, so
+    several of them can run at the same time in threads or processes. The
+    memory of a session is bounded by the budget of its delay buffer.
+
+    :buffer_size: Initial delay in frames, changed with the keys 'k' and 'j'.
+
+    :buffer_budget: Maximum number of bytes the delay buffer may use.
+
+    :tracker_options: Arguments for `open_tracker`.
+
+    :writer_options: Arguments for `open_writer`.
+
+    :backend: The pose backend. If none is given, the session creates a
+    MediaPipe backend and closes it at the end.
+
+    :presence: A `videoanalysis.presence.PresenceIndex`. The pose model
+    only runs on the frames inside its segments. True uses the index stored
+    next to the video, which is created first if needed.
+
+    :outside: 'skip' or 'copy' the frames outside the segments. Skipped
+    frames are only grabbed and never enter the delay buffer.
+
+    :stream: A `videoanalysis.streaming.StreamServer` that gets every
+    analyzed frame.
+
+    :timeshift: A `videoanalysis.timeshift.TimeShiftStore` for the frames
+    and landmarks. The keys of `videoanalysis.timeshift.TimeShiftPlayer`
+    select the frame that is shown.
+
+    :rules: A `videoanalysis.rules.RuleEngine`. Video files are timed by
+    their frame rate, cameras by the clock.
+
+    :preview_options: Arguments for `videoanalysis.display.Preview`.
+
+    :window: Name of the window of the session.
+
+    The other arguments are the same as for `analyze`.
+    """
+    def __init__(self, url, selected_filters, buffer_size=1, buffer_budget=None,
+                 cache=None, tracker_options={}, writer_options={}, metrics=None,
+                 backend=None, presence=None, outside='skip', stream=None,
+                 timeshift=None, rules=None, preview_options={}, window='cam',
+                 **kwargs):
+        self.url = url
+        self.plan = compile_plan(selected_filters)
+        self.buffer_size = buffer_size
+        self.buffer = FrameRingBuffer(budget=buffer_budget or 256 * 1024 * 1024)
+        # The pipeline fills the buffer on its capture thread, while the keys
+        # are handled on the main thread.
+        self.buffer_lock = threading.Lock()
+        self.cache = cache
+        self.tracker_options = tracker_options
+        self.writer_options = writer_options
+        self.metrics = metrics or disabled
+        self.backend = backend
+        self.own_backend = backend is None
+        if presence is not None and url in ('live', 'webcam'):
+            raise ValueError("A presence index needs a video file")
+        if presence is True:
+            from .presence import load_or_scan
+            presence = load_or_scan(url)
+        if outside not in ('skip', 'copy'):
+            raise ValueError(f"Unknown mode {outside} for the frames outside, use skip or copy")
+        self.presence = presence
+        self.outside = outside
+        self.stream = stream
+        self.timeshift = timeshift
+        self.player = None if timeshift is None else TimeShiftPlayer(timeshift)
+        # The filters reuse their arrays, and in the pipeline the live frames
+        # are drawn on another thread than the replayed ones.
+        self.replay_plan = None if timeshift is None else compile_plan(selected_filters)
+        self.rules = rules
+        self.window = window
+        self.preview = Preview(window, **preview_options)
+        self.kwargs = kwargs
+
+        self.cap = None
+        self.out = None
+        self.tracker = None
+        self.reader = None
+        self.cache_writer = None
+        self.fps = 0.0
+        self.opened = None
+
+    def open(self):
+        """
+        Open the capture, the cache and the writer, and create the backend.
+        """
+        self.cap, filename = open_capture(self.url, **self.kwargs)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open {self.url}")
+        self.opened = time.perf_counter()
+        if self.url not in ('live', 'webcam'):
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.tracker = open_tracker(self.cap, self.url, **self.tracker_options)
+        if self.backend is None:
+            self.backend = create_backend()
+        self.reader, self.cache_writer = open_cache(self.cache, self.url,
+                                                    self.tracker, self.backend)
+        if self.presence is not None:
+            # The frames outside the segments get no landmarks, so the entry
+            # would be incomplete.
+            self.cache_writer = None
+        self.out, _ = open_writer(self.cap, self.plan.name, filename,
+                                  **self.writer_options)
+
+    def close(self):
+        if self.rules is not None:
+            self.rules.finish()
+        if self.cap is not None:
+            self.cap.release()
+        if self.out is not None:
+            self.out.release()
+        if self.own_backend and self.backend is not None:
+            self.backend.close()
+            self.backend = None
+        self.buffer.clear()
+
+    def run(self, display=True, progress=None, stop_event=None):
+        """
+        Analyze the source frame by frame until it ends or ESC is pressed.
+
+        :progress: Called with the index and the frame after every analyzed
+        frame, with the filters drawn if there was a pose.
+
+        :stop_event: A `threading.Event` or `multiprocessing.Event` that
+        cancels the analysis when set.
+        """
+        self.open()
+        if display:
+            self.preview.open()
+        metrics = self.metrics
+        clock = metrics.clock
+        index = -1
+        try:
+            while stop_event is None or not stop_event.is_set():
+                # The keys are read at the refresh rate of the preview, also
+                # while the delay buffer fills up and nothing is shown.
+                if display and self.preview.poll_due() and not self.poll_keys():
+                    break
+                t = clock()
+                ret, frame = self.read_frame(index + 1)
+                metrics.record('capture', t)
+                if not ret:
+                    if self.cache_writer is not None:
+                        self.cache_writer.commit()
+                    break
+                index += 1
+                if frame is None:
+                    metrics.count('absent')
+                    continue
+                t = clock()
+                item = self.prepare_frame(frame, index)
+                metrics.record('delay', t)
+                self.observe_buffer()
+                if item is None:
+                    continue
+                frame_index, frame = item
+
+                if self.present(frame_index):
+                    t = clock()
+                    lf = self.estimate_pose(frame, frame_index)
+                    metrics.record('inference', t)
+                    self.evaluate_rules(frame_index, lf)
+                    if lf is None:
+                        metrics.count('no_pose')
+                        if not self.copies_all():
+                            if progress is not None:
+                                progress(index, frame)
+                            continue
+                        self.record(frame, None)
+                    else:
+                        self.record(frame, lf)
+                        t = clock()
+                        self.plan.apply(lf, frame)
+                        self.draw_rules(frame)
+                        metrics.record('filters', t)
+                else:
+                    metrics.count('absent')
+                    self.evaluate_rules(frame_index, None)
+                    self.record(frame, None)
+                metrics.frame_done(frame)
+                if progress is not None:
+                    progress(index, frame)
+
+                # Only the newest frame is shown, once the refresh of the
+                # preview is due.
+                shown = None
+                if display:
+                    self.preview.offer(frame)
+                    shown = self.preview.take(0)
+                    if shown is not None:
+                        t = clock()
+                        self.preview.show(self.display_frame(shown))
+                        metrics.record('display', t)
+                if self.stream is not None:
+                    self.stream.publish(frame)
+                t = clock()
+                self.out.write(frame)
+                metrics.record('encode', t)
+                self.observe_writer()
+
+                if shown is not None and not self.poll_keys():
+                    break
+        finally:
+            self.close()
+            if display:
+                self.preview.close()
+
+    def read_frame(self, index):
+        """
+        Read the frame `index` of the capture. In skip mode, frames outside
+        the presence segments are only grabbed and returned as None.
+        """
+        if (self.presence is not None and self.outside == 'skip'
+                and index not in self.presence):
+            return self.cap.grab(), None
+        return self.cap.read()
+
+    def present(self, index):
+        return self.presence is None or index in self.presence
+
+    def copies_all(self):
+        """
+        Return whether every frame is written, also those without a pose,
+        so the analyzed video keeps the timing of the original.
+        """
+        return self.presence is not None and self.outside == 'copy'
+
+    def prepare_frame(self, frame, index):
+        """
+        Mirror live frames and pass the frame through the delay buffer.
+
+        Returns the index and the frame that leaves the delay buffer, or None
+        as long as the delay buffer is still filling up.
+        """
+        if self.url == "live":
+            frame = cv2.flip(frame, 1)
+
+        if not self.url == "webcam":
+            with self.buffer_lock:
+                # Without a delay the frames do not go through the encoded
+                # buffer, which would cost time and quality for nothing.
+                if self.buffer_size <= 1 and len(self.buffer) == 0:
+                    return index, frame
+                dropped = self.buffer.dropped
+                self.buffer.push(frame, index)
+                if self.buffer.dropped > dropped and len(self.buffer) < self.buffer_size:
+                    # The budget holds fewer frames than the delay, which
+                    # would never be reached.
+                    self.buffer_size = max(len(self.buffer), 1)
+                    self.metrics.gauge('delay_capped', self.buffer_size)
+                if len(self.buffer) < self.buffer_size:
+                    return None
+                return self.buffer.pop()
+        return index, frame
+
+    def estimate_pose(self, frame, index):
+        return estimate_pose(self.backend, frame, index, self.reader,
+                             self.cache_writer, self.tracker)
+
+    def record(self, frame, lf):
+        """
+        Store the frame in the time-shift store, before the filters are
+        drawn onto it.
+        """
+        if self.timeshift is not None:
+            t = self.metrics.clock()
+            self.timeshift.append(frame, lf)
+            self.metrics.record('timeshift', t)
+
+    def evaluate_rules(self, index, lf):
+        """
+        Evaluate the rules on the frame `index` and its `LandmarkFrame`, or
+        None without a pose.
+        """
+        if self.rules is None:
+            return
+        t = self.metrics.clock()
+        if self.fps > 0:
+            timestamp = index / self.fps
+        else:
+            timestamp = time.perf_counter() - self.opened
+        self.rules.update(timestamp, lf, index)
+        self.metrics.record('rules', t)
+
+    def draw_rules(self, frame, labels=None):
+        if self.rules is not None:
+            self.rules.draw(frame, labels)
+
+    def display_frame(self, frame):
+        """
+        Return the frame to show: the analyzed frame when live, otherwise the
+        stored frame the time-shift player is at, with the filters drawn.
+        """
+        index = None if self.player is None else self.player.current()
+        if index is None:
+            return frame
+        try:
+            replay, lf, timestamp = self.timeshift.read(index)
+        except IndexError:
+            return frame
+        if lf is not None:
+            self.replay_plan.apply(lf, replay)
+        scale = max(0.5, replay.shape[0] / 1080)
+        cv2.putText(replay, self.player.label(timestamp),
+                    (int(10 * scale), replay.shape[0] - int(20 * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 255), int(2 * scale) + 1)
+        return replay
+
+    def observe_buffer(self):
+        self.metrics.gauge('delay_frames', len(self.buffer))
+        self.metrics.gauge('delay_bytes', self.buffer.nbytes)
+        self.metrics.gauge('delay_dropped', self.buffer.dropped)
+
+    def poll_keys(self):
+        """
+        Poll the window and handle the pressed key. Returns False once ESC
+        was pressed.
+        """
+        key_code = self.preview.poll()
+        if key_code == 27:
+            return False
+        elif key_code != 255:
+            self.handle_keys(key_code)
+        return True
+
+    def observe_writer(self):
+        """
+        Report how much the background writer held back the analysis.
+        """
+        if isinstance(self.out, BackgroundWriter):
+            stats = self.out.stats()
+            self.metrics.gauge('writer_blocked', stats['blocked'])
+            self.metrics.gauge('writer_blocked_seconds', round(stats['blocked_time'], 3))
+            self.metrics.gauge('writer_max_queue', stats['max_depth'])
+
+    def handle_keys(self, key_code):
+        if self.player is not None and self.player.handle_keys(key_code & 0xFF):
+            return
+        if key_code == ord('k'):
+            self.buffer_size = min(self.buffer_size + 15, 30 * 10)
+        elif key_code == ord('j'):
+            self.buffer_size = max(self.buffer_size - 15, 1)
+            with self.buffer_lock:
+                # Between two frames the buffer holds one frame less than the
+                # delay.
+                self.buffer.trim(self.buffer_size - 1)
+
+
+def open_capture(url, **kwargs):
+    """
+    Open the video source for the given url and return the capture together
+    with the filename the analyzed video should be stored under.
     """
     if url == "live":
         cap = cv2.VideoCapture(0)
@@ -37,58 +466,110 @@ def analyze(url: str, selected_filters: list, **kwargs):
     else:
         cap = cv2.VideoCapture(url)
         filename = os.path.basename(url)
-    pose = mp_pose.Pose()
+    return cap, filename
+
+
+def open_writer(cap, plan_name, filename, directory='analyzed', container=None,
+                **options):
+    """
+    Create the writer for the analyzed video in the given directory.
+
+    :container: File extension of the video, e.g. '.mkv'. By default the
+    extension of the input is kept.
+
+    The other options are passed to `videoanalysis.writer.open_video_writer`.
 
-    cv2.namedWindow('cam', cv2.WINDOW_NORMAL)
+    Returns the writer and the frame size of the capture.
+    """
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = int(cap.get(cv2.CAP_PROP_FPS))
 
-    if not Path('analyzed').is_dir():
-        Path('analyzed').mkdir()
-    out = cv2.VideoWriter(os.path.join("analyzed", f'analyzed_{selected_filters}_{filename}'), cv2.VideoWriter_fourcc('M','J','P','G'), fps, (frame_width,frame_height))
+    if options.get('backend') != 'none' and not Path(directory).is_dir():
+        Path(directory).mkdir(parents=True)
+    out = open_video_writer(output_path(plan_name, filename, directory, container), fps, (frame_width,frame_height), **options)
+    return out, (frame_width, frame_height)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if url == "live":
-            frame = cv2.flip(frame, 1)
 
-        if not url == "webcam":
-            g.buffer.append(frame)
-            if len(g.buffer) < g.buffer_size:
-                continue
-            frame = g.buffer.pop(0)
-
-        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        res = pose.process(img)
-        if res.pose_landmarks == None:
-            continue
-
-        # Draw landmarks accoring to the callback function provided.
-        for filter_name, filt in filters.items():
-            if filter_name in selected_filters:
-                for f in filt:
-                    f.apply(res, frame, frame_width, frame_height)
-
-        cv2.imshow('cam', frame)
-        out.write(frame)
-
-        key_code = cv2.waitKey(1);
-        if key_code & 0xFF == 27:
-            break
-        elif key_code & 0xFF != 255:
-            handle_keys(key_code)
-    cap.release()
-    out.release()
-    cv2.destroyAllWindows()
-
-
-def handle_keys(key_code):
-    if key_code == ord('k'):
-        g.buffer_size = min(g.buffer_size + 15, 30 * 10)
-    elif key_code == ord('j'):
-        g.buffer_size = max(g.buffer_size - 15, 1)
-        while len(g.buffer) > g.buffer_size + 1:
-            g.buffer.pop(0)
+def output_path(plan_name, filename, directory='analyzed', container=None):
+    """
+    Return the path `open_writer` writes the analyzed video to.
+    """
+    if container is not None:
+        filename = os.path.splitext(filename)[0] + container
+    return os.path.join(directory, f'analyzed_{plan_name}_{filename}')
+
+
+def open_tracker(cap, url, inference_size=None, roi=False, infer_every=1,
+                 target_fps=None):
+    """
+    Return the object that runs the pose model if it should not simply see
+    every full frame, else None.
+    """
+    tracker = None
+    if inference_size is not None or roi:
+        tracker = RoiTracker(inference_size=inference_size, roi=roi)
+    if infer_every > 1 or target_fps is not None:
+        # Frames of a file are timed by their number, live frames by the clock.
+        fps = None if url in ("live", "webcam") else cap.get(cv2.CAP_PROP_FPS)
+        tracker = AdaptiveRate(tracker, every=infer_every,
+                               target_fps=target_fps, fps=fps)
+    return tracker
+
+
+def open_cache(cache, url, tracker=None, backend=None):
+    """
+    Look up the landmarks of the video in the cache. The key depends on the
+    settings of the `tracker` and the pose `backend`.
+
+    Returns a reader if the landmarks are cached, else a writer to store
+    them. Both are None for live input or if no cache is given.
+    """
+    if cache is None or url in ("live", "webcam"):
+        return None, None
+    settings = backend.settings() if backend is not None else dict(pose_settings)
+    if tracker is not None:
+        settings.update(tracker.settings())
+    key = cache.key(url, settings)
+    reader = cache.get(key)
+    if reader is not None:
+        return reader, None
+    return None, cache.writer(key)
+
+
+def estimate_pose(backend, frame, index, reader=None, writer=None, tracker=None):
+    """
+    Return the landmarks of the frame as a `LandmarkFrame`, either from the
+    cache `reader` or from the pose `backend`, through the `tracker` if one
+    is given. Fresh results are handed to the cache `writer`.
+
+    Returns None if there is no pose in the frame.
+    """
+    frame_height, frame_width = frame.shape[:2]
+    if reader is not None:
+        return reader.frame(index, frame_width, frame_height)
+    if tracker is not None:
+        lf = tracker.process(backend, frame, index)
+    else:
+        lf = backend.process(frame, index)
+    if writer is not None:
+        writer.append(index, lf)
+    return lf
+
+
+def estimate_batch(backend, frames, first_index, reader=None, writer=None):
+    """
+    Like `estimate_pose` for consecutive frames starting at `first_index`,
+    but the backend gets all of them in one call.
+
+    Returns a list with a `LandmarkFrame` or None for every frame.
+    """
+    indices = list(range(first_index, first_index + len(frames)))
+    if reader is not None:
+        return [reader.frame(index, frame.shape[1], frame.shape[0])
+                for index, frame in zip(indices, frames)]
+    lfs = backend.process_batch(frames, indices)
+    if writer is not None:
+        for index, lf in zip(indices, lfs):
+            writer.append(index, lf)
+    return lfs
@@ -0,0 +1,333 @@
+"""
+Pose inference backends.
+
+All backends return the landmarks as a `videoanalysis.frames.LandmarkFrame`,
+the structure the filters draw from, and have the same methods:
+
+- `process(frame, index=None)`: landmarks of a BGR frame, or None if there is
+  no pose. `index` is the number of the frame in the video.
+- `process_batch(frames, indices=None)`: the same for a list of frames.
+  Backends that run several frames in one call have a `batch_size` above 1.
+- `settings()`: the settings that change the landmarks, for the cache key.
+- `close()`
+
+The implementations are:
+
+- `MediaPipeBackend`: MediaPipe Pose, one frame after the other, with the
+  tracking between frames.
+- `ReplayBackend`: landmarks recorded earlier, e.g. in the landmark cache.
+  Needs no model and gives the same landmarks on every run.
+- `OnnxBackend`: a BlazePose landmark model run with ONNX Runtime on batches
+  of frames, for offline analysis.
+
+Models are only loaded when the first frame is processed, so creating a
+backend is cheap.
+"""
+from abc import abstractmethod
+import os
+import threading
+
+from .frames import LandmarkFrame, NUM_LANDMARKS
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+backend_names = ('mediapipe', 'replay', 'onnx')
+
+# Arguments for `mp.solutions.pose.Pose`. They are part of the landmark cache
+# key.
+pose_settings = {}
+
+# The model loaded by `preload_pose` and the settings it was loaded with.
+_preloaded = None
+# Several analyses can create their models at the same time, but only one of
+# them may take the preloaded model.
+_preload_lock = threading.Lock()
+
+
+class Backend():
+    batch_size = 1
+
+    @abstractmethod
+    def process(self, frame, index=None):
+        pass
+
+    def process_batch(self, frames, indices=None):
+        if indices is None:
+            indices = [None] * len(frames)
+        return [self.process(frame, index) for frame, index in zip(frames, indices)]
+
+    def settings(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class MediaPipeBackend(Backend):
+    """
+    :settings: Arguments for `mp.solutions.pose.Pose`, by default
+    `pose_settings`.
+    """
+    def __init__(self, **settings):
+        self.options = settings or None
+        self.pose = None
+        # The RGB copy of the frame is converted into the same array every
+        # time, `Pose.process` copies it.
+        self.rgb = None
+
+    def settings(self):
+        # Without options the key is the same as before there were backends,
+        # so existing cache entries stay valid.
+        return dict(pose_settings if self.options is None else self.options)
+
+    def process(self, frame, index=None):
+        if self.pose is None:
+            self.pose = create_pose(**(self.options or {}))
+        frame_height, frame_width = frame.shape[:2]
+        if self.rgb is None or self.rgb.shape != frame.shape:
+            self.rgb = np.empty(frame.shape, np.uint8)
+        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        return LandmarkFrame.from_result(self.pose.process(img), frame_width, frame_height)
+
+    def close(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
+        self.rgb = None
+
+
+class ReplayBackend(Backend):
+    """
+    Returns recorded landmarks instead of running a model.
+
+    :landmarks: (frames, 33, 4) normalized landmarks.
+
+    :world: (frames, 33, 4) world landmarks.
+
+    :status: (frames,) bool array, False where there was no pose.
+
+    Frames are looked up by their index. Without an index the frames are
+    returned in order.
+    """
+    def __init__(self, landmarks, world, status, source=None):
+        self.landmarks = landmarks
+        self.world = world
+        self.status = status
+        self.source = source
+        self.index = 0
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the landmarks from a directory with `landmarks.npy`, `world.npy`
+        and `status.npy`, like an entry of the landmark cache, or from a file
+        written by `save`.
+        """
+        if os.path.isdir(path):
+            arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                      for name in ('landmarks', 'world', 'status')]
+        else:
+            with np.load(path) as data:
+                arrays = [data[name] for name in ('landmarks', 'world', 'status')]
+        return cls(*arrays, source=os.path.abspath(path))
+
+    @classmethod
+    def from_cache(cls, reader):
+        return cls(reader.landmarks, reader.world, reader.status)
+
+    def save(self, path):
+        np.savez(path, landmarks=self.landmarks, world=self.world,
+                 status=np.asarray(self.status, bool))
+
+    def settings(self):
+        return {'backend': 'replay', 'source': self.source}
+
+    def seek(self, index):
+        self.index = index
+
+    def process(self, frame, index=None):
+        if index is None:
+            index = self.index
+        self.index = index + 1
+        if index >= len(self.status) or not self.status[index]:
+            return None
+        frame_height, frame_width = frame.shape[:2]
+        return LandmarkFrame(np.asarray(self.landmarks[index]),
+                             np.asarray(self.world[index]),
+                             frame_width, frame_height)
+
+
+class OnnxBackend(Backend):
+    """
+    Runs a BlazePose landmark model (the second stage of MediaPipe Pose,
+    converted to ONNX) on batches of frames with ONNX Runtime.
+
+    There is no person detector and no tracking. Every frame is letterboxed
+    into the square model input as a whole, which works for videos with a
+    single athlete that fills a good part of the frame.
+
+    :model: Path of the .onnx file.
+
+    :batch_size: Number of frames per call. Models exported with a fixed
+    batch dimension of 1 are called once per frame.
+
+    :threads: Number of threads of ONNX Runtime, 0 lets it decide.
+
+    :threshold: Minimum pose presence score.
+
+    :outputs: Names of the landmark, presence and world landmark outputs.
+    """
+    def __init__(self, model, batch_size=8, threads=0, threshold=0.5,
+                 outputs=('Identity', 'Identity_1', 'Identity_4')):
+        self.model = model
+        self.batch_size = batch_size
+        self.threads = threads
+        self.threshold = threshold
+        self.outputs = outputs
+        self.session = None
+
+    def settings(self):
+        return {'backend': 'onnx', 'model': os.path.basename(self.model),
+                'model_size': os.path.getsize(self.model),
+                'threshold': self.threshold}
+
+    def process(self, frame, index=None):
+        return self.process_batch([frame])[0]
+
+    def process_batch(self, frames, indices=None):
+        if self.session is None:
+            self._load()
+        if not frames:
+            return []
+        inputs = np.stack([self._letterbox(frame) for frame in frames])
+
+        chunk = len(frames) if self.dynamic_batch else 1
+        results = []
+        for i in range(0, len(frames), chunk):
+            landmarks, presence, world = self.session.run(
+                list(self.outputs), {self.input_name: inputs[i:i + chunk]})
+            for j in range(len(landmarks)):
+                results.append(self._decode(frames[i + j], landmarks[j],
+                                            presence[j], world[j]))
+        return results
+
+    def close(self):
+        self.session = None
+
+    def _load(self):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime, "
+                              "install it with 'pip install onnxruntime'")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        self.session = onnxruntime.InferenceSession(
+            self.model, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_size = model_input.shape[1]
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+
+    def _letterbox(self, frame):
+        frame_height, frame_width = frame.shape[:2]
+        side = max(frame_width, frame_height)
+        pad_x = (side - frame_width) // 2
+        pad_y = (side - frame_height) // 2
+        square = cv2.copyMakeBorder(frame, pad_y, side - frame_height - pad_y,
+                                    pad_x, side - frame_width - pad_x,
+                                    cv2.BORDER_CONSTANT)
+        img = cv2.resize(square, (self.input_size, self.input_size),
+                         interpolation=cv2.INTER_AREA)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return img.astype(np.float32) / 255
+
+    def _decode(self, frame, landmarks, presence, world):
+        if float(np.ravel(presence)[0]) < self.threshold:
+            return None
+        frame_height, frame_width = frame.shape[:2]
+        side = max(frame_width, frame_height)
+        pad_x = (side - frame_width) // 2
+        pad_y = (side - frame_height) // 2
+
+        # x, y, z, visibility and presence of 39 landmarks in pixels of the
+        # model input, the first 33 are the landmarks of MediaPipe Pose.
+        points = landmarks.reshape(-1, 5)[:NUM_LANDMARKS]
+        scale = side / self.input_size
+        normalized = np.empty((NUM_LANDMARKS, 4), np.float32)
+        normalized[:, 0] = (points[:, 0] * scale - pad_x) / frame_width
+        normalized[:, 1] = (points[:, 1] * scale - pad_y) / frame_height
+        normalized[:, 2] = points[:, 2] * scale / frame_width
+        normalized[:, 3] = _sigmoid(points[:, 3])
+
+        world_points = np.empty((NUM_LANDMARKS, 4), np.float32)
+        world_points[:, :3] = world.reshape(-1, 3)[:NUM_LANDMARKS]
+        world_points[:, 3] = normalized[:, 3]
+        return LandmarkFrame(normalized, world_points, frame_width, frame_height)
+
+
+def create_backend(name='mediapipe', **options):
+    """
+    Create a backend by name.
+
+    - 'mediapipe': the options are passed to `mp.solutions.pose.Pose`.
+    - 'replay': `path` of the recorded landmarks, see `ReplayBackend.load`.
+    - 'onnx': `model` and the other arguments of `OnnxBackend`.
+    """
+    if name == 'mediapipe':
+        return MediaPipeBackend(**options)
+    if name == 'replay':
+        return ReplayBackend.load(options['path'])
+    if name == 'onnx':
+        return OnnxBackend(**options)
+    raise ValueError(f"Unknown pose backend {name}, use one of {', '.join(backend_names)}")
+
+
+def create_pose(**settings):
+    """
+    Create the MediaPipe Pose model, by default with `pose_settings`.
+
+    MediaPipe is only imported here, since importing it takes longer than
+    everything else. Returns the model loaded by `preload_pose` if there is
+    one with the same settings.
+    """
+    global _preloaded
+    settings = settings or pose_settings
+    with _preload_lock:
+        preloaded, _preloaded = _preloaded, None
+    if preloaded is not None:
+        thread, preloaded_settings, result = preloaded
+        thread.join()
+        if result:
+            if preloaded_settings == settings:
+                return result[0]
+            result[0].close()
+    import mediapipe as mp
+    return mp.solutions.pose.Pose(**settings)
+
+
+def preload_pose():
+    """
+    Import MediaPipe and load the Pose model on a background thread, e.g.
+    while a GUI comes up. The next `create_pose` returns this model.
+    """
+    global _preloaded
+    settings = dict(pose_settings)
+    result = []
+
+    def load():
+        import mediapipe as mp
+        result.append(mp.solutions.pose.Pose(**settings))
+
+    with _preload_lock:
+        if _preloaded is not None:
+            return
+        thread = threading.Thread(target=load, name='preload-pose', daemon=True)
+        thread.start()
+        _preloaded = (thread, settings, result)
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
@@ -0,0 +1,173 @@
+"""
+Headless analysis of many videos at once.
+
+The videos are spread over a pool of processes. Every worker process creates
+its own pose backend once and reuses it for all videos it analyzes. Backends
+that process several frames per call get the frames in batches. No window is
+opened, so this also runs on machines without a display.
+"""
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import cv2
+
+from .analyze import open_cache, open_writer, estimate_batch
+from .backends import create_backend
+from .plan import compile_plan
+
+video_extensions = ('.mp4', '.avi', '.mov', '.mkv')
+
+# The pose backend of the worker process, see `_init_worker`.
+_backend = None
+
+
+def collect_videos(pattern):
+    """
+    Return the sorted list of videos in a directory, or of the files
+    matching a glob pattern like 'res/*.mp4'.
+    """
+    if os.path.isdir(pattern):
+        return sorted(str(p) for p in Path(pattern).iterdir()
+                      if p.suffix.lower() in video_extensions)
+    return sorted(glob.glob(pattern))
+
+
+def analyze_file(path, plan, backend, directory='analyzed', cache=None,
+                 writer_options={}):
+    """
+    Analyze a video without showing it, in batches of `backend.batch_size`
+    frames.
+
+    Returns a dict with the number of frames written and the time it took.
+    """
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open {path}")
+    reader, writer = open_cache(cache, path, backend=backend)
+    out, _ = open_writer(cap, plan.name, os.path.basename(path), directory,
+                         **writer_options)
+
+    index = 0
+    frames = 0
+    try:
+        while True:
+            batch = []
+            while len(batch) < backend.batch_size:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                batch.append(frame)
+            if not batch:
+                if writer is not None:
+                    writer.commit()
+                break
+
+            lfs = estimate_batch(backend, batch, index, reader, writer)
+            index += len(batch)
+            for frame, lf in zip(batch, lfs):
+                if lf is None:
+                    continue
+                plan.apply(lf, frame)
+                out.write(frame)
+                frames += 1
+    finally:
+        cap.release()
+        out.release()
+
+    seconds = time.perf_counter() - start
+    return {
+        'file': path,
+        'frames': index,
+        'written': frames,
+        'seconds': seconds,
+        'fps': index / seconds if seconds > 0 else 0.0,
+        'error': None,
+    }
+
+
+def analyze_batch(pattern, selected_filters, workers=None,
+                  directory='analyzed', cache=None, writer_options={},
+                  backend_options={}):
+    """
+    Analyze all videos in a directory or matching a glob pattern with a pool
+    of `workers` processes (default: one per core).
+
+    :writer_options: Arguments for `videoanalysis.analyze.open_writer`.
+
+    :backend_options: Arguments for `videoanalysis.backends.create_backend`.
+    Every worker creates its own backend from them.
+
+    Failing videos do not stop the batch. Returns a list with one result per
+    video, which is also written to 'batch_summary.json' in `directory`.
+    """
+    # Fail early on unknown filters instead of once per video.
+    compile_plan(selected_filters)
+    paths = collect_videos(pattern)
+    workers = workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    results = []
+    # MediaPipe starts threads on import, which does not mix well with fork.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(backend_options,)) as pool:
+        futures = {pool.submit(_run, path, selected_filters, directory, cache,
+                               writer_options): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'file': futures[future], 'frames': 0, 'written': 0,
+                          'seconds': 0.0, 'fps': 0.0, 'error': repr(e)}
+            print_result(result)
+            results.append(result)
+    seconds = time.perf_counter() - start
+
+    results.sort(key=lambda r: r['file'])
+    summary = {
+        'workers': workers,
+        'seconds': seconds,
+        'frames': sum(r['frames'] for r in results),
+        'failures': [r['file'] for r in results if r['error'] is not None],
+        'files': results,
+    }
+    summary['fps'] = summary['frames'] / seconds if seconds > 0 else 0.0
+
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    with open(os.path.join(directory, 'batch_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"{len(results)} videos, {len(summary['failures'])} failed, "
+          f"{summary['frames']} frames in {seconds:.1f}s ({summary['fps']:.1f} fps)")
+    return results
+
+
+def print_result(result):
+    if result['error'] is not None:
+        print(f"FAILED {result['file']}: {result['error']}")
+    else:
+        print(f"{result['file']}: {result['frames']} frames "
+              f"in {result['seconds']:.1f}s ({result['fps']:.1f} fps)")
+
+
+def _init_worker(backend_options):
+    global _backend
+    # The pool already uses every core, more threads per worker only compete.
+    cv2.setNumThreads(1)
+    _backend = create_backend(**backend_options)
+
+
+def _run(path, selected_filters, directory, cache, writer_options):
+    plan = compile_plan(selected_filters)
+    try:
+        return analyze_file(path, plan, _backend, directory, cache, writer_options)
+    except Exception as e:
+        return {'file': path, 'frames': 0, 'written': 0, 'seconds': 0.0,
+                'fps': 0.0, 'error': repr(e)}
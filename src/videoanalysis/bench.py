@@ -0,0 +1,296 @@
+"""
+Benchmarks for the analysis loop.
+
+Synthetic clips are drawn with OpenCV, so the benchmarks need no recorded
+videos and give the same frames on every run. The pose model is replaced by
+canned landmarks of a moving figure unless the real model is requested. The
+clip is analyzed by `videoanalysis.analyze.AnalysisSession`, and the stages
+are taken from its metrics: capture, inference, filters, display and
+encoding. The `apply` of every filter class is timed on its own. Every
+resolution runs in a process of its own, so the peak memory of one does not
+carry over to the next.
+
+The results are written as JSON, so two runs can be compared with `compare`.
+"""
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+from .analyze import AnalysisSession
+from .backends import ReplayBackend
+from .frames import LandmarkFrame, NUM_LANDMARKS
+from .instrumentation import Metrics, disabled
+from .landmarks import filters
+from .plan import compile_plan
+
+default_resolutions = ((640, 360), (1280, 720), (1920, 1080))
+
+# Filters analyzed by the session, together they use every filter class.
+# All filters would make the name of the analyzed video too long.
+session_filters = ('Gestreckter Arm Verlängerung rechts Tennis', 'box',
+                   'middle_axis', 'Fuss_Huefte_Schulter_Winkel', 'close')
+
+
+def synthetic_video(path, width, height, frames=120, fps=30):
+    """
+    Write a clip of a moving figure on a textured background to `path`.
+    """
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+    poses = canned_landmarks(frames)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc('M','J','P','G'), fps, (width, height))
+    for normalized in poses:
+        frame = background.copy()
+        points = (normalized[:, :2] * (width, height)).astype(np.int32)
+        for x, y in points:
+            cv2.circle(frame, (int(x), int(y)), max(2, width // 200), (255, 255, 255), -1)
+        out.write(frame)
+    out.release()
+
+
+def canned_landmarks(frames):
+    """
+    Return (frames, 33, 4) normalized landmarks of a figure that moves its
+    landmarks on circles around fixed positions.
+    """
+    rng = np.random.default_rng(1)
+    base = rng.uniform(0.3, 0.7, (NUM_LANDMARKS, 2))
+    phase = rng.uniform(0, 2 * np.pi, NUM_LANDMARKS)
+    t = np.arange(frames)[:, None] / 30
+    landmarks = np.zeros((frames, NUM_LANDMARKS, 4), np.float32)
+    landmarks[:, :, 0] = base[:, 0] + 0.1 * np.cos(2 * np.pi * 0.5 * t + phase)
+    landmarks[:, :, 1] = base[:, 1] + 0.1 * np.sin(2 * np.pi * 0.5 * t + phase)
+    landmarks[:, :, 2] = 0.05 * np.sin(t + phase)
+    landmarks[:, :, 3] = 0.99
+    return landmarks
+
+
+def canned_backend(frames):
+    """
+    Return a `videoanalysis.backends.ReplayBackend` with the canned landmarks
+    in place of the pose model.
+    """
+    normalized = canned_landmarks(frames)
+    # World landmarks are in meters around the hips.
+    world = normalized.copy()
+    world[:, :, :3] = (world[:, :, :3] - 0.5) * 2
+    return ReplayBackend(normalized, world, np.ones(frames, bool))
+
+
+def run(width, height, frames=120, real_pose=False, display=False, memory=True):
+    """
+    Benchmark the analysis loop on a synthetic clip of the given size.
+
+    Returns a dict with the time of every stage and the peak memory. The
+    maximum resident set size only grows, so it is only meaningful for the
+    first run in a process, see `run_all`.
+    """
+    tmp = tempfile.mkdtemp(prefix='videoanalysis-bench-')
+    try:
+        path = os.path.join(tmp, 'clip.avi')
+        synthetic_video(path, width, height, frames)
+
+        metrics = Metrics()
+        start = time.perf_counter()
+        _run_session(path, frames, real_pose, display, tmp, metrics)
+        seconds = time.perf_counter() - start
+
+        stages = {name: _stage(stage['mean'] * stage['count'], frames)
+                  for name, stage in metrics.snapshot()['stages'].items()}
+        stages.update(filter_times(width, height, frames))
+        result = {
+            'width': width,
+            'height': height,
+            'frames': frames,
+            'real_pose': real_pose,
+            'seconds': seconds,
+            'fps': frames / seconds,
+            'stages': stages,
+            'max_rss': _max_rss(),
+        }
+        if memory:
+            # A second pass, since tracing the allocations slows the loop down.
+            tracemalloc.start()
+            _run_session(path, frames, real_pose, False, tmp)
+            result['peak_traced'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result['draw_allocations'] = draw_allocations(width, height, frames)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return result
+
+
+def filter_times(width, height, frames=120):
+    """
+    Return the time the `apply` of every filter class takes, on all filters
+    and the canned landmarks.
+    """
+    frame = np.zeros((height, width, 3), np.uint8)
+    backend = canned_backend(frames)
+    times = defaultdict(float)
+    clock = time.perf_counter
+    for index in range(frames):
+        lf = backend.process(frame, index)
+        for filt in (f for name in filters for f in filters[name]):
+            t = clock()
+            filt.apply(lf, frame)
+            times[f'{type(filt).__name__}.apply'] += clock() - t
+    return {name: _stage(total, frames) for name, total in times.items()}
+
+
+def draw_allocations(width, height, frames=120, warmup=10):
+    """
+    Measure what creating the `LandmarkFrame` and drawing all filters
+    allocates once the loop is warm.
+
+    Returns a dict with the bytes per frame that are still allocated after
+    the loop, and the most bytes allocated at once for one frame.
+    """
+    frame = np.zeros((height, width, 3), np.uint8)
+    poses = []
+    for normalized in canned_landmarks(frames):
+        world = normalized.copy()
+        world[:, :3] = (world[:, :3] - 0.5) * 2
+        poses.append((normalized, world))
+    plan = compile_plan(list(filters))
+    for normalized, world in poses[:warmup]:
+        plan.apply(LandmarkFrame(normalized, world, width, height), frame)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for normalized, world in poses:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            lf = LandmarkFrame(normalized, world, width, height)
+            plan.apply(lf, frame)
+            del lf
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return {'retained_per_frame': retained / frames, 'peak_per_frame': peak}
+
+
+def check_allocations(width=1280, height=720, frames=120, peak_limit=8 * 1024,
+                      retained_limit=64):
+    """
+    Fail with an AssertionError if a frame allocates more than `peak_limit`
+    bytes at once, or if more than `retained_limit` bytes per frame are kept,
+    see `draw_allocations`.
+    """
+    result = draw_allocations(width, height, frames)
+    assert result['peak_per_frame'] <= peak_limit, (
+        f"A frame allocates {result['peak_per_frame']} bytes, "
+        f"more than {peak_limit}")
+    assert result['retained_per_frame'] <= retained_limit, (
+        f"{result['retained_per_frame']:.1f} bytes per frame are kept, "
+        f"more than {retained_limit}")
+    return result
+
+
+def run_all(resolutions=default_resolutions, frames=120, real_pose=False,
+            display=False, output=None):
+    """
+    Run the benchmark for every resolution, print the results and write
+    them to `output` as JSON.
+    """
+    results = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'runs': [],
+    }
+    context = multiprocessing.get_context('spawn')
+    for width, height in resolutions:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run, width, height, frames, real_pose, display).result()
+        print_result(result)
+        results['runs'].append(result)
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def compare(old, new):
+    """
+    Print how the stage times of two result files differ. A ratio above 1
+    means the new run is slower.
+    """
+    with open(old) as f:
+        old = json.load(f)
+    with open(new) as f:
+        new = json.load(f)
+    old_runs = {(r['width'], r['height']): r for r in old['runs']}
+    for run in new['runs']:
+        before = old_runs.get((run['width'], run['height']))
+        if before is None:
+            continue
+        print(f"{run['width']}x{run['height']}: "
+              f"{before['fps']:.1f} -> {run['fps']:.1f} fps")
+        for name, stage in run['stages'].items():
+            if name in before['stages'] and before['stages'][name]['mean_ms'] > 0:
+                ratio = stage['mean_ms'] / before['stages'][name]['mean_ms']
+                print(f"  {name:>34}: {before['stages'][name]['mean_ms']:8.3f} -> "
+                      f"{stage['mean_ms']:8.3f} ms ({ratio:.2f}x)")
+
+
+def print_result(result):
+    print(f"{result['width']}x{result['height']}: {result['frames']} frames "
+          f"in {result['seconds']:.2f}s ({result['fps']:.1f} fps)")
+    for name, stage in result['stages'].items():
+        print(f"  {name:>34}: {stage['mean_ms']:8.3f} ms/frame")
+    if 'peak_traced' in result:
+        print(f"  peak traced memory: {result['peak_traced'] / 1024**2:.1f} MiB, "
+              f"max rss: {result['max_rss'] / 1024**2:.1f} MiB")
+    if 'draw_allocations' in result:
+        draw = result['draw_allocations']
+        print(f"  a drawn frame allocates {draw['peak_per_frame']} bytes at most, "
+              f"{draw['retained_per_frame']:.1f} bytes per frame are kept")
+
+
+def _run_session(path, frames, real_pose, display, directory, metrics=disabled):
+    backend = None if real_pose else canned_backend(frames)
+    # The frames are encoded on the loop, so the encode stage is their cost.
+    session = AnalysisSession(path, session_filters, backend=backend,
+                              metrics=metrics,
+                              writer_options={'directory': directory,
+                                              'background': False})
+    session.run(display=display)
+
+
+def _stage(total, frames):
+    return {
+        'total': total,
+        'mean_ms': 1000 * total / frames,
+        'fps': frames / total if total > 0 else 0.0,
+    }
+
+
+def _max_rss():
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if platform.system() == 'Darwin' else rss * 1024
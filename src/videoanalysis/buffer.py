@@ -0,0 +1,112 @@
+import cv2
+
+
+class FrameRingBuffer():
+    """
+    Fixed-capacity ring buffer for the delay feature.
+
+    Frames are stored encoded (JPEG by default) and optionally downscaled, so
+    a delay of several seconds fits into a small amount of memory. The slots
+    are allocated once and push and pop only move the head and tail indices.
+
+    :budget: Maximum number of bytes the stored frames may use. If a new frame
+    does not fit, the oldest frames are dropped.
+
+    :capacity: Maximum number of frames.
+
+    :codec: File extension passed to `cv2.imencode`, e.g. '.jpg' or '.png'.
+    Use None to store the raw frames.
+
+    :scale: Factor the frames get downscaled with before they are stored.
+    They are scaled back to their original size when popped.
+
+    `dropped` counts the frames that were removed without being popped.
+    """
+    def __init__(self, budget=256 * 1024 * 1024, capacity=30 * 10 + 1,
+                 codec='.jpg', quality=90, scale=1.0):
+        self.budget = budget
+        self.capacity = capacity
+        self.codec = codec
+        self.scale = scale
+        if codec == '.jpg':
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        else:
+            self.params = []
+
+        self.slots = [None] * capacity
+        self.shapes = [None] * capacity
+        self.indices = [None] * capacity
+        self.head = 0
+        self.size = 0
+        self.nbytes = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, frame, index=None):
+        """
+        Store a frame. `index` is handed back by `pop` together with the
+        frame, so callers can keep track of the frame number.
+        """
+        shape = frame.shape
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA)
+        if self.codec is None:
+            data = frame.copy()
+        else:
+            ok, data = cv2.imencode(self.codec, frame, self.params)
+            if not ok:
+                raise ValueError(f"Could not encode frame as {self.codec}")
+
+        while self.size > 0 and (self.size == self.capacity
+                                 or self.nbytes + data.nbytes > self.budget):
+            self._drop()
+            self.dropped += 1
+
+        tail = (self.head + self.size) % self.capacity
+        self.slots[tail] = data
+        self.shapes[tail] = shape
+        self.indices[tail] = index
+        self.nbytes += data.nbytes
+        self.size += 1
+
+    def pop(self):
+        """
+        Remove the oldest frame and return its index and the decoded frame.
+        """
+        if self.size == 0:
+            raise IndexError("pop from empty FrameRingBuffer")
+        data = self.slots[self.head]
+        shape = self.shapes[self.head]
+        index = self.indices[self.head]
+        self._drop()
+
+        if self.codec is None:
+            frame = data
+        else:
+            frame = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+        if frame.shape != shape:
+            frame = cv2.resize(frame, (shape[1], shape[0]),
+                               interpolation=cv2.INTER_LINEAR)
+        return index, frame
+
+    def trim(self, size):
+        """
+        Drop the oldest frames until at most `size` frames are left.
+        """
+        while self.size > size:
+            self._drop()
+            self.dropped += 1
+
+    def clear(self):
+        self.trim(0)
+
+    def _drop(self):
+        self.nbytes -= self.slots[self.head].nbytes
+        self.slots[self.head] = None
+        self.shapes[self.head] = None
+        self.indices[self.head] = None
+        self.head = (self.head + 1) % self.capacity
+        self.size -= 1
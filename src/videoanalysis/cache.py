@@ -0,0 +1,212 @@
+"""
+On-disk cache for pose landmarks.
+
+The landmarks of every frame of a video are stored as NumPy arrays, so a
+later analysis of the same video (e.g. with other filters) can skip the pose
+inference entirely. An entry is keyed by the hash of the video content and
+the settings of the Pose model, so changing either of them invalidates it.
+
+Every entry is a directory with three arrays:
+
+- `landmarks.npy`: (frames, 33, 4) float32, normalized x, y, z and visibility.
+- `world.npy`: (frames, 33, 4) float32, world x, y, z and visibility.
+- `status.npy`: (frames,) int8, 1 if a pose was found in the frame, else 0.
+
+The arrays are memory-mapped when read. The cache directory is kept below a
+size limit by removing the least recently used entries.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from .frames import LandmarkFrame, NUM_LANDMARKS
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Increase when the layout of an entry changes.
+CACHE_VERSION = 1
+
+default_directory = Path.home() / '.cache' / 'videoanalysis' / 'landmarks'
+
+
+class LandmarkCache():
+    """
+    :directory: Directory the entries are stored in.
+
+    :max_bytes: Maximum size of all entries together. The least recently
+    used entries are removed when a new entry exceeds it.
+    """
+    def __init__(self, directory=default_directory, max_bytes=2 * 1024**3):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, path, pose_settings):
+        """
+        Return the key for the video at `path` analyzed with a Pose model
+        created with `pose_settings`.
+        """
+        settings = json.dumps(pose_settings, sort_keys=True)
+        digest = hashlib.sha1()
+        digest.update(f'{CACHE_VERSION}:{file_hash(path, self.directory)}:{settings}'.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Return a `CacheReader` for the entry, or None if there is none.
+        """
+        entry = self.directory / key
+        if not (entry / 'status.npy').is_file():
+            return None
+        # The modification time of the entry is used for the LRU eviction.
+        os.utime(entry)
+        return CacheReader(entry)
+
+    def writer(self, key):
+        return CacheWriter(self, key)
+
+    def invalidate(self, key):
+        shutil.rmtree(self.directory / key, ignore_errors=True)
+
+    def clear(self):
+        for entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits into
+        `max_bytes`.
+        """
+        # Other processes may remove entries at the same time.
+        mtimes = {}
+        sizes = {}
+        for entry in self._entries():
+            try:
+                mtimes[entry] = entry.stat().st_mtime
+                sizes[entry] = sum(f.stat().st_size for f in entry.iterdir())
+            except FileNotFoundError:
+                mtimes.pop(entry, None)
+        total = sum(sizes.get(entry, 0) for entry in mtimes)
+        for entry in sorted(mtimes, key=mtimes.get):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+    def _entries(self):
+        return [e for e in self.directory.iterdir()
+                if e.is_dir() and not e.name.startswith('.')]
+
+
+class CacheReader():
+    def __init__(self, entry):
+        self.landmarks = np.load(entry / 'landmarks.npy', mmap_mode='r')
+        self.world = np.load(entry / 'world.npy', mmap_mode='r')
+        self.status = np.load(entry / 'status.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.status)
+
+    def frame(self, index, frame_width, frame_height):
+        """
+        Return the landmarks of a frame as a `LandmarkFrame`, or None if there
+        is no pose in the frame.
+        """
+        if index >= len(self.status) or not self.status[index]:
+            return None
+        return LandmarkFrame(np.asarray(self.landmarks[index]),
+                             np.asarray(self.world[index]),
+                             frame_width, frame_height)
+
+
+class CacheWriter():
+    """
+    Collects the landmarks of every frame during an analysis. The entry is
+    only written by `commit`, once every frame of the video was processed.
+    """
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.frames = {}
+
+    def append(self, index, lf):
+        """
+        Store the `LandmarkFrame` of a frame, or None if it has no pose.
+        """
+        if lf is None:
+            self.frames[index] = None
+        else:
+            self.frames[index] = (lf.normalized, lf.world)
+
+    def commit(self):
+        """
+        Write the entry. Returns False and writes nothing if some frames are
+        missing, e.g. because they were dropped from the delay buffer.
+        """
+        n = len(self.frames)
+        if n == 0 or max(self.frames) != n - 1:
+            return False
+
+        landmarks = np.zeros((n, NUM_LANDMARKS, 4), np.float32)
+        world = np.zeros((n, NUM_LANDMARKS, 4), np.float32)
+        status = np.zeros(n, np.int8)
+        for index, arrays in self.frames.items():
+            if arrays is not None:
+                landmarks[index], world[index] = arrays
+                status[index] = 1
+
+        # Write into a temporary directory first, so a reader never sees a
+        # partially written entry.
+        tmp = self.cache.directory / f'.{self.key}.{os.getpid()}.{time.time_ns()}'
+        tmp.mkdir()
+        np.save(tmp / 'landmarks.npy', landmarks)
+        np.save(tmp / 'world.npy', world)
+        np.save(tmp / 'status.npy', status)
+        self.cache.invalidate(self.key)
+        try:
+            tmp.rename(self.cache.directory / self.key)
+        except OSError:
+            # Another process committed the same entry in the meantime.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.cache.evict()
+        return True
+
+
+def file_hash(path, directory):
+    """
+    Return the SHA-1 of the content of the file at `path`.
+
+    Hashing a long recording takes a while, so the hash is remembered in
+    `directory` together with the size and modification time of the file.
+    """
+    stat = os.stat(path)
+    index_file = Path(directory) / '.hashes.json'
+    try:
+        index = json.loads(index_file.read_text())
+    except (OSError, ValueError):
+        index = {}
+
+    name = os.path.abspath(path)
+    known = index.get(name)
+    if known is not None and known['size'] == stat.st_size \
+            and known['mtime'] == stat.st_mtime_ns:
+        return known['hash']
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    index[name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                   'hash': digest.hexdigest()}
+    # Several processes may write the index at the same time, none of them
+    # may leave it half written.
+    tmp = index_file.with_name(f'{index_file.name}.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(index))
+    os.replace(tmp, index_file)
+    return digest.hexdigest()
+
@@ -0,0 +1,123 @@
+"""
+The preview window of the analysis.
+
+Showing every frame at full resolution is expensive: at 4K, `cv2.imshow`
+alone takes a large share of the time of a frame. `Preview` shows a
+downscaled copy of the newest frame at its own refresh rate instead, and
+frames that arrive in between are never shown. The analyzed video is still
+written at full resolution.
+
+Most GUI backends of OpenCV only work from the main thread, so the preview
+has no thread of its own. The analysis loop asks it whether a refresh is
+due (see `AnalysisSession.run`), or the pipeline hands the frames over with
+`offer` and the main thread shows them (see `videoanalysis.pipeline`).
+"""
+import threading
+import time
+
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+class Preview():
+    """
+    :window: Name of the window.
+
+    :width: Downscale wider frames to this width. None or 0 shows them at
+    full resolution.
+
+    :fps: Refresh rate of the window. None or 0 shows every frame.
+    """
+    def __init__(self, window='cam', width=1280, fps=30):
+        self.window = window
+        self.width = width or None
+        self.interval = 1 / fps if fps else 0.0
+        self.last_shown = None
+        self.last_polled = None
+        self.shown = 0
+        self.dropped = 0
+        # The downscaled frame is resized into the same array every time.
+        self.small = None
+
+        self.cond = threading.Condition()
+        self.pending = None
+
+    def open(self):
+        cv2.namedWindow(self.window, cv2.WINDOW_NORMAL)
+        return self
+
+    def close(self):
+        cv2.destroyWindow(self.window)
+
+    def due(self):
+        """
+        Return whether the next refresh is due.
+        """
+        return (self.last_shown is None
+                or time.perf_counter() - self.last_shown >= self.interval)
+
+    def offer(self, frame):
+        """
+        Hand over the newest frame from another thread. Never blocks, a
+        frame that was not shown yet is replaced and dropped.
+        """
+        with self.cond:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = frame
+            self.cond.notify()
+
+    def take(self, timeout=None):
+        """
+        Wait until a refresh is due and a frame was offered, and return the
+        newest one. Returns None after `timeout` seconds.
+        """
+        now = time.perf_counter()
+        deadline = None if timeout is None else now + timeout
+        if self.last_shown is not None:
+            due = self.last_shown + self.interval
+            if deadline is not None and due > deadline:
+                time.sleep(timeout)
+                return None
+            if due > now:
+                time.sleep(due - now)
+        with self.cond:
+            while self.pending is None:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            frame, self.pending = self.pending, None
+        return frame
+
+    def show(self, frame):
+        """
+        Show the frame, downscaled to the width of the preview.
+        """
+        frame_height, frame_width = frame.shape[:2]
+        if self.width is not None and frame_width > self.width:
+            size = (self.width, max(1, round(frame_height * self.width / frame_width)))
+            if self.small is None or self.small.shape[:2] != (size[1], size[0]):
+                self.small = np.empty((size[1], size[0]) + frame.shape[2:], frame.dtype)
+            frame = cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.imshow(self.window, frame)
+        self.last_shown = time.perf_counter()
+        self.shown += 1
+
+    def poll_due(self):
+        """
+        Return whether the keys should be polled again, also while no frame
+        is shown.
+        """
+        return (self.last_polled is None
+                or time.perf_counter() - self.last_polled >= self.interval)
+
+    def poll(self):
+        """
+        Let the window handle its events and return the pressed key, 255 if
+        there was none.
+        """
+        self.last_polled = time.perf_counter()
+        return cv2.waitKey(1) & 0xFF
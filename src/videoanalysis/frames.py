@@ -0,0 +1,105 @@
+import enum
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+NUM_LANDMARKS = 33
+
+
+class PoseLandmark(enum.IntEnum):
+    """
+    The landmarks of the pose model, with the same names and indices as
+    `mp.solutions.pose.PoseLandmark`. Defined here, so the filters can be
+    built without importing MediaPipe.
+    """
+    NOSE = 0
+    LEFT_EYE_INNER = 1
+    LEFT_EYE = 2
+    LEFT_EYE_OUTER = 3
+    RIGHT_EYE_INNER = 4
+    RIGHT_EYE = 5
+    RIGHT_EYE_OUTER = 6
+    LEFT_EAR = 7
+    RIGHT_EAR = 8
+    MOUTH_LEFT = 9
+    MOUTH_RIGHT = 10
+    LEFT_SHOULDER = 11
+    RIGHT_SHOULDER = 12
+    LEFT_ELBOW = 13
+    RIGHT_ELBOW = 14
+    LEFT_WRIST = 15
+    RIGHT_WRIST = 16
+    LEFT_PINKY = 17
+    RIGHT_PINKY = 18
+    LEFT_INDEX = 19
+    RIGHT_INDEX = 20
+    LEFT_THUMB = 21
+    RIGHT_THUMB = 22
+    LEFT_HIP = 23
+    RIGHT_HIP = 24
+    LEFT_KNEE = 25
+    RIGHT_KNEE = 26
+    LEFT_ANKLE = 27
+    RIGHT_ANKLE = 28
+    LEFT_HEEL = 29
+    RIGHT_HEEL = 30
+    LEFT_FOOT_INDEX = 31
+    RIGHT_FOOT_INDEX = 32
+
+
+class LandmarkFrame():
+    """
+    The pose landmarks of one frame as NumPy arrays.
+
+    :normalized: (33, 4) array with the normalized x, y, z coordinates and the
+    visibility of every landmark, as returned in `pose_landmarks`.
+
+    :world: (33, 4) array with the world coordinates in meters and the
+    visibility, as returned in `pose_world_landmarks`.
+
+    The pixel coordinates of all landmarks are calculated once, when the
+    frame is created. Landmarks outside of the image have no pixel
+    coordinates, like in `mp_drawing._normalized_to_pixel_coordinates`.
+    """
+    # One is created for every frame.
+    __slots__ = ('normalized', 'world', 'frame_width', 'frame_height', 'valid',
+                 'px', 'pixels')
+
+    def __init__(self, normalized, world, frame_width, frame_height):
+        self.normalized = normalized
+        self.world = world
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+
+        xy = normalized[:, :2]
+        size = np.array((frame_width, frame_height))
+        px = np.minimum(np.floor(xy * size), size - 1).astype(np.int32)
+        self.valid = np.all((xy >= 0) & (xy <= 1), axis=1)
+        self.px = px
+        self.pixels = [tuple(p) if ok else None
+                       for p, ok in zip(px.tolist(), self.valid.tolist())]
+
+    @classmethod
+    def from_result(cls, res, frame_width, frame_height):
+        """
+        Convert the result of `Pose.process`. Returns None if no pose was
+        found.
+        """
+        if res.pose_landmarks is None:
+            return None
+        return cls(_to_array(res.pose_landmarks),
+                   _to_array(res.pose_world_landmarks),
+                   frame_width, frame_height)
+
+    def pixel(self, lm):
+        """
+        Return the pixel coordinates of a landmark, or None if it is outside
+        of the image.
+        """
+        return self.pixels[lm]
+
+
+def _to_array(landmark_list):
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility)
+                     for lm in landmark_list.landmark], np.float32)
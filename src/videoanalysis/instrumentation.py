@@ -0,0 +1,260 @@
+"""
+Instrumentation of the analysis loop.
+
+`Metrics` collects the latency of every stage in a histogram, counts the
+frames that were dropped and keeps gauges like the occupancy of the delay
+buffer. The metrics can be drawn onto the frames, written to a JSON file
+every few seconds and served over HTTP on localhost:
+
+- `/metrics`: Prometheus text format, for scraping.
+- `/metrics.json`: the same as the JSON file.
+
+A disabled `Metrics` object only costs an attribute check per call.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+# Upper bounds of the histogram buckets in seconds.
+buckets = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, float('inf'))
+
+
+class Histogram():
+    def __init__(self):
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket that contains the quantile.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(buckets, self.counts):
+            seen += count
+            if seen >= rank and seen > 0:
+                return min(bound, self.max)
+        return 0.0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': self.max,
+            # JSON has no infinity, the last bound is named like in Prometheus.
+            'buckets': [('+Inf' if bound == float('inf') else bound, count)
+                        for bound, count in zip(buckets, self.counts)],
+        }
+
+
+class Metrics():
+    """
+    :enabled: Collect metrics at all.
+
+    :overlay: Draw the fps, the median stage latencies and the gauges onto
+    every frame. In the sequential loop the overlay also ends up in the
+    written video.
+
+    :dump_path: Write the metrics as JSON to this file every `interval`
+    seconds.
+
+    :port: Serve the metrics over HTTP on this port of localhost.
+    """
+    def __init__(self, enabled=True, overlay=False, dump_path=None,
+                 interval=5.0, port=None):
+        self.enabled = enabled
+        self.overlay = overlay
+        self.dump_path = dump_path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+        self.frames = 0
+        self.fps = 0.0
+        self.last_frame = None
+        self.last_dump = time.perf_counter()
+        self.server = None
+        if enabled and port is not None:
+            self.serve(port)
+
+    clock = staticmethod(time.perf_counter)
+
+    def record(self, stage, start):
+        """
+        Add the time since `start` (a value of `clock()`) to the histogram of
+        the stage.
+        """
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.add(elapsed)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if not self.enabled:
+            return
+        self.gauges[name] = value
+
+    def frame_done(self, frame=None):
+        """
+        Call once per shown frame. Updates the fps, draws the overlay onto
+        `frame` and writes the JSON file when it is due.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.last_frame is not None and now > self.last_frame:
+            fps = 1 / (now - self.last_frame)
+            self.fps = fps if self.frames == 1 else 0.9 * self.fps + 0.1 * fps
+        self.last_frame = now
+        self.frames += 1
+
+        if self.overlay and frame is not None:
+            self.draw(frame)
+        if self.dump_path is not None and now - self.last_dump >= self.interval:
+            self.last_dump = now
+            self.dump()
+
+    def draw(self, frame):
+        lines = [f'{self.fps:5.1f} fps']
+        with self.lock:
+            for name, histogram in self.stages.items():
+                lines.append(f'{name}: {1000 * histogram.quantile(0.5):.1f} ms')
+        for name, value in self.gauges.items():
+            lines.append(f'{name}: {value}')
+
+        scale = max(0.5, frame.shape[0] / 1080)
+        for i, line in enumerate(lines):
+            y = int((30 + 30 * i) * scale)
+            cv2.putText(frame, line, (int(10 * scale), y), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.8 * scale, (0, 0, 0), int(4 * scale) + 1)
+            cv2.putText(frame, line, (int(10 * scale), y), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.8 * scale, (255, 255, 255), int(2 * scale) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            stages = {name: h.snapshot() for name, h in self.stages.items()}
+            counters = dict(self.counters)
+        return {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'frames': self.frames,
+            'fps': self.fps,
+            'stages': stages,
+            'counters': counters,
+            'gauges': dict(self.gauges),
+        }
+
+    def dump(self, path=None):
+        path = path or self.dump_path
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, allow_nan=False)
+        os.replace(tmp, path)
+
+    def prometheus(self):
+        """
+        Return the metrics in the Prometheus text format.
+        """
+        snapshot = self.snapshot()
+        lines = [
+            '# TYPE videoanalysis_frames_total counter',
+            f'videoanalysis_frames_total {snapshot["frames"]}',
+            '# TYPE videoanalysis_fps gauge',
+            f'videoanalysis_fps {snapshot["fps"]}',
+            '# TYPE videoanalysis_stage_seconds histogram',
+        ]
+        for name, stage in snapshot['stages'].items():
+            cumulative = 0
+            for bound, count in stage['buckets']:
+                cumulative += count
+                lines.append(f'videoanalysis_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'videoanalysis_stage_seconds_sum{{stage="{name}"}} {stage["mean"] * stage["count"]}')
+            lines.append(f'videoanalysis_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines.append('# TYPE videoanalysis_dropped_total counter')
+        for name, value in snapshot['counters'].items():
+            lines.append(f'videoanalysis_dropped_total{{reason="{name}"}} {value}')
+        lines.append('# TYPE videoanalysis_gauge gauge')
+        for name, value in snapshot['gauges'].items():
+            lines.append(f'videoanalysis_gauge{{name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serve the metrics over HTTP on a background thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot(), allow_nan=False).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='metrics',
+                         daemon=True).start()
+
+    def close(self):
+        """
+        Write the JSON file a last time and stop the HTTP server.
+        """
+        if self.dump_path is not None and self.enabled:
+            self.dump()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def print_summary(self):
+        snapshot = self.snapshot()
+        print(f"{snapshot['frames']} frames, {snapshot['fps']:.1f} fps")
+        for name, stage in snapshot['stages'].items():
+            print(f"{name:>10}: mean {1000 * stage['mean']:7.2f} ms, "
+                  f"p95 {1000 * stage['p95']:7.2f} ms, max {1000 * stage['max']:7.2f} ms")
+        for name, value in snapshot['counters'].items():
+            print(f"{name:>10}: {value} frames dropped")
+
+
+disabled = Metrics(enabled=False)
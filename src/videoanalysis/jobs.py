@@ -0,0 +1,326 @@
+"""
+Analyses running in the background, for the launcher `start.py`.
+
+Jobs wait in a queue and a fixed number of them run at the same time, each
+with a `videoanalysis.analyze.AnalysisSession` in one of the worker
+processes. The GUI thread therefore never waits for the pose model and can
+queue or cancel jobs while others run. The workers live as long as the
+queue and load the MediaPipe model in advance while they wait, if the next
+job uses it, so the job does not pay for importing MediaPipe and loading
+the model.
+
+The worker processes report their progress over a queue. A few times per
+second they also copy a downscaled frame into a shared memory block of the
+job, so the preview does not have to be pickled. `JobQueue.poll` collects
+both without blocking, e.g. from a Tk `after` callback.
+"""
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+from .backends import MediaPipeBackend
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Largest width and height of the preview.
+preview_size = (320, 180)
+
+
+class Job():
+    """
+    One analysis of `url` with `selected_filters`.
+
+    :options: Further arguments for `videoanalysis.analyze.AnalysisSession`.
+
+    `state` is 'queued', 'running', 'done', 'cancelled' or 'failed'.
+    """
+    def __init__(self, id, url, selected_filters, options):
+        self.id = id
+        self.url = url
+        self.selected_filters = selected_filters
+        self.options = options
+        self.state = 'queued'
+        self.frames = 0
+        self.total = 0
+        self.fps = 0.0
+        self.error = None
+        self.cancel_event = threading.Event()
+        # The worker running the job, its lock guards the preview.
+        self.worker = None
+        self.memory = None
+        self.preview_shape = None
+        self.last_preview = None
+
+    def eta(self):
+        """
+        Return the remaining seconds, or None if the length of the source is
+        unknown, e.g. for a camera.
+        """
+        if self.total <= 0 or self.fps <= 0:
+            return None
+        return max(self.total - self.frames, 0) / self.fps
+
+    def preview(self):
+        """
+        Return a copy of the latest preview frame, or None if there is none
+        yet.
+        """
+        if self.memory is None or self.preview_shape is None:
+            return self.last_preview
+        height, width = self.preview_shape
+        with self.worker.lock:
+            return np.ndarray((height, width, 3), np.uint8, self.memory.buf).copy()
+
+    def describe(self):
+        filters = self.selected_filters
+        if not isinstance(filters, str):
+            filters = ', '.join(filters)
+        text = f'{self.id}: {self.url} [{filters}] {self.state}'
+        if self.state == 'running':
+            text += f' {self.frames}'
+            if self.total > 0:
+                text += f'/{self.total}'
+            text += f' frames, {self.fps:.1f} fps'
+            eta = self.eta()
+            if eta is not None:
+                text += f', {eta:.0f}s left'
+        elif self.state == 'failed' and self.error is not None:
+            text += f': {self.error}'
+        return text
+
+    def _release(self):
+        if self.memory is not None:
+            self.last_preview = self.preview()
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+class Worker():
+    """
+    A process that runs one job after the other. Jobs are sent over a pipe,
+    the cancel event and the lock of the preview are shared with the process
+    when it starts.
+    """
+    def __init__(self, context, progress, interval):
+        self.cancel_event = context.Event()
+        self.lock = context.Lock()
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve, name='jobs-worker', daemon=True,
+            args=(child, progress, self.cancel_event, self.lock, interval))
+        self.process.start()
+        child.close()
+
+    def run(self, job):
+        """
+        Run the job and wait until it ended. Returns the exit code of the
+        job, or that of the process if it died.
+        """
+        self.conn.send((job.id, job.url, job.selected_filters, job.options,
+                        job.memory.name))
+        try:
+            return self.conn.recv()
+        except EOFError:
+            self.process.join()
+            return self.process.exitcode
+
+    def preload(self):
+        """
+        Let the process load the MediaPipe model while it waits.
+        """
+        self.conn.send('preload')
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self):
+        if self.alive():
+            self.conn.send(None)
+        self.process.join()
+        self.conn.close()
+
+
+class JobQueue():
+    """
+    Runs the submitted jobs in order, at most `workers` at the same time.
+
+    :preview_interval: Seconds between two preview frames of a job.
+
+    :preload: Whether the jobs that are not submitted yet will use MediaPipe,
+    so idle workers load its model in advance. The jobs that are already
+    waiting are looked at first.
+    """
+    def __init__(self, workers=1, preview_interval=0.5, preload=True):
+        # MediaPipe starts threads on import, which does not mix well with fork.
+        self.context = multiprocessing.get_context('spawn')
+        self.preview_interval = preview_interval
+        self.preload = preload
+        self.progress = self.context.Queue()
+        self.pending = queue.Queue()
+        self.jobs = []
+        self.ids = itertools.count(1)
+        self.threads = [threading.Thread(target=self._work, name=f'jobs-{i}',
+                                         daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, url, selected_filters, **options):
+        job = Job(next(self.ids), url, selected_filters, options)
+        self.jobs.append(job)
+        self.pending.put(job)
+        return job
+
+    def cancel(self, job):
+        if job.state == 'queued':
+            job.state = 'cancelled'
+        job.cancel_event.set()
+        worker = job.worker
+        if worker is not None:
+            worker.cancel_event.set()
+
+    def poll(self):
+        """
+        Apply the progress reported since the last call to the jobs. Returns
+        True if a job changed.
+        """
+        jobs = {job.id: job for job in self.jobs}
+        changed = False
+        while True:
+            try:
+                message = self.progress.get_nowait()
+            except queue.Empty:
+                return changed
+            kind, id, *values = message
+            job = jobs[id]
+            changed = True
+            if kind == 'started':
+                job.state = 'running'
+            elif kind == 'progress':
+                job.frames, job.total, job.fps, job.preview_shape = values
+            elif kind == 'error':
+                job.error = values[0]
+            elif kind == 'exit':
+                if job.cancel_event.is_set():
+                    job.state = 'cancelled'
+                elif job.error is not None or values[0] != 0:
+                    job.state = 'failed'
+                    job.error = job.error or f'exit code {values[0]}'
+                else:
+                    job.state = 'done'
+                    job.frames = max(job.frames, job.total)
+                job._release()
+
+    def close(self):
+        """
+        Cancel all jobs and stop the worker processes.
+        """
+        for job in self.jobs:
+            self.cancel(job)
+        for _ in self.threads:
+            self.pending.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.poll()
+
+    def _work(self):
+        width, height = preview_size
+        worker = Worker(self.context, self.progress, self.preview_interval)
+        try:
+            while True:
+                if self._next_uses_mediapipe():
+                    worker.preload()
+                job = self.pending.get()
+                if job is None:
+                    return
+                if job.cancel_event.is_set():
+                    continue
+                if not worker.alive():
+                    worker = Worker(self.context, self.progress, self.preview_interval)
+                job.memory = shared_memory.SharedMemory(create=True, size=width * height * 3)
+                worker.cancel_event.clear()
+                job.worker = worker
+                # `cancel` may have missed the worker.
+                if job.cancel_event.is_set():
+                    worker.cancel_event.set()
+                self.progress.put(('started', job.id))
+                exitcode = worker.run(job)
+                self.progress.put(('exit', job.id, exitcode))
+        finally:
+            worker.stop()
+
+    def _next_uses_mediapipe(self):
+        with self.pending.mutex:
+            waiting = [job for job in self.pending.queue
+                       if job is not None and not job.cancel_event.is_set()]
+        if not waiting:
+            return self.preload
+        backend = waiting[0].options.get('backend')
+        return backend is None or isinstance(backend, MediaPipeBackend)
+
+
+def _serve(conn, progress, cancel_event, lock, interval):
+    from .backends import preload_pose
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        if job == 'preload':
+            # Every job closes its model, the next one is loaded while the
+            # worker waits.
+            preload_pose()
+            continue
+        id, url, selected_filters, options, memory_name = job
+        ok = _run_job(id, url, selected_filters, options, progress,
+                      cancel_event, lock, memory_name, interval)
+        conn.send(0 if ok else 1)
+
+
+def _run_job(id, url, selected_filters, options, progress, cancel_event, lock,
+             memory_name, interval):
+    from .analyze import AnalysisSession
+
+    width, height = preview_size
+    memory = shared_memory.SharedMemory(memory_name)
+    session = AnalysisSession(url, selected_filters, **options)
+    # The fps are measured from the first frame on, loading the model would
+    # spoil the estimate of the remaining time.
+    start = None
+    last = None
+
+    def report(index, frame):
+        nonlocal start, last
+        now = time.perf_counter()
+        if start is None:
+            start = now
+        if last is not None and now - last < interval:
+            return
+        last = now
+        frame_height, frame_width = frame.shape[:2]
+        scale = min(width / frame_width, height / frame_height)
+        shape = (max(1, int(frame_height * scale)), max(1, int(frame_width * scale)))
+        small = cv2.resize(frame, shape[::-1], interpolation=cv2.INTER_AREA)
+        with lock:
+            np.ndarray((*shape, 3), np.uint8, memory.buf)[:] = small
+        total = int(session.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = index / (now - start) if now > start else 0.0
+        progress.put(('progress', id, index + 1, total, fps, shape))
+
+    try:
+        session.run(display=False, progress=report, stop_event=cancel_event)
+    except Exception as e:
+        progress.put(('error', id, repr(e)))
+        return False
+    finally:
+        memory.close()
+    return True
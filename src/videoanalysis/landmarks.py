@@ -1,11 +1,14 @@
 from abc import abstractmethod
-from math import acos, degrees, sqrt
-import cv2
+import copy
+from collections.abc import Mapping
 
 from . import utils
+from .frames import PoseLandmark
+from .lazy import lazy_import
 
-import mediapipe as mp
-mp_pose = mp.solutions.pose
+# Loaded on first use, so the filter names can be listed without OpenCV.
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
 
 
 default_style = {
@@ -15,360 +18,503 @@ default_style = {
     'line-width': 5
 }
 
+# Colors of the angle and distance filters.
+good_color = (0, 255, 0)
+bad_color = (0, 0, 255)
+
 class Landmark():
+    """
+    Base class of the filters.
+
+    `apply` runs for every frame, so everything it needs is prepared once:
+    the style is resolved into attributes in `__init__`, and `prepare`
+    allocates the arrays a filter computes its values in. Drawing allocates
+    almost nothing. Since the arrays are reused, one filter object must not
+    draw on two threads at the same time; compile a plan per thread instead
+    (see `videoanalysis.plan.compile_plan`).
+    """
+    __slots__ = ('landmarks', 'style', 'color', 'line_color', 'radius', 'width')
+
     def __init__(self, landmarks, style={}):
         self.landmarks = landmarks
         self.style = default_style.copy()
         for key, val in style.items():
             self.style[key] = val
+        self.color = self.style['color']
+        self.line_color = self.style['line-color']
+        self.radius = self.style['dot-radius']
+        self.width = self.style['line-width']
+        self.prepare()
+
+    def prepare(self):
+        """
+        Called whenever the landmarks of the filter are set.
+        """
+        pass
+
+    def options(self):
+        """
+        Return the parameters of the filter, apart from landmarks and style.
+        """
+        return ()
+
+    def key(self):
+        """
+        Filters with the same key draw in the same way, and only differ in
+        their landmarks.
+        """
+        return (type(self), tuple(sorted(self.style.items())), self.options())
+
+    def with_landmarks(self, landmarks):
+        """
+        Return a copy of the filter that draws the given landmarks.
+        """
+        filt = copy.copy(self)
+        filt.landmarks = list(landmarks)
+        filt.prepare()
+        return filt
+
+    def metrics(self, world):
+        """
+        Calculate the values the filter measures for a whole video at once.
+
+        :world: (frames, 33, 4) array with the world landmarks of every frame.
+
+        Returns a dict that maps the name of every metric to a (frames,) array.
+        """
+        return {}
 
     @abstractmethod
-    def apply(self, res, frame, frame_width, frame_height):
+    def apply(self, lf, frame):
+        """
+        Draw the landmarks of the `videoanalysis.frames.LandmarkFrame` `lf`
+        onto the frame.
+        """
         pass
 
 class PointLandmark(Landmark):
-    def apply(self, res, frame, frame_width, frame_height):
+    __slots__ = ()
+
+    def apply(self, lf, frame):
         for point in self.landmarks:
-            px = utils._get_pixel(point, res, frame_width, frame_height)
-            cv2.circle(frame, px,
-                self.style['dot-radius'],
-                self.style['color'],
-                -1
-            )
+            cv2.circle(frame, lf.pixel(point), self.radius, self.color, -1)
 
 
 class ConnectionLandmark(Landmark):
+    __slots__ = ()
+
     def __init__(self, landmarks, style={}):
         assert(len(landmarks) > 0)
         Landmark.__init__(self, landmarks, style)
 
-    def apply(self, res, frame, frame_width, frame_height):
+    def apply(self, lf, frame):
         for con in self.landmarks:
             if len(con) == 2:
-                px_0 = utils._get_pixel(con[0], res, frame_width, frame_height)
-                px_1 = utils._get_pixel(con[1], res, frame_width, frame_height)
-                cv2.line(frame, px_0, px_1,
-                    self.style['line-color'],
-                    self.style['line-width']
-                )
+                cv2.line(frame, lf.pixel(con[0]), lf.pixel(con[1]),
+                    self.line_color, self.width)
             elif len(con) == 4:
-                px_0 = utils._get_pixel(con[0], res, frame_width, frame_height)
-                px_1 = utils._get_pixel(con[1], res, frame_width, frame_height)
-                px_2 = utils._get_pixel(con[2], res, frame_width, frame_height)
-                px_3 = utils._get_pixel(con[3], res, frame_width, frame_height)
-
-                px_1 = utils._get_midpoint(px_1, px_2)
-                cv2.line(frame, px_0, px_1,
-                    self.style['line-color'],
-                    self.style['line-width']
-                )
-                cv2.line(frame, px_1, px_3,
-                    self.style['line-color'],
-                    self.style['line-width']
-                )
+                px_0 = lf.pixel(con[0])
+                px_1 = utils._get_midpoint(lf.pixel(con[1]), lf.pixel(con[2]))
+                px_3 = lf.pixel(con[3])
 
+                cv2.line(frame, px_0, px_1, self.line_color, self.width)
+                cv2.line(frame, px_1, px_3, self.line_color, self.width)
 
-class ClosePoints(Landmark):
-    def apply(self, res, frame, frame_width, frame_height):
-        for lms in self.landmarks:
-            p0 = res.pose_world_landmarks.landmark[lms[0]]
-            p1 = res.pose_world_landmarks.landmark[lms[1]]
-
-            # Project onto xy-plane
-            v0 = (p0.x, p0.y)
-            v1 = (p1.x, p1.y)
 
-            dist = sqrt((v0[0] - v1[0])**2 + (v0[1] - v1[1])**2)
+class ClosePoints(Landmark):
+    __slots__ = ('indices', 'columns', 'points', 'difference', 'values')
+
+    def prepare(self):
+        self.indices = np.array(self.landmarks, dtype=np.intp).reshape(-1, 2)
+        self.columns = np.ascontiguousarray(self.indices.T)
+        self.points = np.empty(self.columns.shape + (4,), np.float32)
+        self.difference = np.empty((len(self.indices), 2), np.float32)
+        self.values = np.empty(len(self.indices), np.float32)
+
+    def distances(self, world):
+        # Project onto xy-plane
+        v0 = world[..., self.indices[:, 0], :2]
+        v1 = world[..., self.indices[:, 1], :2]
+        return np.linalg.norm(v0 - v1, axis=-1)
+
+    def frame_distances(self, world):
+        """
+        `distances` for the (33, 4) world landmarks of one frame, computed in
+        the arrays of the filter.
+        """
+        points, difference = self.points, self.difference
+        utils._take_rows(world, self.columns, points)
+        np.subtract(points[0, :, :2], points[1, :, :2], out=difference)
+        return np.hypot(difference[:, 0], difference[:, 1], out=self.values)
+
+    def metrics(self, world):
+        dists = self.distances(world)
+        return {'distance_' + _names(lms): dists[:, i]
+                for i, lms in enumerate(self.landmarks)}
+
+    def apply(self, lf, frame):
+        dists = self.frame_distances(lf.world)
+
+        for lms, dist in zip(self.landmarks, dists.tolist()):
+            color = good_color if dist < 0.18 else bad_color
+            cv2.circle(frame, lf.pixel(lms[0]), self.radius, color, -1)
 
-            print(dist)
-            color = (0, 255, 0) if dist < 0.18 else (0, 0, 255)
 
-            px = utils._get_pixel(lms[0], res, frame_width, frame_height)
-            cv2.circle(frame, px,
-                self.style['dot-radius'],
-                color,
-                -1
-            )
+class MidpointLandmark(Landmark):
+    __slots__ = ()
 
+    def metrics(self, world):
+        result = {}
+        for mid in self.landmarks:
+            m = (world[:, mid[0], :3] + world[:, mid[1], :3]) / 2
+            for axis, i in zip('xyz', range(3)):
+                result[f'midpoint_{_names(mid)}_{axis}'] = m[:, i]
+        return result
 
-class MidpointLandmark(Landmark):
-    def apply(self, res, frame, frame_width, frame_height):
+    def apply(self, lf, frame):
         for mid in self.landmarks:
-            px_0 = utils._get_pixel(mid[0], res, frame_width, frame_height)
-            px_1 = utils._get_pixel(mid[1], res, frame_width, frame_height)
+            px_0 = lf.pixel(mid[0])
+            px_1 = lf.pixel(mid[1])
 
             if px_0 != None and px_1 != None:
                 midpoint = utils._get_midpoint(px_0, px_1)
-                cv2.circle(frame, midpoint,
-                    self.style['dot-radius'],
-                    self.style['color'],
-                    -1
-                )
+                cv2.circle(frame, midpoint, self.radius, self.color, -1)
 
 
 class ProlongedLandmark(Landmark):
+    __slots__ = ('lengthen_first', 'lengthen_second')
+
     def __init__(self, landmarks, style={}, lengthen_first=0, lengthen_second=0):
         super().__init__(landmarks, style=style)
         self.lengthen_first = lengthen_first
         self.lengthen_second = lengthen_second
 
-    def apply(self, res, frame, frame_width, frame_height):
+    def options(self):
+        return (self.lengthen_first, self.lengthen_second)
+
+    def apply(self, lf, frame):
         for line in self.landmarks:
-            px_0 = utils._get_pixel(line[0], res, frame_width, frame_height)
-            px_1 = utils._get_pixel(line[1], res, frame_width, frame_height)
+            px_0 = lf.pixel(line[0])
+            px_1 = lf.pixel(line[1])
 
             if px_0 != None and px_1 != None:
-                endpoints = utils._get_endpoints(px_0, px_1, self.lengthen_first, self.lengthen_second)
-                cv2.line(frame, endpoints[0], endpoints[1],
-                    self.style['line-color'],
-                    self.style['line-width']
-                )
+                start, end = utils._get_endpoints(px_0, px_1, self.lengthen_first, self.lengthen_second)
+                cv2.line(frame, start, end, self.line_color, self.width)
 
 
 class AngleLandmark(Landmark):
-    def apply(self, res, frame, frame_width, frame_height):
-        for lms in self.landmarks:
-            p0 = res.pose_world_landmarks.landmark[lms[0]]
-            p1 = res.pose_world_landmarks.landmark[lms[1]]
-            p2 = res.pose_world_landmarks.landmark[lms[2]]
-
-            v1 = (p0.x - p1.x, p0.y - p1.y, p0.z - p1.z)
-            v2 = (p2.x - p1.x, p2.y - p1.y, p2.z - p1.z)
-
-            v1 = utils._normalize(v1)
-            v2 = utils._normalize(v2)
-
-            dotp = v1[0] * v2[0] + v1[1] * v2[1] + v1[2] * v2[2]
-
-            angle = degrees(acos(dotp))
-
-            line_color = (0, 255, 0) if 150 < angle < 210 else (0, 0, 255)
-
-            clm = ConnectionLandmark(
-                landmarks=[(lms[0], lms[1]), (lms[1], lms[2])],
-                style={'line-color': line_color}
-            )
-            clm.apply(res, frame, frame_width, frame_height)
+    __slots__ = ('indices', 'columns', 'points', 'vectors', 'values', 'scratch')
+
+    def prepare(self):
+        self.indices = np.array(self.landmarks, dtype=np.intp).reshape(-1, 3)
+        self.columns = np.ascontiguousarray(self.indices.T)
+        self.points = np.empty(self.columns.shape + (4,), np.float32)
+        self.vectors = np.empty((2, len(self.indices), 3), np.float32)
+        self.values = np.empty(len(self.indices), np.float32)
+        self.scratch = np.empty((2, len(self.indices)), np.float32)
+
+    def angles(self, world):
+        p0 = world[..., self.indices[:, 0], :3]
+        p1 = world[..., self.indices[:, 1], :3]
+        p2 = world[..., self.indices[:, 2], :3]
+        return utils._angles(p0 - p1, p2 - p1)
+
+    def frame_angles(self, world):
+        """
+        `angles` for the (33, 4) world landmarks of one frame, computed in
+        the arrays of the filter.
+        """
+        points, vectors = self.points, self.vectors
+        utils._take_rows(world, self.columns, points)
+        np.subtract(points[0, :, :3], points[1, :, :3], out=vectors[0])
+        np.subtract(points[2, :, :3], points[1, :, :3], out=vectors[1])
+        return utils._angles_into(vectors[0], vectors[1], self.values, self.scratch)
+
+    def metrics(self, world):
+        angles = self.angles(world)
+        return {'angle_' + _names(lms): angles[:, i]
+                for i, lms in enumerate(self.landmarks)}
+
+    def apply(self, lf, frame):
+        angles = self.frame_angles(lf.world)
+
+        # Drawn like a `ConnectionLandmark` of the two segments, in the
+        # color of the angle.
+        for lms, angle in zip(self.landmarks, angles.tolist()):
+            line_color = good_color if 150 < angle < 210 else bad_color
+            px_1 = lf.pixel(lms[1])
+            cv2.line(frame, lf.pixel(lms[0]), px_1, line_color, self.width)
+            cv2.line(frame, px_1, lf.pixel(lms[2]), line_color, self.width)
 
 
 class AngleHIPLandmark(Landmark):
-    def apply(self, res, frame, frame_width, frame_height):
-        for lms in self.landmarks:
-            p0 = res.pose_world_landmarks.landmark[lms[0]]
-            p1 = res.pose_world_landmarks.landmark[lms[1]]
-            p2 = res.pose_world_landmarks.landmark[lms[2]]
-            p3 = res.pose_world_landmarks.landmark[lms[3]]
-
-            m = ((p1.x + p2.x)/2, (p1.y + p2.y)/2, (p1.z + p2.z)/2)
-
-            v1 = (p0.x - m[0], p0.y - m[1], p0.z - m[2])
-            v2 = (p3.x - m[0], p3.y - m[1], p3.z - m[2])
-
-            v1 = utils._normalize(v1)
-            v2 = utils._normalize(v2)
-
-            dotp = v1[0] * v2[0] + v1[1] * v2[1] + v1[2] * v2[2]
-
-            angle = degrees(acos(dotp))
-
-            line_color = (0, 255, 0) if 170 < angle < 190 else (0, 0, 255)
-
-            clm = ConnectionLandmark(
-                landmarks=[(lms[0], lms[1], lms[2], lms[3])],
-                style={'line-color': line_color}
-            )
-            clm.apply(res, frame, frame_width, frame_height)
+    __slots__ = ('indices', 'columns', 'points', 'middle', 'vectors', 'values',
+                 'scratch')
+
+    def prepare(self):
+        self.indices = np.array(self.landmarks, dtype=np.intp).reshape(-1, 4)
+        self.columns = np.ascontiguousarray(self.indices.T)
+        self.points = np.empty(self.columns.shape + (4,), np.float32)
+        self.middle = np.empty((len(self.indices), 3), np.float32)
+        self.vectors = np.empty((2, len(self.indices), 3), np.float32)
+        self.values = np.empty(len(self.indices), np.float32)
+        self.scratch = np.empty((2, len(self.indices)), np.float32)
+
+    def angles(self, world):
+        p0 = world[..., self.indices[:, 0], :3]
+        p3 = world[..., self.indices[:, 3], :3]
+        m = (world[..., self.indices[:, 1], :3] + world[..., self.indices[:, 2], :3]) / 2
+        return utils._angles(p0 - m, p3 - m)
+
+    def frame_angles(self, world):
+        """
+        `angles` for the (33, 4) world landmarks of one frame, computed in
+        the arrays of the filter.
+        """
+        points, middle, vectors = self.points, self.middle, self.vectors
+        utils._take_rows(world, self.columns, points)
+        np.add(points[1, :, :3], points[2, :, :3], out=middle)
+        middle *= 0.5
+        np.subtract(points[0, :, :3], middle, out=vectors[0])
+        np.subtract(points[3, :, :3], middle, out=vectors[1])
+        return utils._angles_into(vectors[0], vectors[1], self.values, self.scratch)
+
+    def metrics(self, world):
+        angles = self.angles(world)
+        return {'angle_' + _names(lms): angles[:, i]
+                for i, lms in enumerate(self.landmarks)}
+
+    def apply(self, lf, frame):
+        angles = self.frame_angles(lf.world)
+
+        # Drawn like a `ConnectionLandmark` through the middle of the second
+        # and third landmark, in the color of the angle.
+        for lms, angle in zip(self.landmarks, angles.tolist()):
+            line_color = good_color if 170 < angle < 190 else bad_color
+            px_1 = utils._get_midpoint(lf.pixel(lms[1]), lf.pixel(lms[2]))
+            cv2.line(frame, lf.pixel(lms[0]), px_1, line_color, self.width)
+            cv2.line(frame, px_1, lf.pixel(lms[3]), line_color, self.width)
 
 
 class ProlongedMidpointsLandmark(Landmark):
+    __slots__ = ('lengthen_first', 'lengthen_second')
+
     def __init__(self, landmarks, style={}, lengthen_first=0, lengthen_second=0):
         super().__init__(landmarks, style=style)
         self.lengthen_first = lengthen_first
         self.lengthen_second = lengthen_second
 
-    def apply(self, res, frame, frame_width, frame_height):
+    def options(self):
+        return (self.lengthen_first, self.lengthen_second)
+
+    def apply(self, lf, frame):
         for line in self.landmarks:
 
-            px_0 = utils._get_pixel(line[0], res, frame_width, frame_height)
-            px_1 = utils._get_pixel(line[1], res, frame_width, frame_height)
-            px_2 = utils._get_pixel(line[2], res, frame_width, frame_height)
-            px_3 = utils._get_pixel(line[3], res, frame_width, frame_height)
+            px_0 = lf.pixel(line[0])
+            px_1 = lf.pixel(line[1])
+            px_2 = lf.pixel(line[2])
+            px_3 = lf.pixel(line[3])
 
             if px_0 != None and px_1 != None and px_2 != None and px_3 != None:
                 m1 = utils._get_midpoint(px_0, px_1)
                 m2 = utils._get_midpoint(px_2, px_3)
 
-                endpoints = utils._get_endpoints(m1, m2, self.lengthen_first, self.lengthen_second)
-                cv2.line(frame, endpoints[0], endpoints[1],
-                    self.style['line-color'],
-                    self.style['line-width']
-                )
+                start, end = utils._get_endpoints(m1, m2, self.lengthen_first, self.lengthen_second)
+                cv2.line(frame, start, end, self.line_color, self.width)
+
+class FilterRegistry(Mapping):
+    """
+    The predefined filters by name. Every entry is given as a function that
+    returns the list of `Landmark` objects, and is only built when it is
+    first looked up. Listing the names builds nothing.
+    """
+    def __init__(self, factories):
+        self.factories = factories
+        self.built = {}
+
+    def __getitem__(self, name):
+        if name not in self.built:
+            self.built[name] = self.factories[name]()
+        return self.built[name]
+
+    def __iter__(self):
+        return iter(self.factories)
+
+    def __len__(self):
+        return len(self.factories)
+
+    def __contains__(self, name):
+        return name in self.factories
+
+
+def _names(landmarks):
+    return '_'.join(PoseLandmark(lm).name for lm in landmarks)
 
-filters = {
-        '3d': [
+filters = FilterRegistry({
+        '3d': lambda: [
             AngleLandmark(
                 landmarks=[(
-                    mp_pose.PoseLandmark.LEFT_SHOULDER,
-                    mp_pose.PoseLandmark.LEFT_ELBOW,
-                    mp_pose.PoseLandmark.LEFT_WRIST,
+                    PoseLandmark.LEFT_SHOULDER,
+                    PoseLandmark.LEFT_ELBOW,
+                    PoseLandmark.LEFT_WRIST,
                     ), (
-                        mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                        mp_pose.PoseLandmark.RIGHT_ELBOW,
-                        mp_pose.PoseLandmark.RIGHT_WRIST,
+                        PoseLandmark.RIGHT_SHOULDER,
+                        PoseLandmark.RIGHT_ELBOW,
+                        PoseLandmark.RIGHT_WRIST,
                         )]
                     ),
             PointLandmark(
                 landmarks=[
-                    mp_pose.PoseLandmark.LEFT_SHOULDER,
-                    mp_pose.PoseLandmark.LEFT_ELBOW,
-                    mp_pose.PoseLandmark.LEFT_WRIST,
+                    PoseLandmark.LEFT_SHOULDER,
+                    PoseLandmark.LEFT_ELBOW,
+                    PoseLandmark.LEFT_WRIST,
                     ]
                 )
             ],
-        'test': [
+        'test': lambda: [
             ProlongedLandmark(
-                landmarks=[(mp_pose.PoseLandmark.LEFT_WRIST, mp_pose.PoseLandmark.RIGHT_WRIST)],
+                landmarks=[(PoseLandmark.LEFT_WRIST, PoseLandmark.RIGHT_WRIST)],
                 lengthen_first=200,
                 )
             ],
-        'box': [
+        'box': lambda: [
             PointLandmark(
                 landmarks=[
-                    mp_pose.PoseLandmark.LEFT_WRIST,
-                    mp_pose.PoseLandmark.RIGHT_WRIST,
-                    mp_pose.PoseLandmark.LEFT_ANKLE,
-                    mp_pose.PoseLandmark.RIGHT_ANKLE,
+                    PoseLandmark.LEFT_WRIST,
+                    PoseLandmark.RIGHT_WRIST,
+                    PoseLandmark.LEFT_ANKLE,
+                    PoseLandmark.RIGHT_ANKLE,
                     ]
                 ),
             ConnectionLandmark(
                 landmarks=[
-                    (mp_pose.PoseLandmark.LEFT_WRIST, mp_pose.PoseLandmark.RIGHT_WRIST),
-                    (mp_pose.PoseLandmark.LEFT_WRIST, mp_pose.PoseLandmark.LEFT_ANKLE),
-                    (mp_pose.PoseLandmark.LEFT_ANKLE, mp_pose.PoseLandmark.RIGHT_ANKLE),
-                    (mp_pose.PoseLandmark.RIGHT_WRIST, mp_pose.PoseLandmark.RIGHT_ANKLE),
+                    (PoseLandmark.LEFT_WRIST, PoseLandmark.RIGHT_WRIST),
+                    (PoseLandmark.LEFT_WRIST, PoseLandmark.LEFT_ANKLE),
+                    (PoseLandmark.LEFT_ANKLE, PoseLandmark.RIGHT_ANKLE),
+                    (PoseLandmark.RIGHT_WRIST, PoseLandmark.RIGHT_ANKLE),
                     ],
                 style={'color': (255, 255, 0)}
                 ),
             MidpointLandmark(
                 landmarks=[
-                    (mp_pose.PoseLandmark.LEFT_HIP, mp_pose.PoseLandmark.RIGHT_HIP)
+                    (PoseLandmark.LEFT_HIP, PoseLandmark.RIGHT_HIP)
                     ]
                 )
             ],
-        'straight_arms': [
+        'straight_arms': lambda: [
                 PointLandmark(
                     landmarks=[
-                        mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                        mp_pose.PoseLandmark.RIGHT_ELBOW,
-                        mp_pose.PoseLandmark.RIGHT_WRIST,
-                        mp_pose.PoseLandmark.LEFT_SHOULDER,
-                        mp_pose.PoseLandmark.LEFT_ELBOW,
-                        mp_pose.PoseLandmark.LEFT_WRIST,
+                        PoseLandmark.RIGHT_SHOULDER,
+                        PoseLandmark.RIGHT_ELBOW,
+                        PoseLandmark.RIGHT_WRIST,
+                        PoseLandmark.LEFT_SHOULDER,
+                        PoseLandmark.LEFT_ELBOW,
+                        PoseLandmark.LEFT_WRIST,
                         ]
                     ),
                 ConnectionLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER, mp_pose.PoseLandmark.RIGHT_ELBOW),
-                        (mp_pose.PoseLandmark.RIGHT_ELBOW, mp_pose.PoseLandmark.RIGHT_WRIST),
-                        (mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.LEFT_ELBOW),
-                        (mp_pose.PoseLandmark.LEFT_ELBOW, mp_pose.PoseLandmark.LEFT_WRIST),
+                        (PoseLandmark.RIGHT_SHOULDER, PoseLandmark.RIGHT_ELBOW),
+                        (PoseLandmark.RIGHT_ELBOW, PoseLandmark.RIGHT_WRIST),
+                        (PoseLandmark.LEFT_SHOULDER, PoseLandmark.LEFT_ELBOW),
+                        (PoseLandmark.LEFT_ELBOW, PoseLandmark.LEFT_WRIST),
                         ]
                     )
                 ],
-        'setter': [
+        'setter': lambda: [
                 ProlongedLandmark(
-                    landmarks=[(mp_pose.PoseLandmark.RIGHT_SHOULDER, mp_pose.PoseLandmark.RIGHT_HIP)],
+                    landmarks=[(PoseLandmark.RIGHT_SHOULDER, PoseLandmark.RIGHT_HIP)],
                     lengthen_second=200,
                     )
                 ],
-        'middle_axis': [
+        'middle_axis': lambda: [
                 ProlongedMidpointsLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.RIGHT_HIP,
-                            mp_pose.PoseLandmark.LEFT_HIP),
+                        (PoseLandmark.RIGHT_SHOULDER,
+                            PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.RIGHT_HIP,
+                            PoseLandmark.LEFT_HIP),
                         ],
                     lengthen_second=200,
                     style={'line-color': (255,0,255)}
                     )
                 ],
 
-    'Badminton': [
+    'Badminton': lambda: [
             AngleLandmark(
                 landmarks=[(
-                    mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                    mp_pose.PoseLandmark.RIGHT_ELBOW,
-                    mp_pose.PoseLandmark.RIGHT_WRIST,
+                    PoseLandmark.RIGHT_SHOULDER,
+                    PoseLandmark.RIGHT_ELBOW,
+                    PoseLandmark.RIGHT_WRIST,
                     )],) ,
 
                 PointLandmark(
                     landmarks=[
-                        mp_pose.PoseLandmark.RIGHT_WRIST,
+                        PoseLandmark.RIGHT_WRIST,
                         ]
                     ) ,
                 ProlongedMidpointsLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.RIGHT_HIP,
-                            mp_pose.PoseLandmark.LEFT_HIP),
+                        (PoseLandmark.RIGHT_SHOULDER,
+                            PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.RIGHT_HIP,
+                            PoseLandmark.LEFT_HIP),
                         ],
                     lengthen_second=200 ,
                     style={'color': (255, 0, 255)}
                     )
                 ],
 
-    'Fuss_Huefte_Schulter_Winkel': [
+    'Fuss_Huefte_Schulter_Winkel': lambda: [
             AngleHIPLandmark(
                 landmarks=[(
-                    mp_pose.PoseLandmark.RIGHT_WRIST,
-                    mp_pose.PoseLandmark.RIGHT_HIP,
-                    mp_pose.PoseLandmark.LEFT_HIP,
-                    mp_pose.PoseLandmark.LEFT_ANKLE,
+                    PoseLandmark.RIGHT_WRIST,
+                    PoseLandmark.RIGHT_HIP,
+                    PoseLandmark.LEFT_HIP,
+                    PoseLandmark.LEFT_ANKLE,
                     )]
                 ),
             ],
-    'Handstand3': [
+    'Handstand3': lambda: [
             AngleLandmark(
                 landmarks=[(
-                    mp_pose.PoseLandmark.LEFT_ANKLE,
-                    mp_pose.PoseLandmark.LEFT_SHOULDER,
-                    mp_pose.PoseLandmark.LEFT_WRIST,
+                    PoseLandmark.LEFT_ANKLE,
+                    PoseLandmark.LEFT_SHOULDER,
+                    PoseLandmark.LEFT_WRIST,
                     ), ]
                 ),
             PointLandmark(
                 landmarks=[
-                    mp_pose.PoseLandmark.LEFT_ANKLE,
-                    mp_pose.PoseLandmark.LEFT_SHOULDER,
-                    mp_pose.PoseLandmark.LEFT_WRIST,
+                    PoseLandmark.LEFT_ANKLE,
+                    PoseLandmark.LEFT_SHOULDER,
+                    PoseLandmark.LEFT_WRIST,
                     ]
                 )],
 
-'Hdst4': [
+'Hdst4': lambda: [
         AngleLandmark(
             landmarks=[(
-                mp_pose.PoseLandmark.LEFT_HIP,
-                mp_pose.PoseLandmark.LEFT_SHOULDER,
-                mp_pose.PoseLandmark.LEFT_WRIST,
+                PoseLandmark.LEFT_HIP,
+                PoseLandmark.LEFT_SHOULDER,
+                PoseLandmark.LEFT_WRIST,
 
-                ), (mp_pose.PoseLandmark.LEFT_ANKLE,
-                    mp_pose.PoseLandmark.LEFT_SHOULDER,
-                    mp_pose.PoseLandmark.LEFT_WRIST,
+                ), (PoseLandmark.LEFT_ANKLE,
+                    PoseLandmark.LEFT_SHOULDER,
+                    PoseLandmark.LEFT_WRIST,
                     ) ]
                 ),
         PointLandmark(
             landmarks=[
-                mp_pose.PoseLandmark.LEFT_HIP,
-                mp_pose.PoseLandmark.LEFT_SHOULDER,
-                mp_pose.PoseLandmark.LEFT_WRIST,
-                mp_pose.PoseLandmark.LEFT_ANKLE
+                PoseLandmark.LEFT_HIP,
+                PoseLandmark.LEFT_SHOULDER,
+                PoseLandmark.LEFT_WRIST,
+                PoseLandmark.LEFT_ANKLE
                 ]
             )],
 
-        'Hilfslinie': [
+        'Hilfslinie': lambda: [
                 ProlongedLandmark(
-                    landmarks=[(mp_pose.PoseLandmark.RIGHT_SHOULDER, mp_pose.PoseLandmark.RIGHT_WRIST)],
+                    landmarks=[(PoseLandmark.RIGHT_SHOULDER, PoseLandmark.RIGHT_WRIST)],
                     lengthen_second=300,
                     style={
                         "line-color": (0, 200, 200),
@@ -377,34 +523,34 @@ filters = {
                     ),
                 ConnectionLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_WRIST, mp_pose.PoseLandmark.RIGHT_SHOULDER),
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER, mp_pose.PoseLandmark.RIGHT_HIP),
-                        (mp_pose.PoseLandmark.RIGHT_HIP, mp_pose.PoseLandmark.RIGHT_ANKLE),
+                        (PoseLandmark.RIGHT_WRIST, PoseLandmark.RIGHT_SHOULDER),
+                        (PoseLandmark.RIGHT_SHOULDER, PoseLandmark.RIGHT_HIP),
+                        (PoseLandmark.RIGHT_HIP, PoseLandmark.RIGHT_ANKLE),
                         ]
                     )
                 ],
-        'close': [
+        'close': lambda: [
                 ClosePoints(landmarks=[(
-                    mp_pose.PoseLandmark.RIGHT_WRIST,
-                    mp_pose.PoseLandmark.LEFT_WRIST,
+                    PoseLandmark.RIGHT_WRIST,
+                    PoseLandmark.LEFT_WRIST,
                     )])
                 ],
-        'con': [
+        'con': lambda: [
                 ConnectionLandmark(landmarks=[(
-                    mp_pose.PoseLandmark.RIGHT_ANKLE,
-                    mp_pose.PoseLandmark.RIGHT_HIP,
-                    mp_pose.PoseLandmark.LEFT_HIP,
-                    mp_pose.PoseLandmark.LEFT_WRIST,
+                    PoseLandmark.RIGHT_ANKLE,
+                    PoseLandmark.RIGHT_HIP,
+                    PoseLandmark.LEFT_HIP,
+                    PoseLandmark.LEFT_WRIST,
                     )])
                 ],
 
-        'middle_axis2': [
+        'middle_axis2': lambda: [
                 ProlongedMidpointsLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.RIGHT_HIP,
-                            mp_pose.PoseLandmark.LEFT_HIP),
+                        (PoseLandmark.RIGHT_SHOULDER,
+                            PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.RIGHT_HIP,
+                            PoseLandmark.LEFT_HIP),
                         ],
                     lengthen_second=200
                     ),
@@ -412,21 +558,21 @@ filters = {
                 AngleLandmark(
                     landmarks=[
 
-                        (mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_ELBOW,
-                            mp_pose.PoseLandmark.LEFT_WRIST,
+                        (PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.LEFT_ELBOW,
+                            PoseLandmark.LEFT_WRIST,
                             )]
                         ),
 
                 ],
 
-        'middle_axis3': [
+        'middle_axis3': lambda: [
                 ProlongedMidpointsLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                            mp_pose.PoseLandmark.RIGHT_ANKLE,
-                            mp_pose.PoseLandmark.RIGHT_HIP,
-                            mp_pose.PoseLandmark.LEFT_HIP),
+                        (PoseLandmark.RIGHT_SHOULDER,
+                            PoseLandmark.RIGHT_ANKLE,
+                            PoseLandmark.RIGHT_HIP,
+                            PoseLandmark.LEFT_HIP),
                         ],
                     lengthen_second=200
                     ),
@@ -434,28 +580,28 @@ filters = {
                 AngleLandmark(
                     landmarks=[
 
-                        (mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_ELBOW,
-                            mp_pose.PoseLandmark.LEFT_WRIST,
+                        (PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.LEFT_ELBOW,
+                            PoseLandmark.LEFT_WRIST,
                             )]
                         ),
 
                 ],
 
-        'Gestreckter Arm Verlängerung rechts Tennis': [
+        'Gestreckter Arm Verlängerung rechts Tennis': lambda: [
 
                 PointLandmark(
                     landmarks=[
-                        mp_pose.PoseLandmark.LEFT_SHOULDER,
-                        mp_pose.PoseLandmark.LEFT_ELBOW,
-                        mp_pose.PoseLandmark.LEFT_WRIST,
+                        PoseLandmark.LEFT_SHOULDER,
+                        PoseLandmark.LEFT_ELBOW,
+                        PoseLandmark.LEFT_WRIST,
                         ]
                     ),
                 ProlongedLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_ELBOW,
-                            mp_pose.PoseLandmark.LEFT_WRIST),
+                        (PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.LEFT_ELBOW,
+                            PoseLandmark.LEFT_WRIST),
                         ],
                     lengthen_first=300,
                     style = {
@@ -466,8 +612,8 @@ filters = {
 
                 ConnectionLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.LEFT_ELBOW),
-                        (mp_pose.PoseLandmark.LEFT_ELBOW, mp_pose.PoseLandmark.LEFT_WRIST),
+                        (PoseLandmark.LEFT_SHOULDER, PoseLandmark.LEFT_ELBOW),
+                        (PoseLandmark.LEFT_ELBOW, PoseLandmark.LEFT_WRIST),
                         ],
 
                     ),
@@ -475,26 +621,26 @@ filters = {
                 AngleLandmark (
                     landmarks=[
 
-                        (mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_ELBOW,
-                            mp_pose.PoseLandmark.LEFT_WRIST),
+                        (PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.LEFT_ELBOW,
+                            PoseLandmark.LEFT_WRIST),
                         ],
                     )],
 
-            'Gestreckter Arm Verlängerung rechts Badminton': [
+            'Gestreckter Arm Verlängerung rechts Badminton': lambda: [
 
                     PointLandmark(
                         landmarks=[
-                            mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_ELBOW,
-                            mp_pose.PoseLandmark.LEFT_WRIST,
+                            PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.LEFT_ELBOW,
+                            PoseLandmark.LEFT_WRIST,
                             ]
                         ),
                     ProlongedLandmark(
                         landmarks=[
-                            (mp_pose.PoseLandmark.LEFT_SHOULDER,
-                                mp_pose.PoseLandmark.LEFT_ELBOW,
-                                mp_pose.PoseLandmark.LEFT_WRIST),
+                            (PoseLandmark.LEFT_SHOULDER,
+                                PoseLandmark.LEFT_ELBOW,
+                                PoseLandmark.LEFT_WRIST),
                             ],
                         lengthen_first=250,
                         style = {
@@ -505,8 +651,8 @@ filters = {
 
                     ConnectionLandmark(
                         landmarks=[
-                            (mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.LEFT_ELBOW),
-                            (mp_pose.PoseLandmark.LEFT_ELBOW, mp_pose.PoseLandmark.LEFT_WRIST),
+                            (PoseLandmark.LEFT_SHOULDER, PoseLandmark.LEFT_ELBOW),
+                            (PoseLandmark.LEFT_ELBOW, PoseLandmark.LEFT_WRIST),
                             ],
 
                         ),
@@ -514,26 +660,26 @@ filters = {
                     AngleLandmark (
                         landmarks=[
 
-                            (mp_pose.PoseLandmark.LEFT_SHOULDER,
-                                mp_pose.PoseLandmark.LEFT_ELBOW,
-                                mp_pose.PoseLandmark.LEFT_WRIST),
+                            (PoseLandmark.LEFT_SHOULDER,
+                                PoseLandmark.LEFT_ELBOW,
+                                PoseLandmark.LEFT_WRIST),
                             ],
                         )],
 
-            'Gestreckter Arm Verlängerung links Tennis': [
+            'Gestreckter Arm Verlängerung links Tennis': lambda: [
 
                     PointLandmark(
                         landmarks=[
-                            mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                            mp_pose.PoseLandmark.RIGHT_ELBOW,
-                            mp_pose.PoseLandmark.RIGHT_WRIST,
+                            PoseLandmark.RIGHT_SHOULDER,
+                            PoseLandmark.RIGHT_ELBOW,
+                            PoseLandmark.RIGHT_WRIST,
                             ]
                         ),
                     ProlongedLandmark(
                         landmarks=[
-                            (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                                mp_pose.PoseLandmark.RIGHT_ELBOW,
-                                mp_pose.PoseLandmark.RIGHT_WRIST),
+                            (PoseLandmark.RIGHT_SHOULDER,
+                                PoseLandmark.RIGHT_ELBOW,
+                                PoseLandmark.RIGHT_WRIST),
                             ],
                         lengthen_first=300,
                         style = {
@@ -544,8 +690,8 @@ filters = {
 
                     ConnectionLandmark(
                         landmarks=[
-                            (mp_pose.PoseLandmark.RIGHT_SHOULDER, mp_pose.PoseLandmark.RIGHT_ELBOW),
-                            (mp_pose.PoseLandmark.RIGHT_ELBOW, mp_pose.PoseLandmark.RIGHT_WRIST),
+                            (PoseLandmark.RIGHT_SHOULDER, PoseLandmark.RIGHT_ELBOW),
+                            (PoseLandmark.RIGHT_ELBOW, PoseLandmark.RIGHT_WRIST),
                             ],
 
                         ),
@@ -553,26 +699,26 @@ filters = {
                     AngleLandmark (
                         landmarks=[
 
-                            (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                                mp_pose.PoseLandmark.RIGHT_ELBOW,
-                                mp_pose.PoseLandmark.RIGHT_WRIST),
+                            (PoseLandmark.RIGHT_SHOULDER,
+                                PoseLandmark.RIGHT_ELBOW,
+                                PoseLandmark.RIGHT_WRIST),
                             ],
                         )],
 
-'Gestreckter Arm Verlängerung links Badminton': [
+'Gestreckter Arm Verlängerung links Badminton': lambda: [
 
         PointLandmark(
             landmarks=[
-                mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                mp_pose.PoseLandmark.RIGHT_ELBOW,
-                mp_pose.PoseLandmark.RIGHT_WRIST,
+                PoseLandmark.RIGHT_SHOULDER,
+                PoseLandmark.RIGHT_ELBOW,
+                PoseLandmark.RIGHT_WRIST,
                 ]
             ),
         ProlongedLandmark(
             landmarks=[
-                (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                    mp_pose.PoseLandmark.RIGHT_ELBOW,
-                    mp_pose.PoseLandmark.RIGHT_WRIST),
+                (PoseLandmark.RIGHT_SHOULDER,
+                    PoseLandmark.RIGHT_ELBOW,
+                    PoseLandmark.RIGHT_WRIST),
                 ],
             lengthen_first=250,
             style = {
@@ -583,8 +729,8 @@ filters = {
 
         ConnectionLandmark(
             landmarks=[
-                (mp_pose.PoseLandmark.RIGHT_SHOULDER, mp_pose.PoseLandmark.RIGHT_ELBOW),
-                (mp_pose.PoseLandmark.RIGHT_ELBOW, mp_pose.PoseLandmark.RIGHT_WRIST),
+                (PoseLandmark.RIGHT_SHOULDER, PoseLandmark.RIGHT_ELBOW),
+                (PoseLandmark.RIGHT_ELBOW, PoseLandmark.RIGHT_WRIST),
                 ],
 
             ),
@@ -592,43 +738,43 @@ filters = {
         AngleLandmark (
             landmarks=[
 
-                (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                    mp_pose.PoseLandmark.RIGHT_ELBOW,
-                    mp_pose.PoseLandmark.RIGHT_WRIST),
+                (PoseLandmark.RIGHT_SHOULDER,
+                    PoseLandmark.RIGHT_ELBOW,
+                    PoseLandmark.RIGHT_WRIST),
                 ],
             )],
 
-        'empty': [
+        'empty': lambda: [
                 ProlongedMidpointsLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.RIGHT_HIP,
-                            mp_pose.PoseLandmark.LEFT_HIP),
+                        (PoseLandmark.RIGHT_SHOULDER,
+                            PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.RIGHT_HIP,
+                            PoseLandmark.LEFT_HIP),
                         ],
                     lengthen_second=200
                     ),
 
                 AngleLandmark(
                     landmarks=[
-                        (mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                            mp_pose.PoseLandmark.RIGHT_ELBOW,
-                            mp_pose.PoseLandmark.RIGHT_WRIST,),
+                        (PoseLandmark.RIGHT_SHOULDER,
+                            PoseLandmark.RIGHT_ELBOW,
+                            PoseLandmark.RIGHT_WRIST,),
 
-                        (mp_pose.PoseLandmark.LEFT_SHOULDER,
-                            mp_pose.PoseLandmark.LEFT_ELBOW,
-                            mp_pose.PoseLandmark.LEFT_WRIST,
+                        (PoseLandmark.LEFT_SHOULDER,
+                            PoseLandmark.LEFT_ELBOW,
+                            PoseLandmark.LEFT_WRIST,
                             )]
                         ),
                 PointLandmark(
                     landmarks=[
-                        mp_pose.PoseLandmark.LEFT_SHOULDER,
-                        mp_pose.PoseLandmark.LEFT_ELBOW,
-                        mp_pose.PoseLandmark.LEFT_WRIST,
-                        mp_pose.PoseLandmark.RIGHT_SHOULDER,
-                        mp_pose.PoseLandmark.RIGHT_ELBOW,
-                        mp_pose.PoseLandmark.RIGHT_WRIST,
+                        PoseLandmark.LEFT_SHOULDER,
+                        PoseLandmark.LEFT_ELBOW,
+                        PoseLandmark.LEFT_WRIST,
+                        PoseLandmark.RIGHT_SHOULDER,
+                        PoseLandmark.RIGHT_ELBOW,
+                        PoseLandmark.RIGHT_WRIST,
                         ]
                     )
                 ]
-        }
+        })
@@ -0,0 +1,27 @@
+"""
+Lazy imports of the heavy dependencies.
+
+A module imported with `lazy_import` is registered in `sys.modules` right
+away, but only executed when one of its attributes is used first. Later
+`import` statements of the same module get the lazy module as well, so they
+cost nothing until the module is actually needed.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Return the module `name`, loading it on first attribute access.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
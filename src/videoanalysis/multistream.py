@@ -0,0 +1,313 @@
+"""
+Analysis of several cameras or videos at the same time.
+
+Every source gets its own capture thread, pose backend, filter plan and
+output file. The pose inference runs on a pool of worker threads that is
+shared by all streams. A stream with a new frame queues itself at the end of
+a single ready queue, and a worker takes the stream at the front, analyzes
+one frame and puts the stream back at the end if more frames are waiting.
+Every stream therefore gets its turn once per round, and a slow stream can
+hold at most one worker at a time.
+
+Only one frame of a stream is analyzed at a time, so the frames of every
+stream stay in order and the pose tracking sees them in sequence. Live
+sources keep only their newest frame, video files wait until their frame was
+taken so no frame is lost.
+
+The main thread shows the latest frame of every stream in a tiled window.
+"""
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from .analyze import open_capture, open_cache, open_writer, estimate_pose
+from .backends import create_backend
+from .plan import compile_plan
+
+
+class Stream():
+    """
+    One source with its own backend, plan and writer.
+
+    :url: A video file, 'live' for the default camera or the number of a
+    camera.
+
+    :filename: Name of the analyzed video, see `stream_filename`.
+    """
+    def __init__(self, url, plan, backend, directory='analyzed', cache=None,
+                 writer_options={}, filename=None):
+        self.url = url
+        self.plan = plan
+        self.backend = backend
+        self.name = filename or stream_filename(url)
+        self.live = url == 'live' or url.isdigit()
+        if url.isdigit():
+            self.cap, _ = open_capture('webcam', webcam=int(url))
+        else:
+            self.cap, _ = open_capture(url)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open {url}")
+        self.reader, self.cache_writer = open_cache(
+            cache, 'live' if self.live else url, backend=backend)
+        self.out, _ = open_writer(self.cap, plan.name, self.name, directory,
+                                  **writer_options)
+
+        self.cond = threading.Condition()
+        self.pending = deque()
+        self.scheduled = False
+        self.closed = False
+        self.finished = False
+        self.latest = None
+
+        self.captured = 0
+        self.analyzed = 0
+        self.written = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self.error = None
+
+    def done(self):
+        with self.cond:
+            return self.closed and not self.pending and not self.scheduled
+
+    def stats(self):
+        return {
+            'source': self.url,
+            'output': self.name,
+            'frames': self.captured,
+            'analyzed': self.analyzed,
+            'written': self.written,
+            'dropped': self.dropped,
+            'busy': self.busy,
+            'fps': self.analyzed / self.busy if self.busy > 0 else 0.0,
+            'error': None if self.error is None else repr(self.error),
+        }
+
+
+class StreamScheduler():
+    """
+    Runs the capture threads of all streams and the shared pool of
+    `workers` inference threads.
+    """
+    def __init__(self, streams, workers=None):
+        self.streams = streams
+        self.workers = workers or os.cpu_count() or 1
+        self.ready = queue.Queue()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for stream in self.streams:
+            self.threads.append(threading.Thread(
+                target=self._capture, args=(stream,), name=f'capture-{stream.name}',
+                daemon=True))
+        for i in range(self.workers):
+            self.threads.append(threading.Thread(
+                target=self._work, name=f'inference-{i}', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def done(self):
+        return all(stream.done() for stream in self.streams)
+
+    def stop(self):
+        self.stop_event.set()
+        for stream in self.streams:
+            with stream.cond:
+                stream.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def _capture(self, stream):
+        index = -1
+        try:
+            while not self.stop_event.is_set() and stream.error is None:
+                ret, frame = stream.cap.read()
+                if not ret:
+                    stream.finished = True
+                    break
+                index += 1
+                if stream.url == 'live':
+                    frame = cv2.flip(frame, 1)
+
+                with stream.cond:
+                    stream.captured += 1
+                    if stream.live:
+                        # Only the newest frame of a camera is worth analyzing.
+                        stream.dropped += len(stream.pending)
+                        stream.pending.clear()
+                    else:
+                        while stream.pending and not self.stop_event.is_set():
+                            stream.cond.wait(0.1)
+                    stream.pending.append((index, frame))
+                    schedule = not stream.scheduled
+                    stream.scheduled = True
+                if schedule:
+                    self.ready.put(stream)
+        except Exception as e:
+            stream.error = e
+        finally:
+            with stream.cond:
+                stream.closed = True
+
+    def _work(self):
+        while not self.stop_event.is_set():
+            try:
+                stream = self.ready.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            with stream.cond:
+                item = stream.pending.popleft() if stream.pending else None
+                stream.cond.notify_all()
+            if item is not None and stream.error is None:
+                try:
+                    self._analyze(stream, *item)
+                except Exception as e:
+                    stream.error = e
+
+            with stream.cond:
+                requeue = bool(stream.pending)
+                stream.scheduled = requeue
+            if requeue:
+                # Back to the end of the queue, behind the other streams.
+                self.ready.put(stream)
+
+    def _analyze(self, stream, index, frame):
+        start = time.perf_counter()
+        lf = estimate_pose(stream.backend, frame, index, stream.reader,
+                           stream.cache_writer)
+        stream.analyzed += 1
+        if lf is not None:
+            stream.plan.apply(lf, frame)
+            stream.out.write(frame)
+            stream.written += 1
+            stream.latest = frame
+        stream.busy += time.perf_counter() - start
+
+
+def analyze_streams(sources, workers=None, directory='analyzed', cache=None,
+                    writer_options={}, backend_options={}, preview=True,
+                    tile_size=(640, 360)):
+    """
+    Analyze several sources at the same time.
+
+    :sources: List of (url, selected_filters) pairs. The url is a video
+    file, 'live' or the number of a camera.
+
+    :workers: Number of inference threads shared by all streams, by default
+    one per core.
+
+    :backend_options: Arguments for `videoanalysis.backends.create_backend`.
+    Every stream gets its own backend, since the pose tracking depends on the
+    previous frames of the stream.
+
+    :preview: Show the latest frame of every stream in a tiled window. ESC
+    stops all streams.
+
+    Returns a list with the statistics of every stream.
+    """
+    plans = [compile_plan(selected_filters) for _, selected_filters in sources]
+    filenames = [stream_filename(url) for url, _ in sources]
+    for i, filename in enumerate(filenames):
+        if filenames.count(filename) > 1:
+            # Two sources with the same file name, e.g. from two folders.
+            filenames[i] = f'{i}_{filename}'
+
+    streams = []
+    try:
+        for (url, _), plan, filename in zip(sources, plans, filenames):
+            streams.append(Stream(url, plan, create_backend(**backend_options),
+                                  directory, cache, writer_options, filename))
+    except Exception:
+        for stream in streams:
+            stream.cap.release()
+            stream.out.release()
+        raise
+
+    scheduler = StreamScheduler(streams, workers)
+    start = time.perf_counter()
+    scheduler.start()
+    if preview:
+        cv2.namedWindow('streams', cv2.WINDOW_NORMAL)
+    try:
+        while not scheduler.done():
+            if preview:
+                cv2.imshow('streams', tile([s.latest for s in streams],
+                                           [s.name for s in streams], tile_size))
+                if cv2.waitKey(30) & 0xFF == 27:
+                    break
+            else:
+                time.sleep(0.05)
+    finally:
+        scheduler.stop()
+        elapsed = time.perf_counter() - start
+        for stream in streams:
+            # Only a complete run may be cached.
+            if (stream.cache_writer is not None and stream.finished
+                    and stream.analyzed == stream.captured):
+                stream.cache_writer.commit()
+            stream.cap.release()
+            stream.out.release()
+            stream.backend.close()
+        if preview:
+            cv2.destroyWindow('streams')
+
+    results = [stream.stats() for stream in streams]
+    for result in results:
+        print_result(result)
+    frames = sum(r['analyzed'] for r in results)
+    print(f"{len(streams)} streams, {frames} frames in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed > 0 else 0.0:.1f} fps)")
+    return results
+
+
+def stream_filename(url):
+    """
+    Return the file name the analyzed video of a source is stored under.
+    """
+    if url.isdigit():
+        return f'camera{url}.mp4'
+    if url == 'live':
+        return 'live.mp4'
+    return os.path.basename(url)
+
+
+def tile(frames, labels, tile_size=(640, 360)):
+    """
+    Arrange the frames in a grid of tiles of `tile_size`, keeping their
+    aspect ratio. Missing frames (None) are left black.
+    """
+    tile_width, tile_height = tile_size
+    cols = math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / cols)
+    grid = np.zeros((rows * tile_height, cols * tile_width, 3), np.uint8)
+    for i, (frame, label) in enumerate(zip(frames, labels)):
+        x0 = (i % cols) * tile_width
+        y0 = (i // cols) * tile_height
+        if frame is not None:
+            frame_height, frame_width = frame.shape[:2]
+            scale = min(tile_width / frame_width, tile_height / frame_height)
+            width = max(1, int(frame_width * scale))
+            height = max(1, int(frame_height * scale))
+            x = x0 + (tile_width - width) // 2
+            y = y0 + (tile_height - height) // 2
+            grid[y:y + height, x:x + width] = cv2.resize(
+                frame, (width, height), interpolation=cv2.INTER_AREA)
+        cv2.putText(grid, label, (x0 + 10, y0 + 25), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7, (255, 255, 255), 2)
+    return grid
+
+
+def print_result(result):
+    if result['error'] is not None:
+        print(f"FAILED {result['source']}: {result['error']}")
+    else:
+        print(f"{result['source']}: {result['analyzed']} of {result['frames']} frames "
+              f"analyzed, {result['dropped']} dropped ({result['fps']:.1f} fps)")
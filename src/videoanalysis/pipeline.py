@@ -0,0 +1,243 @@
+"""
+Pipelined version of the analysis loop.
+
+Capture, pose inference, rendering and encoding each run on their own thread
+and hand frames to the next stage through bounded queues. Decoding and
+encoding therefore overlap with the pose inference instead of adding to it.
+Every stage is a single worker reading from a FIFO queue, so frames leave the
+pipeline in the order they were captured.
+
+The window is shown on the calling thread, since most GUI backends of OpenCV
+only work from the main thread. It gets the newest encoded frame at the
+refresh rate of `videoanalysis.display.Preview`, so a slow window drops
+frames from the preview but never holds up the pipeline.
+"""
+import queue
+import threading
+import time
+
+from .instrumentation import disabled
+
+_END = object()
+
+
+class Stage(threading.Thread):
+    """
+    A pipeline stage that takes items from `inbox`, passes them through
+    `func` and puts the result into `outbox`.
+
+    If `inbox` is None the stage is a source and `func` is called without
+    arguments until it raises StopIteration. Returning None from `func` drops
+    the item.
+
+    The time `func` takes is recorded in `metrics` under the name of the stage.
+    """
+    def __init__(self, name, func, inbox, outbox, stop_event, metrics=disabled):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop_event = stop_event
+        self.metrics = metrics
+        self.frames = 0
+        self.busy = 0.0
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                if self.inbox is None:
+                    item = None
+                else:
+                    item = self._get()
+                    if item is _END:
+                        break
+
+                start = time.perf_counter()
+                try:
+                    result = self.func() if self.inbox is None else self.func(item)
+                except StopIteration:
+                    break
+                self.busy += time.perf_counter() - start
+                self.metrics.record(self.name, start)
+                self.frames += 1
+
+                if result is not None and self.outbox is not None:
+                    self._put(result)
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+        finally:
+            if self.outbox is not None:
+                self._put(_END)
+
+    def _get(self):
+        while not self.stop_event.is_set():
+            try:
+                return self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _put(self, item):
+        while True:
+            try:
+                self.outbox.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                # Nobody will read the item anymore once we are stopped.
+                if self.stop_event.is_set():
+                    return
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'busy': self.busy,
+            'fps': self.frames / self.busy if self.busy > 0 else 0.0,
+        }
+
+
+def analyze_pipelined(session, queue_size=8):
+    """
+    Run an `videoanalysis.analyze.AnalysisSession` like `session.run`, but
+    with every stage on its own thread.
+
+    :queue_size: Maximum number of frames waiting between two stages.
+
+    The encode stage already has its own thread, so the writer of the session
+    never gets one. Besides the stage latencies the metrics of the session
+    get the depth of every queue. The overlay is only drawn onto the
+    displayed and streamed frames, since they are already encoded.
+
+    Returns a dict with the throughput of every stage.
+    """
+    session.writer_options = dict(session.writer_options, background=False)
+    session.open()
+    preview = session.preview.open()
+
+    metrics = session.metrics
+    stop_event = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(3)]
+    index = -1
+    finished = False
+
+    def capture():
+        nonlocal index, finished
+        while True:
+            ret, frame = session.read_frame(index + 1)
+            if not ret:
+                finished = True
+                raise StopIteration
+            index += 1
+            if frame is None:
+                metrics.count('absent')
+                continue
+            item = session.prepare_frame(frame, index)
+            session.observe_buffer()
+            if item is not None:
+                return item
+
+    def inference(item):
+        n, frame = item
+        if not session.present(n):
+            metrics.count('absent')
+            session.evaluate_rules(n, None)
+            session.record(frame, None)
+            return n, frame, None, None
+        lf = session.estimate_pose(frame, n)
+        # The rules see every frame in order here, the render stage only
+        # draws the labels as they were at this frame.
+        session.evaluate_rules(n, lf)
+        if lf is None:
+            metrics.count('no_pose')
+            if not session.copies_all():
+                return None
+        session.record(frame, lf)
+        labels = None if session.rules is None else session.rules.labels()
+        return n, frame, lf, labels
+
+    def render(item):
+        n, frame, lf, labels = item
+        if lf is not None:
+            session.plan.apply(lf, frame)
+            session.draw_rules(frame, labels)
+        return n, frame
+
+    def encode(item):
+        frame = item[1]
+        session.out.write(frame)
+        for stage, q in zip(stages, queues):
+            metrics.gauge(f'{stage.name}_queue', q.qsize())
+        metrics.frame_done(frame)
+        if session.stream is not None:
+            session.stream.publish(frame)
+        # The last stage, the window takes the newest frame when it is due.
+        preview.offer(frame)
+
+    stages = [
+        Stage('capture', capture, None, queues[0], stop_event, metrics),
+        Stage('inference', inference, queues[0], queues[1], stop_event, metrics),
+        Stage('render', render, queues[1], queues[2], stop_event, metrics),
+        Stage('encode', encode, queues[2], None, stop_event, metrics),
+    ]
+
+    start = time.perf_counter()
+    for stage in stages:
+        stage.start()
+
+    displayed = 0
+    display_busy = 0.0
+    while not stop_event.is_set() and stages[-1].is_alive():
+        frame = preview.take(timeout=0.1)
+        t = time.perf_counter()
+        if frame is not None:
+            preview.show(session.display_frame(frame))
+            displayed += 1
+        # Keys are handled also while no new frame arrives.
+        key_code = preview.poll()
+        display_busy += time.perf_counter() - t
+        if frame is not None:
+            metrics.record('display', t)
+
+        if key_code == 27:
+            break
+        elif key_code != 255:
+            session.handle_keys(key_code)
+
+    stop_event.set()
+    for stage in stages:
+        stage.join()
+    elapsed = time.perf_counter() - start
+
+    # Only a complete run may be cached, and the inference stage must have
+    # seen every frame the capture stage produced.
+    if (session.cache_writer is not None and finished
+            and stages[1].frames == stages[0].frames):
+        session.cache_writer.commit()
+
+    session.close()
+    preview.close()
+
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+
+    report = {stage.name: stage.stats() for stage in stages}
+    report['display'] = {
+        'frames': displayed,
+        'busy': display_busy,
+        'fps': displayed / display_busy if display_busy > 0 else 0.0,
+    }
+    report['total'] = {
+        'frames': stages[-1].frames,
+        'busy': elapsed,
+        'fps': stages[-1].frames / elapsed if elapsed > 0 else 0.0,
+    }
+    print_report(report)
+    return report
+
+
+def print_report(report):
+    for name, stats in report.items():
+        print(f"{name:>10}: {stats['frames']:6d} frames "
+              f"in {stats['busy']:7.2f}s ({stats['fps']:7.1f} fps)")
@@ -0,0 +1,80 @@
+"""
+Compile a selection of filters into a plan that is run on every frame.
+
+The selected filter names are resolved once, before the analysis starts. The
+`Landmark` objects of all selected filters are split into one draw operation
+per landmark tuple, duplicates are removed and operations that only differ
+in their landmarks are merged again. The per-frame loop then only runs the
+resulting list of operations.
+"""
+from .landmarks import filters
+
+
+class FilterPlan():
+    """
+    :names: Names of the selected filters, in the order they were given.
+
+    :ops: `Landmark` objects to apply to every frame, in drawing order.
+    """
+    def __init__(self, names, ops):
+        self.names = names
+        self.ops = ops
+
+    @property
+    def name(self):
+        """
+        Name of the plan, as used in the filename of the analyzed video.
+        """
+        return '_'.join(self.names)
+
+    def apply(self, lf, frame):
+        for op in self.ops:
+            op.apply(lf, frame)
+
+
+def compile_plan(selected_filters, registry=filters):
+    """
+    Compile the selected filters into a `FilterPlan`.
+
+    :selected_filters: A list of filter names or a single name. Raises a
+    ValueError if one of the names does not exist in `registry`.
+    """
+    if selected_filters is None:
+        names = []
+    elif isinstance(selected_filters, str):
+        names = [selected_filters]
+    else:
+        names = list(dict.fromkeys(selected_filters))
+
+    unknown = [name for name in names if name not in registry]
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(unknown)}. "
+                         f"Available filters: {', '.join(registry)}")
+
+    # The filters are drawn in the order of the registry, whatever the order
+    # of the selection.
+    selected = set(names)
+    seen = set()
+    ops = []
+    for name in (name for name in registry if name in selected):
+        for filt in registry[name]:
+            for landmarks in filt.landmarks:
+                landmarks = _as_key(landmarks)
+                if (filt.key(), landmarks) in seen:
+                    continue
+                seen.add((filt.key(), landmarks))
+
+                # Merge with the previous operation if it draws in the same
+                # way. Only neighbours are merged to keep the drawing order.
+                if ops and ops[-1].key() == filt.key():
+                    ops[-1] = ops[-1].with_landmarks(ops[-1].landmarks + [landmarks])
+                else:
+                    ops.append(filt.with_landmarks([landmarks]))
+    return FilterPlan(names, ops)
+
+
+def _as_key(landmarks):
+    if isinstance(landmarks, tuple):
+        return tuple(int(lm) for lm in landmarks)
+    return int(landmarks)
+
@@ -0,0 +1,211 @@
+"""
+Pre-scan of a video for the stretches with a person in them.
+
+Long recordings often contain minutes without anybody in the picture, and
+running the pose model on them is wasted time. A cheap pass over every few
+frames of the video finds the stretches where something happens, and the
+analysis only runs the pose model inside them (see
+`videoanalysis.analyze.AnalysisSession`).
+
+There are two detectors:
+
+- 'motion': a background subtractor on small grayscale frames. It is very
+  fast, but a person standing still for a long time fades into the
+  background.
+- 'pose': the pose backend on downscaled frames.
+
+The stretches are padded and short gaps are closed, so the pose tracking
+does not start right at the first frame of a person. The result is stored
+next to the video as '<video>.presence.json' and reused as long as the video
+and the settings stay the same.
+"""
+import bisect
+import inspect
+import json
+import os
+
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Increase when the layout of the index file changes.
+PRESENCE_VERSION = 1
+
+detectors = ('motion', 'pose')
+
+
+class PresenceIndex():
+    """
+    :segments: Sorted, disjoint (start, stop) frame ranges with a person in
+    them, without the stop frame.
+
+    :frame_count: Number of frames of the video.
+
+    :settings: The settings of the scan, see `scan`.
+    """
+    def __init__(self, segments, frame_count, settings={}):
+        self.segments = [tuple(segment) for segment in segments]
+        self.starts = [start for start, _ in self.segments]
+        self.frame_count = frame_count
+        self.settings = settings
+
+    def __contains__(self, index):
+        i = bisect.bisect_right(self.starts, index) - 1
+        return i >= 0 and index < self.segments[i][1]
+
+    def __len__(self):
+        return len(self.segments)
+
+    def frames(self):
+        """
+        Return the number of frames inside the segments.
+        """
+        return sum(stop - start for start, stop in self.segments)
+
+    def save(self, path, video):
+        stat = os.stat(video)
+        data = {
+            'version': PRESENCE_VERSION,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'frame_count': self.frame_count,
+            'settings': self.settings,
+            'segments': self.segments,
+        }
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, video):
+        """
+        Read an index written by `save`. Returns None if there is none, or if
+        the video changed since.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            stat = os.stat(video)
+        except (OSError, ValueError):
+            return None
+        if (data.get('version') != PRESENCE_VERSION
+                or data['size'] != stat.st_size or data['mtime'] != stat.st_mtime_ns):
+            return None
+        return cls(data['segments'], data['frame_count'], data['settings'])
+
+
+def index_path(video):
+    return f'{video}.presence.json'
+
+
+def scan(path, detector='motion', step=5, width=160, threshold=0.002,
+         padding=15, min_gap=30, backend=None):
+    """
+    Find the frames of the video at `path` with a person in them.
+
+    :detector: 'motion' or 'pose', see above.
+
+    :step: Only every `step`-th frame is looked at. The others are grabbed
+    without being converted.
+
+    :width: Width the frames are downscaled to.
+
+    :threshold: Fraction of the pixels that must have changed for the
+    'motion' detector.
+
+    :padding: Frames added before and after every stretch.
+
+    :min_gap: Gaps between two stretches shorter than this are closed.
+
+    :backend: Pose backend for the 'pose' detector, MediaPipe by default.
+
+    Returns a `PresenceIndex`.
+    """
+    if detector not in detectors:
+        raise ValueError(f"Unknown detector {detector}, use one of {', '.join(detectors)}")
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open {path}")
+
+    own_backend = False
+    if detector == 'pose' and backend is None:
+        from .backends import create_backend
+        backend = create_backend()
+        own_backend = True
+    subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+
+    hits = []
+    index = 0
+    try:
+        while True:
+            if index % step:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_height, frame_width = frame.shape[:2]
+            height = max(1, round(frame_height * width / frame_width))
+            small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            if detector == 'pose':
+                found = backend.process(small) is not None
+            else:
+                gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+                changed = np.count_nonzero(subtractor.apply(gray))
+                # The first frame is all foreground, there is no background yet.
+                found = index > 0 and changed > threshold * gray.size
+            if found:
+                hits.append(index)
+            index += 1
+    finally:
+        cap.release()
+        if own_backend:
+            backend.close()
+
+    # Every hit stands for the frames up to the next one that was looked at.
+    segments = []
+    for hit in hits:
+        start = max(hit - padding, 0)
+        stop = min(hit + step + padding, index)
+        if segments and start - segments[-1][1] < min_gap:
+            segments[-1][1] = max(segments[-1][1], stop)
+        else:
+            segments.append([start, stop])
+
+    settings = {'detector': detector, 'step': step, 'width': width,
+                'threshold': threshold, 'padding': padding, 'min_gap': min_gap}
+    if detector == 'pose':
+        settings['backend'] = backend.settings()
+    return PresenceIndex(segments, index, settings)
+
+
+def load_or_scan(path, **settings):
+    """
+    Return the index stored next to the video, or scan the video and store
+    the index if there is none or it was made with other settings.
+    """
+    index = PresenceIndex.load(index_path(path), path)
+    if index is not None:
+        scanned = dict(index.settings)
+        scanned.pop('backend', None)
+        if scanned == _scan_settings(settings):
+            return index
+    index = scan(path, **settings)
+    index.save(index_path(path), path)
+    return index
+
+
+def _scan_settings(settings):
+    """
+    Return the settings `scan` stores for the given arguments, with its
+    defaults filled in and without the backend.
+    """
+    bound = inspect.signature(scan).bind(None, **settings)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    del arguments['path'], arguments['backend']
+    return arguments
@@ -0,0 +1,147 @@
+"""
+Re-render a video with other filters from recorded landmarks.
+
+Once the landmarks of a video are known, drawing another set of filters
+needs no pose model at all. The landmarks come from a file written by
+`videoanalysis.backends.ReplayBackend.save` or from the landmark cache.
+
+The frames are decoded on one thread, drawn by a pool of threads and
+encoded on the background thread of the writer. OpenCV releases the GIL
+while it decodes, draws and encodes, so the work is spread over all cores
+and the codec is the limit. No window is opened.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from .analyze import open_writer
+from .backends import MediaPipeBackend, ReplayBackend
+from .plan import compile_plan
+
+_END = object()
+
+
+def load_track(video, path=None, cache=None):
+    """
+    Return the recorded landmarks of `video` as a `ReplayBackend`: from the
+    file or cache entry at `path`, or else from the `cache` entry MediaPipe
+    Pose created for the video.
+    """
+    if path is not None:
+        return ReplayBackend.load(path)
+    if cache is not None:
+        reader = cache.get(cache.key(video, MediaPipeBackend().settings()))
+        if reader is not None:
+            return ReplayBackend.from_cache(reader)
+    raise ValueError(f"No recorded landmarks of {video}, analyze it once with "
+                     f"the cache enabled or give the landmarks file")
+
+
+def render(video, selected_filters, track, directory='analyzed', workers=None,
+           keep_empty=False, writer_options={}):
+    """
+    Draw the selected filters onto every frame of `video` with the landmarks
+    of `track` and write the result.
+
+    :track: A `ReplayBackend`, see `load_track`.
+
+    :workers: Number of drawing threads, by default one per core.
+
+    :keep_empty: Write frames without a pose unchanged instead of leaving
+    them out like `videoanalysis.analyze.analyze` does.
+
+    :writer_options: Arguments for `videoanalysis.analyze.open_writer`.
+
+    Returns a dict with the number of frames and the throughput.
+    """
+    plan = compile_plan(selected_filters)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise IOError(f"Could not open {video}")
+    out, _ = open_writer(cap, plan.name, os.path.basename(video), directory,
+                         **writer_options)
+
+    decoded = queue.Queue(maxsize=2 * workers)
+    stop_event = threading.Event()
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                decoded.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def decode():
+        index = 0
+        try:
+            while not stop_event.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                put((index, frame))
+                index += 1
+        finally:
+            put(_END)
+
+    # The filters draw with arrays they reuse, so every thread gets a plan
+    # of its own.
+    plans = threading.local()
+
+    def draw(index, frame):
+        lf = track.process(frame, index)
+        if lf is None:
+            return frame if keep_empty else None
+        thread_plan = getattr(plans, 'plan', None)
+        if thread_plan is None:
+            thread_plan = plans.plan = compile_plan(selected_filters)
+        thread_plan.apply(lf, frame)
+        return frame
+
+    frames = 0
+    written = 0
+    decoder = threading.Thread(target=decode, name='render-decode', daemon=True)
+    try:
+        with ThreadPoolExecutor(workers, thread_name_prefix='render-draw') as pool:
+            decoder.start()
+            # The futures are kept in frame order, so the frames are written
+            # in order although they are drawn in parallel.
+            pending = deque()
+            while True:
+                item = decoded.get()
+                if item is not _END:
+                    pending.append(pool.submit(draw, *item))
+                    frames += 1
+                while pending and (item is _END or len(pending) > 2 * workers
+                                   or pending[0].done()):
+                    frame = pending.popleft().result()
+                    if frame is not None:
+                        out.write(frame)
+                        written += 1
+                if item is _END:
+                    break
+    finally:
+        stop_event.set()
+        decoder.join()
+        cap.release()
+        out.release()
+
+    seconds = time.perf_counter() - start
+    result = {
+        'file': video,
+        'frames': frames,
+        'written': written,
+        'seconds': seconds,
+        'fps': frames / seconds if seconds > 0 else 0.0,
+    }
+    print(f"{video}: {written} of {frames} frames rendered in {seconds:.1f}s "
+          f"({result['fps']:.1f} fps)")
+    return result
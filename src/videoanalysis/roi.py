@@ -0,0 +1,117 @@
+"""
+Pose inference on a reduced resolution and on a region of interest.
+
+Instead of the full frame, only a crop around the athlete is passed to the
+pose model, downscaled to at most `inference_size` pixels. The crop follows
+the landmarks of the previous frame. The landmarks are mapped back into
+full-frame coordinates before any filter sees them.
+"""
+import cv2
+import numpy as np
+
+from .frames import LandmarkFrame
+
+
+class RoiTracker():
+    """
+    :inference_size: Maximum width and height of the image passed to the pose
+    model. None keeps the resolution.
+
+    :roi: Crop the frame around the landmarks of the previous frame.
+
+    :margin: Space added around the landmarks on every side, relative to the
+    size of the landmark bounding box.
+
+    :border: The crop only moves once the landmarks come closer to its edge
+    than this fraction of its size. A crop that moves on every frame would
+    disturb the tracking of the pose model.
+    """
+    def __init__(self, inference_size=None, roi=True, margin=0.25, border=0.1):
+        self.inference_size = inference_size
+        self.roi = roi
+        self.margin = margin
+        self.border = border
+        self.box = None
+
+    def reset(self):
+        self.box = None
+
+    def settings(self):
+        """
+        Return the settings that change the landmarks, for the cache key.
+        """
+        return {'inference_size': self.inference_size, 'roi': self.roi,
+                'margin': self.margin, 'border': self.border}
+
+    def process(self, backend, frame, index=None):
+        """
+        Run the pose `backend` on the frame and return the landmarks as a
+        `LandmarkFrame` in full-frame coordinates, or None if there is no
+        pose in the frame. `index` is passed on to the backend.
+        """
+        lf = self._process(backend, frame, self.box, index)
+        if lf is None and self.box is not None:
+            # The athlete left the crop, search the whole frame again.
+            self.box = None
+            lf = self._process(backend, frame, None, index)
+        if self.roi:
+            self._update(lf, frame)
+        return lf
+
+    def _process(self, backend, frame, box, index=None):
+        frame_height, frame_width = frame.shape[:2]
+        x0, y0, x1, y1 = box if box is not None else (0, 0, frame_width, frame_height)
+        crop = frame[y0:y1, x0:x1]
+        crop_height, crop_width = crop.shape[:2]
+
+        if self.inference_size and max(crop_width, crop_height) > self.inference_size:
+            scale = self.inference_size / max(crop_width, crop_height)
+            size = (max(1, round(crop_width * scale)), max(1, round(crop_height * scale)))
+            crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+
+        lf = backend.process(crop, index)
+        if lf is None:
+            return None
+
+        # The normalized coordinates do not depend on the downscaling, only
+        # on the position and size of the crop. z has the same scale as x.
+        normalized = lf.normalized.copy()
+        normalized[:, 0] = (x0 + normalized[:, 0] * crop_width) / frame_width
+        normalized[:, 1] = (y0 + normalized[:, 1] * crop_height) / frame_height
+        normalized[:, 2] *= crop_width / frame_width
+        return LandmarkFrame(normalized, lf.world, frame_width, frame_height)
+
+    def _update(self, lf, frame):
+        if lf is None:
+            self.box = None
+            return
+
+        frame_height, frame_width = frame.shape[:2]
+        points = lf.normalized[:, :2] * (frame_width, frame_height)
+        visible = lf.normalized[:, 3] > 0.5
+        if visible.any():
+            points = points[visible]
+        bx0, by0 = points.min(axis=0)
+        bx1, by1 = points.max(axis=0)
+        size = max(bx1 - bx0, by1 - by0)
+
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            inset = self.border * max(x1 - x0, y1 - y0)
+            inside = (bx0 > x0 + inset and by0 > y0 + inset
+                      and bx1 < x1 - inset and by1 < y1 - inset)
+            # Keep the crop as long as the athlete is inside and does not
+            # get much smaller in it.
+            if inside and size * (1 + 2 * self.margin) > 0.5 * max(x1 - x0, y1 - y0):
+                return
+
+        # The pose model works on square images, so the crop is square too.
+        half = size * (1 + 2 * self.margin) / 2
+        cx, cy = (bx0 + bx1) / 2, (by0 + by1) / 2
+        box = np.array((cx - half, cy - half, cx + half, cy + half))
+        box = np.clip(np.round(box), 0, (frame_width, frame_height, frame_width, frame_height))
+        x0, y0, x1, y1 = (int(v) for v in box)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            self.box = None
+        else:
+            self.box = (x0, y0, x1, y1)
@@ -0,0 +1,601 @@
+"""
+Rules that turn the metrics of the landmarks into events: repetitions,
+holds and alerts like "arm bent for more than 0.5 s".
+
+The filters judge every frame on its own. A `RuleEngine` follows the metrics
+over time instead. Every rule looks at one metric, named like the columns of
+`videoanalysis.analytics.compute_metrics` without the filter:
+
+- 'angle_<A>_<B>_<C>': the angle at B, or 'angle_<A>_<B>_<C>_<D>' for the
+  angle between A and D at the middle of B and C.
+- 'distance_<A>_<B>': the distance of A and B in the xy-plane.
+- 'midpoint_<A>_<B>_<x|y|z>': a coordinate of the middle of A and B.
+
+The landmarks are the names of `videoanalysis.frames.PoseLandmark`. The
+metric can be smoothed with a sliding window over the last seconds, whose
+mean, minimum and maximum are updated in constant time per frame.
+
+The engine runs live, one frame after the other (see `RuleEngine.update`),
+or offline on the landmarks of a whole video (see `evaluate_video`). Both
+give the same events. An event is a dict with the name of the rule, its
+type, the time in seconds and the frame.
+
+Rules can be written as JSON, a list of objects with the type of the rule
+and the arguments of its class, e.g.
+
+    [{"type": "reps", "name": "curls", "metric": "angle_RIGHT_SHOULDER_RIGHT_ELBOW_RIGHT_WRIST",
+      "low": 60, "high": 150},
+     {"type": "alert", "name": "arm bent", "metric": "angle_RIGHT_SHOULDER_RIGHT_ELBOW_RIGHT_WRIST",
+      "low": 150, "high": 210, "outside": true, "duration": 0.5}]
+"""
+import json
+from collections import deque
+
+from .frames import PoseLandmark
+from .landmarks import AngleHIPLandmark, AngleLandmark, ClosePoints
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+stats = ('mean', 'min', 'max')
+
+nan = float('nan')
+
+
+class Window():
+    """
+    The values of the last `seconds` of a time series, with their mean,
+    minimum and maximum. Every value is added and removed once, so all of
+    them take constant time per frame on average.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.items = deque()
+        self.total = 0.0
+        # The candidates for the minimum, increasing, and for the maximum,
+        # decreasing.
+        self.low = deque()
+        self.high = deque()
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, t, value):
+        """
+        Add the value at time `t`. NaN values are left out, but still move
+        the window on.
+        """
+        self.advance(t)
+        if value != value:
+            return
+        self.items.append((t, value))
+        self.total += value
+        while self.low and self.low[-1][1] >= value:
+            self.low.pop()
+        self.low.append((t, value))
+        while self.high and self.high[-1][1] <= value:
+            self.high.pop()
+        self.high.append((t, value))
+
+    def advance(self, t):
+        """
+        Remove the values older than `seconds` before `t`.
+        """
+        start = t - self.seconds
+        items = self.items
+        while items and items[0][0] <= start:
+            self.total -= items.popleft()[1]
+        if not items:
+            # Start again from zero, so rounding errors do not add up.
+            self.total = 0.0
+        while self.low and self.low[0][0] <= start:
+            self.low.popleft()
+        while self.high and self.high[0][0] <= start:
+            self.high.popleft()
+
+    def mean(self):
+        return self.total / len(self.items) if self.items else nan
+
+    def min(self):
+        return self.low[0][1] if self.low else nan
+
+    def max(self):
+        return self.high[0][1] if self.high else nan
+
+    def clear(self):
+        self.items.clear()
+        self.low.clear()
+        self.high.clear()
+        self.total = 0.0
+
+
+class Rule():
+    """
+    Base class of the rules.
+
+    :name: Name of the rule in the events.
+
+    :metric: Name of the metric, see above.
+
+    :window: Smooth the metric over this many seconds.
+
+    :stat: What the rule sees of the window: 'mean', 'min' or 'max'.
+    """
+    def __init__(self, name, metric, window=None, stat='mean'):
+        if stat not in stats:
+            raise ValueError(f"Unknown statistic {stat}, use one of {', '.join(stats)}")
+        parse_metric(metric)
+        self.name = name
+        self.metric = metric
+        self.window = None if window is None else Window(window)
+        self.stat = stat
+        self.slot = None
+
+    def value(self, t, values):
+        """
+        Return the metric at time `t`, smoothed if there is a window.
+        """
+        v = values[self.slot]
+        if self.window is None:
+            return v
+        self.window.push(t, v)
+        return getattr(self.window, self.stat)()
+
+    def event(self, kind, t, **details):
+        return dict(rule=self.name, type=kind, time=t, **details)
+
+    def reset(self):
+        if self.window is not None:
+            self.window.clear()
+
+    def update(self, t, values, events):
+        """
+        Look at the metrics of the frame at time `t` and append the events
+        to `events`. Metrics of frames without a pose are NaN.
+        """
+        pass
+
+    def finish(self, t, events):
+        """
+        Called once the last frame was seen at time `t`.
+        """
+        pass
+
+    def label(self):
+        """
+        Return the text and color shown on the frame, or None.
+        """
+        return None
+
+    def summary(self):
+        return {}
+
+
+class Hold(Rule):
+    """
+    Times how long a condition holds.
+
+    The condition holds while the metric is between `low` and `high`, or
+    outside of them if `outside` is set. Either bound may be left out.
+
+    :duration: The condition must hold at least this many seconds before the
+    hold counts. Its 'start' event comes then, and its 'end' event with the
+    duration once the condition stops holding.
+    """
+    start_event = 'start'
+    end_event = 'end'
+    color = (0, 255, 0)
+
+    def __init__(self, name, metric, low=None, high=None, outside=False,
+                 duration=0.0, window=None, stat='mean'):
+        if low is None and high is None:
+            raise ValueError(f"Rule {name} needs low, high or both")
+        super().__init__(name, metric, window, stat)
+        self.low = low
+        self.high = high
+        self.outside = outside
+        self.duration = duration
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.since = None
+        self.held = False
+        self.last = None
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def holds(self, v):
+        if v != v:
+            return False
+        inside = ((self.low is None or v > self.low)
+                  and (self.high is None or v < self.high))
+        return inside != self.outside
+
+    def update(self, t, values, events):
+        self.last = t
+        if self.holds(self.value(t, values)):
+            if self.since is None:
+                self.since = t
+            if not self.held and t - self.since >= self.duration:
+                self.held = True
+                self.count += 1
+                events.append(self.event(self.start_event, t, since=self.since))
+        else:
+            self.end(t, events)
+
+    def end(self, t, events):
+        if self.held:
+            duration = t - self.since
+            self.total += duration
+            self.longest = max(self.longest, duration)
+            events.append(self.event(self.end_event, t, since=self.since,
+                                     duration=duration))
+        self.since = None
+        self.held = False
+
+    def finish(self, t, events):
+        self.end(t, events)
+
+    def label(self):
+        if not self.held:
+            return None
+        return f'{self.name} {self.last - self.since:.1f}s', self.color
+
+    def summary(self):
+        return {'count': self.count, 'total': self.total, 'longest': self.longest}
+
+
+class Alert(Hold):
+    """
+    A `Hold` of something that should not happen. Its events are 'alert' and
+    'clear', and it is shown in red while it lasts.
+    """
+    start_event = 'alert'
+    end_event = 'clear'
+    color = (0, 0, 255)
+
+    def label(self):
+        if not self.held:
+            return None
+        return f'{self.name}!', self.color
+
+
+class Repetitions(Rule):
+    """
+    Counts the repetitions of a movement, e.g. of a curl with the elbow
+    angle.
+
+    A repetition starts at rest, reaches the turning point and returns to
+    rest. With `start='high'` rest means the metric is at least `high` and
+    the turning point that it is at most `low`, with `start='low'` the other
+    way round. The gap between the two keeps noise from counting twice.
+
+    Every repetition gives a 'rep' event with the count, its duration and
+    the range of the metric. A movement that returns to rest without
+    reaching the turning point gives a 'partial' event.
+    """
+    def __init__(self, name, metric, low, high, start='high', window=None,
+                 stat='mean'):
+        if start not in ('low', 'high'):
+            raise ValueError(f"Unknown start {start}, use low or high")
+        if not low < high:
+            raise ValueError(f"Rule {name} needs low < high")
+        super().__init__(name, metric, window, stat)
+        self.low = low
+        self.high = high
+        self.start = start
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.resting = None
+        self.since = None
+        self.turned = False
+        self.range = None
+        self.count = 0
+        self.partial = 0
+
+    def update(self, t, values, events):
+        v = self.value(t, values)
+        if v != v:
+            return
+        if self.start == 'high':
+            rest, turn = v >= self.high, v <= self.low
+        else:
+            rest, turn = v <= self.low, v >= self.high
+
+        if self.resting is None:
+            # Wait for the first rest before counting.
+            if rest:
+                self.resting = True
+        elif self.resting:
+            if not rest:
+                self.resting = False
+                self.since = t
+                self.turned = turn
+                self.range = [v, v]
+        else:
+            self.range[0] = min(self.range[0], v)
+            self.range[1] = max(self.range[1], v)
+            self.turned = self.turned or turn
+            if rest:
+                if self.turned:
+                    self.count += 1
+                    events.append(self.event('rep', t, count=self.count,
+                                             duration=t - self.since,
+                                             min=self.range[0], max=self.range[1]))
+                else:
+                    self.partial += 1
+                    events.append(self.event('partial', t, duration=t - self.since,
+                                             min=self.range[0], max=self.range[1]))
+                self.resting = True
+
+    def label(self):
+        return f'{self.name}: {self.count}', (255, 255, 255)
+
+    def summary(self):
+        return {'count': self.count, 'partial': self.partial}
+
+
+rule_types = {
+    'hold': Hold,
+    'alert': Alert,
+    'reps': Repetitions,
+}
+
+
+class RuleEngine():
+    """
+    Evaluates rules on the metrics of one video or camera, frame by frame.
+
+    :rules: The `Rule` objects. A rule object keeps its state, so it must
+    only be used by one engine.
+
+    :on_event: Called with every event when it happens.
+
+    Only the metrics the rules use are calculated, with the arrays of the
+    filters that are reused on every frame. All events are kept in `events`.
+    """
+    def __init__(self, rules, on_event=None):
+        self.rules = list(rules)
+        self.on_event = on_event
+        self.sources, self.metrics = metric_sources(
+            list(dict.fromkeys(rule.metric for rule in self.rules)))
+        for rule in self.rules:
+            rule.slot = self.metrics.index(rule.metric)
+        self.values = np.full(len(self.metrics), nan)
+        self.events = []
+        self.last = None
+        self.last_index = None
+
+    def update(self, t, lf, index=None):
+        """
+        Evaluate the rules on the `videoanalysis.frames.LandmarkFrame` `lf`
+        of the frame at time `t` in seconds, or None if it has no pose.
+        Returns the new events.
+        """
+        values = self.values
+        if lf is None:
+            values.fill(nan)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                for start, stop, frame_values, _ in self.sources:
+                    values[start:stop] = frame_values(lf.world)
+        return self.step(t, values.tolist(), index)
+
+    def step(self, t, values, index=None):
+        """
+        Evaluate the rules on a list with the value of every metric in
+        `metrics`.
+        """
+        self.last = t
+        self.last_index = index
+        events = []
+        for rule in self.rules:
+            rule.update(t, values, events)
+        return self._emit(events, index)
+
+    def finish(self):
+        """
+        End the holds that still last at the last frame. Returns their
+        events.
+        """
+        if self.last is None:
+            return []
+        events = []
+        for rule in self.rules:
+            rule.finish(self.last, events)
+        return self._emit(events, self.last_index)
+
+    def run(self, world, status, fps):
+        """
+        Evaluate the rules on a whole video at once.
+
+        :world: (frames, 33, 4) array with the world landmarks of every frame.
+
+        :status: (frames,) bool array that tells whether a pose was found.
+
+        :fps: Frame rate of the video, gives the time of every frame.
+
+        Returns all events.
+        """
+        world = np.asarray(world, np.float32)
+        table = np.full((len(world), len(self.metrics)), nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for start, stop, _, video_values in self.sources:
+                table[:, start:stop] = video_values(world)
+        table[~np.asarray(status, bool)] = nan
+        for index, values in enumerate(table.tolist()):
+            self.step(index / fps, values, index)
+        self.finish()
+        return self.events
+
+    def reset(self):
+        for rule in self.rules:
+            rule.reset()
+        self.events = []
+        self.last = None
+        self.last_index = None
+
+    def labels(self):
+        return [label for label in (rule.label() for rule in self.rules)
+                if label is not None]
+
+    def draw(self, frame, labels=None):
+        """
+        Draw the labels of the rules into the top left corner of the frame.
+        """
+        scale = max(0.5, frame.shape[0] / 1080)
+        y = int(40 * scale)
+        for text, color in self.labels() if labels is None else labels:
+            cv2.putText(frame, text, (int(10 * scale), y), cv2.FONT_HERSHEY_SIMPLEX,
+                        scale, color, int(2 * scale) + 1)
+            y += int(40 * scale)
+
+    def summary(self):
+        return {rule.name: rule.summary() for rule in self.rules}
+
+    def print_summary(self):
+        for name, summary in self.summary().items():
+            details = ', '.join(f'{key} {value:.2f}' if isinstance(value, float)
+                                else f'{key} {value}' for key, value in summary.items())
+            print(f"{name}: {details}")
+
+    def _emit(self, events, index):
+        for event in events:
+            event['frame'] = index
+            if self.on_event is not None:
+                self.on_event(event)
+        self.events.extend(events)
+        return events
+
+
+def parse_metric(name):
+    """
+    Split a metric name into its kind, its landmarks and the axis of a
+    midpoint. Raises a ValueError for unknown metrics.
+    """
+    kind, _, rest = name.partition('_')
+    axis = None
+    if kind == 'midpoint':
+        rest, _, axis = rest.rpartition('_')
+    landmarks = _parse_landmarks(rest)
+    sizes = {'angle': (3, 4), 'distance': (2,), 'midpoint': (2,)}
+    if (kind not in sizes or landmarks is None or len(landmarks) not in sizes[kind]
+            or axis not in (None, 'x', 'y', 'z')):
+        raise ValueError(f"Unknown metric {name}")
+    return kind, landmarks, axis
+
+
+def metric_sources(names):
+    """
+    Group the metrics by the way they are calculated.
+
+    Returns a list of (start, stop, frame_values, video_values) and the
+    metric names in the order of their slots. `frame_values` calculates the
+    metrics start to stop for the (33, 4) world landmarks of one frame,
+    `video_values` for the (frames, 33, 4) landmarks of a video.
+    """
+    groups = {'angle3': [], 'angle4': [], 'distance': [], 'midpoint': []}
+    for name in names:
+        kind, landmarks, axis = parse_metric(name)
+        if kind == 'angle':
+            kind += str(len(landmarks))
+        groups[kind].append((name, landmarks, axis))
+
+    sources = []
+    ordered = []
+    for kind, metrics in groups.items():
+        if not metrics:
+            continue
+        landmarks = [lms for _, lms, _ in metrics]
+        if kind == 'angle3':
+            filt = AngleLandmark(landmarks)
+            frame_values, video_values = filt.frame_angles, filt.angles
+        elif kind == 'angle4':
+            filt = AngleHIPLandmark(landmarks)
+            frame_values, video_values = filt.frame_angles, filt.angles
+        elif kind == 'distance':
+            filt = ClosePoints(landmarks)
+            frame_values, video_values = filt.frame_distances, filt.distances
+        else:
+            frame_values = video_values = _midpoints(
+                landmarks, ['xyz'.index(axis) for _, _, axis in metrics])
+        sources.append((len(ordered), len(ordered) + len(metrics),
+                        frame_values, video_values))
+        ordered.extend(name for name, _, _ in metrics)
+    return sources, ordered
+
+
+def _midpoints(landmarks, axes):
+    first = np.array([lms[0] for lms in landmarks], np.intp)
+    second = np.array([lms[1] for lms in landmarks], np.intp)
+    axes = np.array(axes, np.intp)
+
+    def values(world):
+        return (world[..., first, axes] + world[..., second, axes]) / 2
+    return values
+
+
+def _parse_landmarks(text):
+    """
+    Split '<A>_<B>_...' into landmarks. Names contain underscores themselves,
+    so the longest name that fits is taken first.
+    """
+    parts = text.split('_')
+    landmarks = []
+    i = 0
+    while i < len(parts):
+        for j in range(len(parts), i, -1):
+            name = '_'.join(parts[i:j])
+            if name in PoseLandmark.__members__:
+                landmarks.append(PoseLandmark[name])
+                i = j
+                break
+        else:
+            return None
+    return tuple(landmarks)
+
+
+def create_rule(spec):
+    """
+    Create a rule from a dict with its type and the arguments of its class.
+    """
+    spec = dict(spec)
+    kind = spec.pop('type', None)
+    if kind not in rule_types:
+        raise ValueError(f"Unknown rule type {kind}, use one of {', '.join(rule_types)}")
+    return rule_types[kind](**spec)
+
+
+def load_rules(path):
+    """
+    Read a list of rules from a JSON file.
+    """
+    with open(path) as f:
+        return [create_rule(spec) for spec in json.load(f)]
+
+
+def write_events(events, path):
+    """
+    Write the events to a file, one JSON object per line.
+    """
+    with open(path, 'w') as f:
+        for event in events:
+            f.write(json.dumps(event, default=float) + '\n')
+
+
+def evaluate_video(url, rules, cache=None, backend=None):
+    """
+    Evaluate the rules on the landmarks of the whole video at `url`, read
+    from the cache if possible. Returns the `RuleEngine` with the events.
+    """
+    from .analytics import load_landmarks
+
+    engine = RuleEngine(rules)
+    world, status, fps = load_landmarks(url, cache, backend)
+    engine.run(world, status, fps if fps > 0 else 30.0)
+    return engine
@@ -0,0 +1,217 @@
+"""
+Parallel analysis of a single long video.
+
+The video is split into segments of consecutive frames, and every segment is
+analyzed headless in its own process. A worker seeks to the start of its
+segment with `CAP_PROP_POS_FRAMES`, and first feeds a few warm-up frames to
+the Pose model so the tracking has settled before the first frame that gets
+written. The annotated segments are then joined in order.
+
+If ffmpeg is on the PATH, the segments are encoded with the codec of the
+final video and their streams are joined without encoding them again.
+Otherwise they are written losslessly as FFV1 and encoded once more while
+they are stitched together, so the frames are still only encoded lossy once.
+
+Seeking is only frame accurate for containers with a proper index (e.g. mp4).
+"""
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from .analyze import open_writer, output_path, estimate_pose
+from .backends import create_backend
+from .plan import compile_plan
+from .writer import open_video_writer
+
+# Writer options of the segments if they are stitched together by decoding
+# them.
+lossless_options = {'backend': 'opencv', 'codec': 'FFV1', 'background': False}
+
+
+def split(frame_count, segments):
+    """
+    Return the (start, stop) frame ranges of `segments` segments of about
+    equal length. The last segment is open ended (stop is None), since the
+    frame count of a video is not always exact.
+    """
+    segments = max(1, min(segments, frame_count))
+    bounds = [frame_count * i // segments for i in range(segments + 1)]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def analyze_segments(path, selected_filters, workers=None, segments=None,
+                     warmup=30, directory='analyzed', writer_options={},
+                     backend_options={}):
+    """
+    Analyze one video with a pool of `workers` processes.
+
+    :segments: Number of segments, by default one per worker.
+
+    :warmup: Number of frames before a segment that are only used to let the
+    pose tracking settle.
+
+    :writer_options: Arguments for `videoanalysis.analyze.open_writer`, used
+    for the joined video.
+
+    :backend_options: Arguments for `videoanalysis.backends.create_backend`.
+
+    Returns a list with the statistics of every segment.
+    """
+    plan = compile_plan(selected_filters)
+    workers = workers or os.cpu_count() or 1
+    segments = segments or workers
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open {path}")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    options = dict(writer_options)
+    container = options.pop('container', None)
+    output = output_path(plan.name, os.path.basename(path), directory, container)
+    write = options.get('backend') != 'none'
+    ffmpeg = shutil.which('ffmpeg')
+    if not write or ffmpeg is not None:
+        segment_options, extension = options, os.path.splitext(output)[1]
+    else:
+        segment_options, extension = lossless_options, '.mkv'
+
+    start = time.perf_counter()
+    tmp = tempfile.mkdtemp(prefix='videoanalysis-')
+    try:
+        ranges = split(frame_count, segments)
+        segment_paths = [os.path.join(tmp, f'{i:04d}{extension}') for i in range(len(ranges))]
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(_analyze_segment, path, selected_filters,
+                                   first, stop, warmup, segment_path,
+                                   backend_options, segment_options)
+                       for (first, stop), segment_path in zip(ranges, segment_paths)]
+            results = [future.result() for future in futures]
+
+        # Segments without a single pose have no video.
+        segment_paths = [segment_path for segment_path, r in zip(segment_paths, results)
+                         if r['written'] > 0]
+        if write and ffmpeg is not None and segment_paths:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+            concat(segment_paths, output, ffmpeg)
+        elif write:
+            # Without a single pose in the video, this writes an empty video
+            # like a session does.
+            out, _ = open_writer(cap, plan.name, os.path.basename(path), directory,
+                                 container=container, **options)
+            try:
+                stitch(segment_paths, out)
+            finally:
+                out.release()
+    finally:
+        cap.release()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    seconds = time.perf_counter() - start
+    frames = sum(r['frames'] for r in results)
+    for r in results:
+        print(f"frames {r['start']:>7}-{r['stop']:<7}: {r['frames']} frames "
+              f"in {r['seconds']:.1f}s ({r['fps']:.1f} fps)")
+    print(f"{frames} frames in {seconds:.1f}s "
+          f"({frames / seconds if seconds > 0 else 0.0:.1f} fps)")
+    return results
+
+
+def concat(segment_paths, output, ffmpeg='ffmpeg'):
+    """
+    Join the segment videos, in the given order, into `output` with the
+    concat demuxer of ffmpeg. The streams are copied, so the segments must
+    all have the codec and the settings of the output.
+    """
+    list_path = f'{output}.segments.txt'
+    with open(list_path, 'w') as f:
+        for segment_path in segment_paths:
+            f.write(f"file '{os.path.abspath(segment_path)}'\n")
+    try:
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat',
+                        '-safe', '0', '-i', list_path, '-c', 'copy', output],
+                       check=True)
+    finally:
+        os.remove(list_path)
+
+
+def stitch(segment_paths, out):
+    """
+    Append the frames of all segment videos, in the given order, to `out`.
+    This decodes and encodes every frame again, see `concat`.
+    """
+    for segment_path in segment_paths:
+        cap = cv2.VideoCapture(segment_path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+
+
+def _analyze_segment(path, selected_filters, start, stop, warmup, segment_path,
+                     backend_options, writer_options):
+    t = time.perf_counter()
+    # Every process works on its own segment, more threads only compete.
+    cv2.setNumThreads(1)
+    plan = compile_plan(selected_filters)
+    backend = create_backend(**backend_options)
+
+    cap = cv2.VideoCapture(path)
+    first = max(0, start - warmup)
+    if first > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # The same frame rate as `open_writer`, or the streams could not be
+    # joined.
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    # Opened with the first pose, a segment without any gets no video.
+    out = None
+
+    index = first
+    frames = 0
+    try:
+        while stop is None or index < stop:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            lf = estimate_pose(backend, frame, index)
+            index += 1
+            if index <= start or lf is None:
+                continue
+            plan.apply(lf, frame)
+            if out is None:
+                out = open_video_writer(segment_path, fps, (frame_width, frame_height),
+                                        **writer_options)
+            out.write(frame)
+            frames += 1
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+        backend.close()
+
+    seconds = time.perf_counter() - t
+    analyzed = max(0, index - start)
+    return {
+        'start': start,
+        'stop': index,
+        'frames': analyzed,
+        'written': frames,
+        'seconds': seconds,
+        'fps': analyzed / seconds if seconds > 0 else 0.0,
+    }
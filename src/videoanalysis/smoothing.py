@@ -0,0 +1,181 @@
+"""
+Run the pose model on fewer frames and predict the landmarks in between.
+
+`AdaptiveRate` runs the pose inference only on every n-th frame, or as often
+as a frame rate budget allows. For the frames in between the landmarks are
+extrapolated from the last two inferences. All landmarks are smoothed with a
+One-Euro filter, so the overlay does not jump when real and predicted
+landmarks alternate. The filters get a `LandmarkFrame` on every frame and do
+not see a difference between real and predicted landmarks.
+"""
+import math
+import time
+
+import numpy as np
+
+from .frames import LandmarkFrame
+
+
+class OneEuroFilter():
+    """
+    One-Euro filter (Casiez et al., 2012) that smooths all elements of an
+    array independently.
+
+    :min_cutoff: Cutoff frequency in Hz for slow movements. Lower values
+    remove more jitter.
+
+    :beta: How fast the cutoff frequency increases with the speed. Higher
+    values give less lag on fast movements.
+    """
+    def __init__(self, min_cutoff=1.0, beta=1.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.t = None
+        self.x = None
+        self.dx = None
+
+    def __call__(self, t, x):
+        if self.t is None:
+            self.t = t
+            self.x = x.copy()
+            self.dx = np.zeros_like(x)
+            return x
+        dt = t - self.t
+        if dt <= 0:
+            return self.x
+
+        a_d = _alpha(dt, self.d_cutoff)
+        self.dx = a_d * (x - self.x) / dt + (1 - a_d) * self.dx
+        a = _alpha(dt, self.min_cutoff + self.beta * np.abs(self.dx))
+        self.x = a * x + (1 - a) * self.x
+        self.t = t
+        return self.x
+
+
+class AdaptiveRate():
+    """
+    :inner: Object with a `process(backend, frame)` method that runs the pose
+    backend, e.g. a `videoanalysis.roi.RoiTracker`. By default the backend
+    gets the full frame.
+
+    :every: Run the pose model on every n-th frame.
+
+    :target_fps: Instead of a fixed rate, run the pose model as often as
+    possible while the loop still keeps up with this frame rate.
+
+    :fps: Frame rate of a video file. The timestamps of the frames are then
+    derived from the frame number instead of the clock.
+
+    :max_skip: Maximum number of frames in a row without inference.
+    """
+    def __init__(self, inner=None, every=1, target_fps=None, fps=None,
+                 max_skip=10, min_cutoff=1.0, beta=1.0):
+        self.inner = inner
+        self.every = every
+        self.target_fps = target_fps
+        self.fps = fps
+        self.max_skip = max_skip
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.smooth_normalized = OneEuroFilter(min_cutoff, beta)
+        self.smooth_world = OneEuroFilter(min_cutoff, beta)
+
+        self.frames = 0
+        self.skip = 0
+        self.history = []
+        self.cost = None
+        self.other = 0.0
+        self.last_return = None
+
+    def settings(self):
+        settings = {'every': self.every, 'target_fps': self.target_fps,
+                    'max_skip': self.max_skip, 'min_cutoff': self.min_cutoff,
+                    'beta': self.beta}
+        if self.inner is not None:
+            settings.update(self.inner.settings())
+        return settings
+
+    def process(self, backend, frame, index=None):
+        """
+        Return the landmarks of the frame as a `LandmarkFrame`, either from
+        the pose model or predicted. Returns None if there is no pose.
+        `index` is passed on to the backend.
+        """
+        start = time.perf_counter()
+        if self.last_return is not None:
+            # Time the rest of the loop took since the last frame.
+            self.other = 0.8 * self.other + 0.2 * (start - self.last_return)
+        try:
+            return self._process(backend, frame, index)
+        finally:
+            self.last_return = time.perf_counter()
+
+    def _process(self, backend, frame, index=None):
+        now = self._clock()
+        self.frames += 1
+        frame_height, frame_width = frame.shape[:2]
+
+        if self.skip > 0 and self.history:
+            self.skip -= 1
+            normalized, world = self._extrapolate(now)
+        else:
+            start = time.perf_counter()
+            lf = self._infer(backend, frame, index)
+            cost = time.perf_counter() - start
+            self.cost = cost if self.cost is None else 0.8 * self.cost + 0.2 * cost
+
+            if lf is None:
+                self.history = []
+                self.smooth_normalized.reset()
+                self.smooth_world.reset()
+                return None
+
+            self.history = (self.history + [(now, lf.normalized, lf.world)])[-2:]
+            self.skip = self._frames_to_skip()
+            normalized, world = lf.normalized, lf.world
+
+        normalized = self.smooth_normalized(now, normalized)
+        world = self.smooth_world(now, world)
+        return LandmarkFrame(normalized, world, frame_width, frame_height)
+
+    def _infer(self, backend, frame, index=None):
+        if self.inner is not None:
+            return self.inner.process(backend, frame, index)
+        return backend.process(frame, index)
+
+    def _frames_to_skip(self):
+        if self.target_fps is None:
+            return self.every - 1
+        # Skipping k frames spreads the cost of one inference over k + 1
+        # frames, on top of the rest of the loop.
+        budget = 1 / self.target_fps - self.other
+        if budget <= 0:
+            return self.max_skip
+        return min(self.max_skip, max(0, math.ceil(self.cost / budget) - 1))
+
+    def _extrapolate(self, now):
+        t1, normalized, world = self.history[-1]
+        if len(self.history) < 2:
+            return normalized, world
+        t0, normalized_0, world_0 = self.history[0]
+        # Do not extrapolate further than one inference interval.
+        s = min(1.0, (now - t1) / (t1 - t0)) if t1 > t0 else 0.0
+        predicted_normalized = normalized + s * (normalized - normalized_0)
+        predicted_world = world + s * (world - world_0)
+        predicted_normalized[:, 3] = normalized[:, 3]
+        predicted_world[:, 3] = world[:, 3]
+        return predicted_normalized, predicted_world
+
+    def _clock(self):
+        if self.fps:
+            return self.frames / self.fps
+        return time.perf_counter()
+
+
+def _alpha(dt, cutoff):
+    tau = 1 / (2 * math.pi * cutoff)
+    return 1 / (1 + tau / dt)
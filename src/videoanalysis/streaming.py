@@ -0,0 +1,346 @@
+"""
+Stream the analyzed frames to browsers, e.g. on the tablets of the coaches.
+
+`StreamServer` is a small HTTP server on an asyncio event loop in a
+background thread:
+
+- `/`: a page that shows the stream.
+- `/stream.mjpg`: the frames as MJPEG, which every browser shows in an
+  `<img>`.
+- `/ws`: the frames as binary WebSocket messages, one JPEG per message.
+- `/frame.jpg`: the latest frame.
+- `/stats`: the number of clients and the sent and dropped frames as JSON.
+
+The analysis only hands its frames to `publish`. An encoder thread encodes
+the newest of them once as JPEG, and all clients get the same bytes. Every
+client is sent the newest frame as soon as the previous one has left, so a
+slow client skips frames instead of building up a backlog. Nothing is
+encoded while nobody watches.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+# Defined by RFC 6455 for the handshake.
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Bytes the kernel may buffer per client, a few frames.
+send_buffer = 256 * 1024
+
+index_page = b"""<!DOCTYPE html>
+<html>
+<head><meta name="viewport" content="width=device-width, initial-scale=1"><title>videoanalysis</title></head>
+<body style="margin:0;background:#000"><img src="stream.mjpg" style="width:100%"></body>
+</html>
+"""
+
+
+class Client():
+    def __init__(self, kind, peer):
+        self.kind = kind
+        self.peer = peer
+        self.sent = 0
+        self.dropped = 0
+
+    def stats(self):
+        return {'kind': self.kind, 'peer': self.peer, 'sent': self.sent,
+                'dropped': self.dropped}
+
+
+class StreamServer():
+    """
+    :host: Address to listen on. The default only accepts connections from
+    this machine, use '0.0.0.0' for the other devices in the network.
+
+    :port: Port to listen on, 0 picks a free one. The actual port is in
+    `port` after `start`.
+
+    :quality: JPEG quality.
+
+    :width: Downscale wider frames to this width before encoding.
+    """
+    def __init__(self, host='127.0.0.1', port=8080, quality=80, width=None):
+        self.host = host
+        self.port = port
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.width = width
+        self.clients = set()
+        self.published = 0
+        self.encoded = 0
+
+        self.cond = threading.Condition()
+        self.pending = None
+        self.closed = False
+
+        # Only used on the event loop.
+        self.jpeg = None
+        self.seq = 0
+        self.new_frame = None
+
+        self.loop = None
+        self.server = None
+        self.error = None
+        self.threads = []
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/'
+
+    def start(self):
+        """
+        Start the event loop and the encoder thread. Returns the server.
+        """
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self.threads = [
+            threading.Thread(target=self._serve, args=(ready,), name='stream-server',
+                             daemon=True),
+            threading.Thread(target=self._encode, name='stream-encoder', daemon=True),
+        ]
+        self.threads[0].start()
+        ready.wait()
+        if self.error is not None:
+            self.threads[0].join()
+            raise self.error
+        self.threads[1].start()
+        return self
+
+    def publish(self, frame):
+        """
+        Hand a frame to the encoder. Never blocks, a frame that was not
+        encoded yet is replaced by the new one.
+        """
+        if not self.clients:
+            return
+        with self.cond:
+            self.pending = frame
+            self.published += 1
+            self.cond.notify()
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'published': self.published,
+            'encoded': self.encoded,
+            'clients': [client.stats() for client in list(self.clients)],
+        }
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _serve(self, ready):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+        except OSError as e:
+            self.error = e
+            ready.set()
+            self.loop.close()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.new_frame = asyncio.Event()
+        ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _shutdown(self):
+        self.server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def _encode(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                frame, self.pending = self.pending, None
+            if self.width is not None and frame.shape[1] > self.width:
+                height = round(frame.shape[0] * self.width / frame.shape[1])
+                frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+            ok, data = cv2.imencode('.jpg', frame, self.params)
+            if ok:
+                self.encoded += 1
+                self.loop.call_soon_threadsafe(self._broadcast, data.tobytes())
+
+    def _broadcast(self, jpeg):
+        self.jpeg = jpeg
+        self.seq += 1
+        # Wake up every client waiting for this frame, later ones wait for the
+        # next event.
+        self.new_frame.set()
+        self.new_frame = asyncio.Event()
+
+    async def _frames(self, client):
+        """
+        Yield the newest frame whenever there is one the client has not seen.
+        """
+        # A new client starts with the latest frame.
+        seq = self.seq - 1 if self.jpeg is not None else self.seq
+        while True:
+            if self.seq == seq:
+                await self.new_frame.wait()
+            if client.sent:
+                client.dropped += self.seq - seq - 1
+            seq = self.seq
+            yield self.jpeg
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        try:
+            method, path, _ = lines[0].split(' ', 2)
+        except ValueError:
+            method, path = None, None
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        path = (path or '').split('?')[0]
+        peer = '%s:%s' % writer.get_extra_info('peername')[:2]
+        # Keep the kernel from buffering many frames for a slow client, the
+        # client should rather skip them.
+        writer.get_extra_info('socket').setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+
+        try:
+            if method != 'GET':
+                self._respond(writer, '405 Method Not Allowed', 'text/plain', b'')
+            elif path == '/':
+                self._respond(writer, '200 OK', 'text/html', index_page)
+            elif path == '/stats':
+                self._respond(writer, '200 OK', 'application/json',
+                              json.dumps(self.stats()).encode())
+            elif path == '/frame.jpg' and self.jpeg is not None:
+                self._respond(writer, '200 OK', 'image/jpeg', self.jpeg)
+            elif path == '/stream.mjpg':
+                await self._stream_mjpeg(writer, Client('mjpeg', peer))
+            elif path == '/ws':
+                await self._stream_websocket(reader, writer, headers, Client('websocket', peer))
+            else:
+                self._respond(writer, '404 Not Found', 'text/plain', b'')
+            await writer.drain()
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # Cancelled by `close`. Python 3.11 reports handlers that end
+            # cancelled as unhandled exceptions, so the task ends normally.
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, writer, status, content_type, body):
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                     f'Content-Length: {len(body)}\r\nCache-Control: no-cache\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + body)
+
+    async def _stream_mjpeg(self, writer, client):
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n')
+        self.clients.add(client)
+        try:
+            async for jpeg in self._frames(client):
+                writer.write(b'--frame\r\nContent-Type: image/jpeg\r\n'
+                             b'Content-Length: %d\r\n\r\n' % len(jpeg) + jpeg + b'\r\n')
+                # While the frame is on its way, newer frames replace each
+                # other and are dropped for this client.
+                await writer.drain()
+                client.sent += 1
+        finally:
+            self.clients.discard(client)
+
+    async def _stream_websocket(self, reader, writer, headers, client):
+        key = headers.get('sec-websocket-key')
+        if key is None or headers.get('upgrade', '').lower() != 'websocket':
+            self._respond(writer, '400 Bad Request', 'text/plain', b'')
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                     b'Connection: Upgrade\r\nSec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+        self.clients.add(client)
+        sender = asyncio.current_task()
+        receiver = asyncio.ensure_future(self._receive_websocket(reader, writer, sender))
+        try:
+            async for jpeg in self._frames(client):
+                writer.write(websocket_frame(jpeg))
+                await writer.drain()
+                client.sent += 1
+        except asyncio.CancelledError:
+            # The client closed the connection.
+            if not receiver.done():
+                raise
+        finally:
+            self.clients.discard(client)
+            receiver.cancel()
+
+    async def _receive_websocket(self, reader, writer, sender):
+        """
+        Answer pings and stop the sender when the client closes the
+        connection. Messages of the client are ignored.
+        """
+        try:
+            while True:
+                head = await reader.readexactly(2)
+                opcode = head[0] & 0x0F
+                length = head[1] & 0x7F
+                if length == 126:
+                    length, = struct.unpack('!H', await reader.readexactly(2))
+                elif length == 127:
+                    length, = struct.unpack('!Q', await reader.readexactly(8))
+                if length > 1 << 20:
+                    break
+                mask = await reader.readexactly(4) if head[1] & 0x80 else bytes(4)
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(
+                    await reader.readexactly(length)))
+                if opcode == 0x8:
+                    writer.write(websocket_frame(payload[:2], 0x8))
+                    break
+                if opcode == 0x9:
+                    writer.write(websocket_frame(payload, 0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        sender.cancel()
+
+
+def websocket_frame(payload, opcode=0x2):
+    """
+    Return an unmasked, unfragmented WebSocket frame, binary by default.
+    """
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
@@ -0,0 +1,330 @@
+"""
+Time-shift: scrub back, replay in slow motion or loop a movement while the
+capture goes on.
+
+`TimeShiftStore` writes every frame together with its landmarks to disk. The
+store is split into segments of `segment_frames` frames, and every segment
+has two files:
+
+- `<n>.jpg`: the JPEG encoded frames, one after the other.
+- `<n>.idx.npy`: a memory-mapped array with one record per frame: offset
+  and size of the JPEG, timestamp and the landmarks.
+
+The frame with a given number is found without any search, and a timestamp
+with a binary search in one segment. Only the newest `max_segments` segments
+are kept, the oldest is deleted when a new one starts, so neither the memory
+nor the disk use grows with the length of the session.
+
+`TimeShiftPlayer` decides which stored frame is shown, and is controlled
+with the keys:
+
+- 'a' / 'd': one step back / forward.
+- space: pause.
+- 's': slow motion, 1/2 and 1/4 of the speed.
+- 'l': set the start of a loop, then its end, then remove it.
+- 'g': back to live.
+"""
+import bisect
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from .frames import LandmarkFrame, NUM_LANDMARKS
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+speeds = (1.0, 0.5, 0.25)
+
+
+def record_dtype():
+    return np.dtype([
+        ('offset', '<u8'),
+        ('size', '<u4'),
+        ('time', '<f8'),
+        ('pose', 'u1'),
+        ('landmarks', '<f4', (NUM_LANDMARKS, 4)),
+        ('world', '<f4', (NUM_LANDMARKS, 4)),
+    ])
+
+
+class Segment():
+    def __init__(self, directory, number, frames):
+        self.number = number
+        self.index_path = directory / f'{number:08d}.idx.npy'
+        self.data_path = directory / f'{number:08d}.jpg'
+        self.records = np.lib.format.open_memmap(self.index_path, mode='w+',
+                                                 dtype=record_dtype(), shape=(frames,))
+        self.file = open(self.data_path, 'w+b', buffering=0)
+        self.count = 0
+        self.size = 0
+
+    def append(self, data, timestamp, lf):
+        records, slot = self.records, self.count
+        records['offset'][slot] = self.size
+        records['size'][slot] = len(data)
+        records['time'][slot] = timestamp
+        if lf is not None:
+            records['pose'][slot] = 1
+            records['landmarks'][slot] = lf.normalized
+            records['world'][slot] = lf.world
+        self.file.seek(self.size)
+        self.file.write(data)
+        self.size += len(data)
+        self.count += 1
+
+    def read(self, slot):
+        record = self.records[slot].copy()
+        self.file.seek(int(record['offset']))
+        return self.file.read(int(record['size'])), record
+
+    def find(self, timestamp):
+        """
+        Return the slot of the last frame at or before `timestamp`.
+        """
+        times = self.records['time'][:self.count]
+        return max(int(np.searchsorted(times, timestamp, 'right')) - 1, 0)
+
+    def close(self):
+        # The mapping is released with the last reference to the array.
+        self.records = None
+        self.file.close()
+        os.remove(self.index_path)
+        os.remove(self.data_path)
+
+
+class TimeShiftStore():
+    """
+    :directory: Directory of the segment files. By default a temporary
+    directory that is removed by `close`.
+
+    :segment_frames: Frames per segment.
+
+    :max_segments: Number of segments that are kept. With the defaults and
+    30 fps the last 20 minutes are kept.
+
+    :quality: JPEG quality of the stored frames.
+
+    Frames are numbered from the start of the session on, also after the
+    oldest ones were deleted. Appending and reading may happen on different
+    threads.
+    """
+    def __init__(self, directory=None, segment_frames=300, max_segments=120,
+                 quality=85):
+        self.temporary = directory is None
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='videoanalysis-timeshift-')
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_frames = segment_frames
+        self.max_segments = max_segments
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.segments = deque()
+        self.frames = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.frames
+
+    @property
+    def first(self):
+        """
+        Number of the oldest frame that is still stored.
+        """
+        with self.lock:
+            if not self.segments:
+                return 0
+            return self.segments[0].number * self.segment_frames
+
+    def append(self, frame, lf=None, timestamp=None):
+        """
+        Store a frame and its `LandmarkFrame` (None without a pose). The
+        timestamp defaults to `time.perf_counter()`. Returns the number of
+        the frame.
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        ok, data = cv2.imencode('.jpg', frame, self.params)
+        if not ok:
+            raise ValueError("Could not encode the frame")
+        with self.lock:
+            if not self.segments or self.segments[-1].count == self.segment_frames:
+                if len(self.segments) == self.max_segments:
+                    self.segments.popleft().close()
+                self.segments.append(Segment(self.directory,
+                                             self.frames // self.segment_frames,
+                                             self.segment_frames))
+            self.segments[-1].append(data, timestamp, lf)
+            self.frames += 1
+            return self.frames - 1
+
+    def read(self, index):
+        """
+        Return the frame, its `LandmarkFrame` or None, and its timestamp.
+        Raises an IndexError if the frame is not stored (anymore).
+        """
+        with self.lock:
+            number, slot = divmod(index, self.segment_frames)
+            if (not self.segments or index >= self.frames
+                    or number < self.segments[0].number):
+                raise IndexError(f"Frame {index} is not stored")
+            data, record = self.segments[number - self.segments[0].number].read(slot)
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        lf = None
+        if record['pose']:
+            frame_height, frame_width = frame.shape[:2]
+            lf = LandmarkFrame(record['landmarks'], record['world'],
+                               frame_width, frame_height)
+        return frame, lf, float(record['time'])
+
+    def find(self, timestamp):
+        """
+        Return the number of the last stored frame at or before `timestamp`,
+        or the oldest stored frame if all are later.
+        """
+        with self.lock:
+            if not self.segments:
+                raise IndexError("The store is empty")
+            starts = [segment.records['time'][0] for segment in self.segments]
+            i = max(bisect.bisect_right(starts, timestamp) - 1, 0)
+            segment = self.segments[i]
+            return segment.number * self.segment_frames + segment.find(timestamp)
+
+    def time_range(self):
+        """
+        Return the timestamps of the oldest and the newest stored frame.
+        """
+        with self.lock:
+            if not self.segments:
+                return None
+            last = self.segments[-1]
+            return (float(self.segments[0].records['time'][0]),
+                    float(last.records['time'][last.count - 1]))
+
+    def close(self):
+        with self.lock:
+            while self.segments:
+                self.segments.popleft().close()
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class TimeShiftPlayer():
+    """
+    Plays the frames of a `TimeShiftStore` back while it grows.
+
+    :step: Seconds the keys 'a' and 'd' jump.
+
+    The position is a timestamp of the store. It advances with the wall
+    clock, times the speed, and returns to live once it reaches the newest
+    frame.
+    """
+    keys = frozenset(map(ord, 'adslg '))
+
+    def __init__(self, store, step=1.0):
+        self.store = store
+        self.step = step
+        self.live = True
+        self.position = None
+        self.speed = 1.0
+        self.paused = False
+        self.loop = None
+        self.loop_start = None
+        self.last = None
+
+    def handle_keys(self, key_code):
+        """
+        Returns True if the key belongs to the player.
+        """
+        if key_code not in self.keys:
+            return False
+        time_range = self.store.time_range()
+        if time_range is None:
+            return True
+        oldest, newest = time_range
+        if self.live:
+            self.position = newest
+
+        key = chr(key_code)
+        if key == 'a':
+            self.position = max(self.position - self.step, oldest)
+            self.live = False
+        elif key == 'd':
+            self.position = min(self.position + self.step, newest)
+        elif key == ' ':
+            self.paused = not self.paused
+            self.live = False
+        elif key == 's':
+            self.speed = speeds[(speeds.index(self.speed) + 1) % len(speeds)]
+            self.live = False
+        elif key == 'l':
+            if self.loop is not None:
+                self.loop = None
+            elif self.loop_start is None:
+                self.loop_start = self.position
+                self.live = False
+            else:
+                self.loop = tuple(sorted((self.loop_start, self.position)))
+                self.loop_start = None
+                self.position = self.loop[0]
+        elif key == 'g':
+            self.go_live()
+        self.last = time.perf_counter()
+        return True
+
+    def go_live(self):
+        self.live = True
+        self.paused = False
+        self.speed = 1.0
+        self.loop = None
+        self.loop_start = None
+
+    def current(self):
+        """
+        Return the number of the frame to show, or None when live.
+        """
+        if self.live:
+            return None
+        time_range = self.store.time_range()
+        if time_range is None:
+            return None
+        oldest, newest = time_range
+
+        now = time.perf_counter()
+        if not self.paused and self.last is not None:
+            self.position += (now - self.last) * self.speed
+        self.last = now
+
+        if self.loop is not None:
+            start, stop = self.loop
+            if start < oldest:
+                # The start of the loop was deleted meanwhile.
+                self.loop = None
+            elif self.position >= stop and stop > start:
+                self.position = start + (self.position - start) % (stop - start)
+        if self.loop is None and self.loop_start is None and self.position >= newest:
+            self.go_live()
+            return None
+        self.position = min(max(self.position, oldest), newest)
+        return self.store.find(self.position)
+
+    def label(self, timestamp):
+        """
+        Return the text shown on replayed frames.
+        """
+        _, newest = self.store.time_range()
+        text = f'REPLAY {timestamp - newest:+.1f}s'
+        if self.speed != 1.0:
+            text += f' x{self.speed:g}'
+        if self.paused:
+            text += ' PAUSED'
+        if self.loop is not None:
+            text += ' LOOP'
+        elif self.loop_start is not None:
+            text += ' LOOP START SET'
+        return text
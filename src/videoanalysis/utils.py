@@ -1,14 +1,9 @@
-import mediapipe as mp
 from math import sqrt
 
-mp_drawing = mp.solutions.drawing_utils
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
 
-def _get_pixel(lm, res, frame_width, frame_height):
-    lm_0 = res.pose_landmarks.landmark[lm]
-    return mp_drawing._normalized_to_pixel_coordinates(lm_0.x,
-                                                       lm_0.y,
-                                                       frame_width,
-                                                       frame_height)
 
 def _get_midpoint(px_0, px_1):
     return (
@@ -28,11 +23,15 @@ def _get_endpoints(px_0, px_1, length_1=3, length_2=1):
     Since the vector gets normalized, length_1 and length_2 can be estimated in
     pixels.
     """
-    direction = (px_1[0] - px_0[0], px_1[1] - px_0[1])
-    direction = _normalize(direction)
+    # Normalized inline instead of with `_normalize`, this runs on every frame.
+    dx = px_1[0] - px_0[0]
+    dy = px_1[1] - px_0[1]
+    magnitude = sqrt(dx * dx + dy * dy)
+    dx /= magnitude
+    dy /= magnitude
     return (
-        (int(px_1[0] + length_1 * direction[0]), int(px_1[1] + length_1 * direction[1])),
-        (int(px_0[0] - length_2 * direction[0]), int(px_0[1] - length_2 * direction[1]))
+        (int(px_1[0] + length_1 * dx), int(px_1[1] + length_1 * dy)),
+        (int(px_0[0] - length_2 * dx), int(px_0[1] - length_2 * dy))
         )
 
 
@@ -45,4 +44,43 @@ def _normalize(vec):
         return (vec[0] / magnitude, vec[1] / magnitude, vec[2] / magnitude)
 
 
+def _angles(v1, v2):
+    """
+    Calculate the angles in degrees between two arrays of 3d vectors along
+    their last axis.
+    """
+    v1 = v1 / np.linalg.norm(v1, axis=-1, keepdims=True)
+    v2 = v2 / np.linalg.norm(v2, axis=-1, keepdims=True)
+    dotp = np.clip(np.sum(v1 * v2, axis=-1), -1.0, 1.0)
+    return np.degrees(np.arccos(dotp))
+
+
+def _angles_into(v1, v2, out, scratch):
+    """
+    Like `_angles` for two (n, 3) arrays, but without temporary arrays.
+
+    :out: (n,) array the angles are written to, and returned.
+
+    :scratch: (2, n) array that is overwritten.
+    """
+    np.einsum('ij,ij->i', v1, v2, out=out)
+    np.einsum('ij,ij->i', v1, v1, out=scratch[0])
+    np.einsum('ij,ij->i', v2, v2, out=scratch[1])
+    np.multiply(scratch[0], scratch[1], out=scratch[0])
+    np.sqrt(scratch[0], out=scratch[0])
+    np.divide(out, scratch[0], out=out)
+    np.clip(out, -1.0, 1.0, out=out)
+    np.arccos(out, out=out)
+    return np.degrees(out, out=out)
+
 
+def _take_rows(landmarks, columns, out):
+    """
+    Copy the rows `columns` of a (33, 4) landmark array into `out`, whose
+    shape is that of `columns` plus (4,).
+    """
+    if landmarks.dtype != out.dtype:
+        out[...] = landmarks[columns]
+        return out
+    # With mode='raise' NumPy copies through a temporary array.
+    return np.take(landmarks, columns, axis=0, out=out, mode='clip')
@@ -0,0 +1,181 @@
+"""
+Writers for the analyzed video.
+
+All writers have the `write(frame)` and `release()` methods of
+`cv2.VideoWriter`, so they can be used interchangeably:
+
+- `OpenCVWriter`: `cv2.VideoWriter` with a selectable fourcc.
+- `FFmpegWriter`: pipes the raw frames to a local ffmpeg process, which
+  encodes them with multiple threads (e.g. H.264 instead of MJPG).
+- `NullWriter`: writes nothing, for runs where only analytics are needed.
+
+`BackgroundWriter` wraps any of them and encodes on a separate thread, fed by
+a bounded queue, so encoding does not block the analysis loop.
+"""
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+backends = ('opencv', 'ffmpeg', 'none')
+
+default_codecs = {
+    'opencv': 'MJPG',
+    'ffmpeg': 'libx264',
+}
+
+
+class OpenCVWriter():
+    def __init__(self, path, fps, size, codec='MJPG'):
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+        if not self.writer.isOpened():
+            raise IOError(f"Could not open {path} for writing with codec {codec}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FFmpegWriter():
+    """
+    :codec: Name of the ffmpeg encoder, e.g. 'libx264' or 'libx265'.
+
+    :threads: Number of encoder threads, 0 lets ffmpeg decide.
+
+    :crf: Quality of the x264/x265 encoders, lower is better.
+    """
+    def __init__(self, path, fps, size, codec='libx264', threads=0,
+                 preset='veryfast', crf=23):
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg was not found on the PATH")
+        self.size = size
+        command = [
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{size[0]}x{size[1]}', '-r', str(fps), '-i', '-',
+            '-c:v', codec, '-threads', str(threads), '-pix_fmt', 'yuv420p',
+        ]
+        if codec in ('libx264', 'libx265'):
+            command += ['-preset', preset, '-crf', str(crf)]
+        command.append(path)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} "
+                             f"does not match {self.size[0]}x{self.size[1]}")
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise IOError(f"ffmpeg exited with code {self.process.returncode}")
+
+
+class NullWriter():
+    def write(self, frame):
+        pass
+
+    def release(self):
+        pass
+
+
+class BackgroundWriter():
+    """
+    Hands the frames to `writer` on a background thread.
+
+    `write` blocks once `queue_size` frames are waiting. The time spent
+    waiting shows how much the encoder holds back the analysis, see `stats`.
+    The frames must not be changed after they were passed to `write`.
+    """
+    def __init__(self, writer, queue_size=32):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.frames = 0
+        self.blocked = 0
+        self.blocked_time = 0.0
+        self.max_depth = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='writer', daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(frame)
+            self.blocked += 1
+            self.blocked_time += time.perf_counter() - start
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def release(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.release()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'blocked': self.blocked,
+            'blocked_time': self.blocked_time,
+            'max_depth': self.max_depth,
+            'queue_size': self.queue.maxsize,
+        }
+
+    def _run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+            if self.error is not None:
+                # Keep draining, so `write` never blocks forever.
+                continue
+            try:
+                self.writer.write(frame)
+                self.frames += 1
+            except Exception as e:
+                self.error = e
+
+
+def open_video_writer(path, fps, size, backend='opencv', codec=None,
+                      threads=0, background=True, queue_size=32):
+    """
+    Create a writer for a video.
+
+    :backend: 'opencv', 'ffmpeg' or 'none' for no video output.
+
+    :codec: fourcc for OpenCV or encoder name for ffmpeg. Defaults to MJPG
+    and libx264.
+
+    :threads: Number of encoder threads of ffmpeg.
+
+    :background: Encode on a background thread.
+    """
+    if backend not in backends:
+        raise ValueError(f"Unknown writer backend {backend}, use one of {', '.join(backends)}")
+    if backend == 'none':
+        return NullWriter()
+
+    codec = codec or default_codecs[backend]
+    if backend == 'ffmpeg':
+        writer = FFmpegWriter(path, fps, size, codec=codec, threads=threads)
+    else:
+        writer = OpenCVWriter(path, fps, size, codec=codec)
+
+    if background:
+        writer = BackgroundWriter(writer, queue_size=queue_size)
+    return writer
@@ -1,23 +1,78 @@
 #!/usr/bin/env python
 
 from tkinter import *
+import base64
 import glob
 import os
 
+import cv2
+
 from videoanalysis import analyze
+from videoanalysis.jobs import JobQueue
+
+
+def refresh():
+    """
+    Show the progress of the jobs and the preview of the selected or running
+    job. Called every 100 ms from the Tk event loop.
+    """
+    if jobs.poll() or job_list.size() != len(jobs.jobs):
+        selection = job_list.curselection()
+        job_list.delete(0, END)
+        for job in jobs.jobs:
+            job_list.insert(END, job.describe())
+        for i in selection:
+            job_list.selection_set(i)
+
+    job = selected_job()
+    # Only a new progress report comes with a new preview frame.
+    key = None if job is None else (job.id, job.frames, job.state)
+    frame = None if key == preview.key else job.preview()
+    if frame is not None:
+        ok, png = cv2.imencode('.png', frame)
+        preview.image = PhotoImage(data=base64.b64encode(png.tobytes()))
+        preview.configure(image=preview.image)
+        preview.key = key
+    root.after(100, refresh)
+
+
+def selected_job():
+    selection = job_list.curselection()
+    if selection:
+        return jobs.jobs[selection[0]]
+    running = [job for job in jobs.jobs if job.state == 'running']
+    return running[0] if running else None
+
+
+def cancel():
+    job = selected_job()
+    if job is not None:
+        jobs.cancel(job)
+
+
+def close():
+    jobs.close()
+    root.destroy()
 
 
 if __name__ == "__main__":
+    # The analyses run in worker processes, so the window stays responsive
+    # and several videos can be queued.
+    jobs = JobQueue(workers=2)
     root = Tk()
+    root.protocol('WM_DELETE_WINDOW', close)
 
-    root.geometry('750x500')
+    root.geometry('1100x500')
     bottom_frame = Frame(root, width=500, height=50)
     bottom_frame.pack(side='bottom')
     btn_exit = Button(bottom_frame, text = 'Exit', bd = '5',
-                              command = root.destroy)
+                              command = close)
     btn_exit.pack(side='right')
+    btn_cancel = Button(bottom_frame, text = 'Cancel', bd = '5',
+                              command = cancel)
+    btn_cancel.pack(side='right')
     btn_analyze = Button(bottom_frame, text = 'Analyze', bd = '5',
-            command = lambda: analyze.analyze(v.get(), f.get(), webcam=w.get()))
+            command = lambda: jobs.submit(v.get(), f.get(), webcam=w.get()))
     btn_analyze.pack(side='left')
 
     ## Create part for video selection
@@ -46,5 +101,14 @@ if __name__ == "__main__":
         Radiobutton(filter_frame, text=filt, variable = f,
                 value=filt).pack(side=TOP, ipady=5)
 
+    ## Create part for the queued and running jobs
+    job_frame = Frame(root, width=400, height=800)
+    job_frame.pack(side='left', fill=BOTH, expand=True)
+    job_list = Listbox(job_frame, width=60, height=10, exportselection=False)
+    job_list.pack(side=TOP, fill=X)
+    preview = Label(job_frame)
+    preview.key = None
+    preview.pack(side=TOP, pady=10)
 
+    refresh()
     root.mainloop()
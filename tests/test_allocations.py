@@ -0,0 +1,38 @@
+import tracemalloc
+
+from videoanalysis.analyze import AnalysisSession
+
+from test_session import recorded_clip
+
+filters = ['straight_arms', 'box', 'setter', 'middle_axis', 'close', 'Handstand3']
+
+
+def test_steady_state_allocates_only_the_frame(tmp_path):
+    """
+    Once the loop is warm, a frame allocates little more than the decoded
+    image, and nothing is kept from one frame to the next.
+    """
+    frames, warmup = 150, 30
+    video, backend = recorded_clip(tmp_path, frames=frames, missing=())
+    session = AnalysisSession(video, filters, backend=backend,
+                              writer_options={'directory': str(tmp_path / 'analyzed'),
+                                              'background': False})
+    traced = {}
+
+    def progress(index, frame):
+        if index == warmup - 1:
+            traced['warm'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        elif index == frames - 1:
+            traced['end'] = tracemalloc.get_traced_memory()[0]
+            traced['frame'] = frame.nbytes
+
+    tracemalloc.start()
+    try:
+        session.run(display=False, progress=progress)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert (traced['end'] - traced['warm']) / (frames - warmup) <= 64
+    assert peak - traced['warm'] <= traced['frame'] + 16 * 1024
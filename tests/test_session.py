@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+
+from videoanalysis.analyze import AnalysisSession, output_path
+from videoanalysis.backends import ReplayBackend
+from videoanalysis.bench import canned_landmarks, synthetic_video
+
+
+def recorded_clip(tmp_path, frames=60, missing=range(10, 15)):
+    """
+    Return a synthetic clip and a `ReplayBackend` with its landmarks, without
+    a pose in the frames `missing`.
+    """
+    video = str(tmp_path / 'clip.avi')
+    synthetic_video(video, 320, 240, frames)
+    landmarks = canned_landmarks(frames)
+    status = np.ones(frames, bool)
+    status[list(missing)] = False
+    return video, ReplayBackend(landmarks, landmarks.copy(), status)
+
+
+def count_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = 0
+    while cap.grab():
+        frames += 1
+    cap.release()
+    return frames
+
+
+def test_replay_writes_the_frames_with_a_pose(tmp_path):
+    video, backend = recorded_clip(tmp_path)
+    directory = str(tmp_path / 'analyzed')
+    session = AnalysisSession(video, ['straight_arms'], backend=backend,
+                              writer_options={'directory': directory})
+    session.run(display=False)
+
+    assert count_frames(output_path(session.plan.name, 'clip.avi', directory)) == 55
+
+
+def test_replay_follows_the_frame_index(tmp_path):
+    video, backend = recorded_clip(tmp_path, missing=())
+    seen = []
+
+    class Recording(ReplayBackend):
+        def process(self, frame, index=None):
+            seen.append(index)
+            return super().process(frame, index)
+
+    backend = Recording(backend.landmarks, backend.world, backend.status)
+    session = AnalysisSession(video, ['straight_arms'], backend=backend,
+                              tracker_options={'infer_every': 3},
+                              writer_options={'backend': 'none'})
+    session.run(display=False)
+
+    assert seen == list(range(0, 60, 3))